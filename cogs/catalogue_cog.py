@@ -9,7 +9,7 @@ import uuid
 import re
 
 # Importation pour l'autocomplétion et la vérification de type
-from .manager_cog import ManagerCog
+from .manager_cog import ManagerCog, OutboundDispatcher
 
 # --- Vues et Modals pour l'Interaction avec le Catalogue ---
 
@@ -206,16 +206,15 @@ class ProductActionView(discord.ui.View):
         embed_staff.set_footer(text=f"ID de Transaction: {transaction_id}")
         
         # --- Persistance ---
-        async with self.manager.data_lock:
-            self.manager.pending_actions['transactions'][transaction_id] = {
-                "user_id": user.id,
-                "product_id": product['id'],
-                "option_name": option['name'] if option else None,
-                "credit_used": credit_used
-            }
-            await self.manager._save_json_data_async(self.manager.PENDING_ACTIONS_FILE, self.manager.pending_actions)
-
-        await staff_channel.send(embed=embed_staff, view=PaymentVerificationView(self.manager))
+        self.manager.pending_actions['transactions'][transaction_id] = {
+            "user_id": user.id,
+            "product_id": product['id'],
+            "option_name": option['name'] if option else None,
+            "credit_used": credit_used
+        }
+        self.manager.mark_dirty(self.manager.PENDING_ACTIONS_FILE, ("transactions", transaction_id), urgent=True)
+
+        self.manager.outbound.notify(staff_channel, OutboundDispatcher.STAFF, embed=embed_staff, view=PaymentVerificationView(self.manager))
         
         await interaction.followup.send("Les instructions de paiement vous ont été envoyées en message privé !", ephemeral=True)
 
@@ -335,7 +334,7 @@ class PaymentVerificationView(discord.ui.View):
         
         transaction_id = match.group(1)
 
-        async with self.manager.data_lock:
+        async with self.manager.locks.hold(pending=[f"transaction:{transaction_id}"]):
             transaction_data = self.manager.pending_actions["transactions"].get(transaction_id)
             if not transaction_data:
                 self.children[0].disabled = True
@@ -397,7 +396,7 @@ class PaymentVerificationView(discord.ui.View):
             await interaction.message.edit(embed=new_embed, view=self)
 
             del self.manager.pending_actions["transactions"][transaction_id]
-            await self.manager._save_json_data_async(self.manager.PENDING_ACTIONS_FILE, self.manager.pending_actions)
+            self.manager.mark_dirty(self.manager.PENDING_ACTIONS_FILE, ("transactions", transaction_id), urgent=True)
 
     @discord.ui.button(label="✅ Confirmer le Paiement", style=discord.ButtonStyle.success, custom_id="confirm_payment_button")
     async def confirm_payment_button(self, interaction: discord.Interaction, button: discord.ui.Button):
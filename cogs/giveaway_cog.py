@@ -1,6 +1,6 @@
 
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord import app_commands
 import json
 from datetime import datetime, timedelta, timezone
@@ -12,9 +12,24 @@ import re
 import aiofiles
 
 # Importation de ManagerCog pour l'autocomplétion
-from .manager_cog import ManagerCog
+from .manager_cog import ManagerCog, ExpiryScheduler, _durable_replace
 
 GIVEAWAYS_FILE = 'data/giveaways.json'
+# Participants figés des giveaways terminés (pour les relances de tirage)
+GIVEAWAY_SNAPSHOTS_FILE = 'data/giveaway_snapshots.json'
+MAX_SNAPSHOTS = 100
+# Délai de regroupement des sauvegardes déclenchées par les réactions
+ENTRANTS_SAVE_DELAY_SECONDS = 10
+GIVEAWAY_EMOJI = "🎉"
+# Politiques de pondération des participations (clé stockée -> libellé)
+WEIGHTING_POLICIES = {
+    "none": "Chances égales",
+    "level": "Pondéré par le niveau",
+    "vip": "Bonus VIP Premium",
+    "guild": "Bonus membres de guilde",
+}
+# Nombre maximal de giveaways clôturés en parallèle (appels Discord simultanés)
+MAX_CONCURRENT_ENDS = 4
 
 def parse_duration(duration_str: str) -> Optional[timedelta]:
     """Parses a duration string like '1d3h30m' into a timedelta object."""
@@ -31,12 +46,78 @@ def parse_duration(duration_str: str) -> Optional[timedelta]:
         return None
     return timedelta(**time_params)
 
+
+class AliasSampler:
+    """
+    Tirage pondéré par la méthode des alias (Vose) : construction en O(n), chaque tirage en O(1).
+    `sample_distinct` tire k éléments distincts par rejet des doublons ; si les doublons deviennent
+    trop fréquents (quelques poids écrasants), la table est reconstruite sans les éléments déjà tirés.
+    """
+
+    def __init__(self, weights: list[float]):
+        n = len(weights)
+        total = sum(weights)
+        self.size = n
+        self._prob = [0.0] * n
+        self._alias = [0] * n
+        if n == 0 or total <= 0:
+            return
+        scaled = [w * n / total for w in weights]
+        small = [i for i, w in enumerate(scaled) if w < 1.0]
+        large = [i for i, w in enumerate(scaled) if w >= 1.0]
+        while small and large:
+            s_idx, l_idx = small.pop(), large.pop()
+            self._prob[s_idx] = scaled[s_idx]
+            self._alias[s_idx] = l_idx
+            scaled[l_idx] -= 1.0 - scaled[s_idx]
+            (small if scaled[l_idx] < 1.0 else large).append(l_idx)
+        for i in small + large:
+            self._prob[i] = 1.0
+
+    def sample(self, rng: random.Random) -> int:
+        i = rng.randrange(self.size)
+        return i if rng.random() < self._prob[i] else self._alias[i]
+
+    @classmethod
+    def sample_distinct(cls, weights: list[float], k: int, rng: random.Random) -> list[int]:
+        """Indices de k éléments distincts (au plus le nombre d'éléments de poids non nul)."""
+        available = [i for i, w in enumerate(weights) if w > 0]
+        k = min(k, len(available))
+        chosen: list[int] = []
+        seen: set = set()
+        while len(chosen) < k:
+            remaining = [i for i in available if i not in seen]
+            sampler = cls([weights[i] for i in remaining])
+            rejects = 0
+            while len(chosen) < k and rejects <= 4 * k:
+                index = remaining[sampler.sample(rng)]
+                if index in seen:
+                    rejects += 1
+                    continue
+                seen.add(index)
+                chosen.append(index)
+        return chosen
+
+
 class GiveawayCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.manager: Optional[ManagerCog] = None
         self.active_giveaways = {}
         self.data_lock = asyncio.Lock()
+        # Échéances des giveaways actifs : la boucle dort jusqu'à la plus proche
+        self.scheduler = ExpiryScheduler()
+        self._scheduler_task: Optional[asyncio.Task] = None
+        self._end_semaphore = asyncio.Semaphore(MAX_CONCURRENT_ENDS)
+        self._ending: set = set()
+        # Participants suivis en direct via les événements de réaction (persistés avec le giveaway)
+        self.entrants: dict[str, set] = {}
+        self.snapshots = {}
+        self._save_scheduled = False
+        # Événements de réaction reçus pendant la relecture des participants d'un giveaway (rejoués ensuite)
+        self._reconciling: dict[str, list] = {}
+        # Références fortes vers les tâches lancées en arrière-plan (asyncio ne garde que des références faibles)
+        self._tasks: set = set()
 
     async def cog_load(self):
         self.manager = self.bot.get_cog('ManagerCog')
@@ -44,41 +125,151 @@ class GiveawayCog(commands.Cog):
             return print("ERREUR CRITIQUE: GiveawayCog n'a pas pu trouver le ManagerCog.")
         
         await self._load_giveaways()
-        self.check_giveaways.start()
-        print("✅ GiveawayCog chargé et tâche de vérification démarrée.")
+        self.entrants = {msg_id: set(data.get("entrants", [])) for msg_id, data in self.active_giveaways.items()}
+        self.scheduler.rebuild([
+            (datetime.fromisoformat(data["end_time"]).timestamp(), msg_id, "giveaway")
+            for msg_id, data in self.active_giveaways.items()
+        ])
+        self._scheduler_task = asyncio.create_task(self._giveaway_scheduler_loop())
+        print("✅ GiveawayCog chargé et planificateur des giveaways démarré.")
 
     def cog_unload(self):
-        self.check_giveaways.cancel()
+        if self._scheduler_task:
+            self._scheduler_task.cancel()
+        for task in list(self._tasks):
+            task.cancel()
         print("GiveawayCog déchargé.")
 
     async def _load_giveaways(self):
         async with self.data_lock:
-            if not os.path.exists(GIVEAWAYS_FILE):
-                self.active_giveaways = {}
-                return
-            try:
-                async with aiofiles.open(GIVEAWAYS_FILE, 'r', encoding='utf-8') as f:
-                    content = await f.read()
-                    self.active_giveaways = json.loads(content) if content else {}
-            except (json.JSONDecodeError, FileNotFoundError):
-                self.active_giveaways = {}
+            self.active_giveaways = await self._read_json(GIVEAWAYS_FILE)
+            self.snapshots = await self._read_json(GIVEAWAY_SNAPSHOTS_FILE)
 
-    async def _save_giveaways(self):
+    @staticmethod
+    async def _read_json(file_path: str) -> dict:
+        if not os.path.exists(file_path):
+            return {}
+        try:
+            async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
+                content = await f.read()
+                return json.loads(content) if content else {}
+        except (json.JSONDecodeError, FileNotFoundError):
+            return {}
+
+    async def _save_giveaways(self, snapshots: bool = False):
         async with self.data_lock:
+            # Les participants sont stockés sous forme de liste triée d'IDs
+            giveaways = {
+                msg_id: {**data, "entrants": sorted(self.entrants.get(msg_id, ()))}
+                for msg_id, data in self.active_giveaways.items()
+            }
+            targets = [(GIVEAWAYS_FILE, giveaways)]
+            if snapshots:
+                targets.append((GIVEAWAY_SNAPSHOTS_FILE, self.snapshots))
+            # Copie figée sur la boucle, d'un seul tenant : une relance ou une clôture de giveaway
+            # ne peut pas modifier les données pendant leur mise en forme dans l'exécuteur.
+            frozen = [(file_path, json.dumps(data)) for file_path, data in targets]
+            loop = asyncio.get_running_loop()
+            for file_path, snapshot in frozen:
+                try:
+                    json_string = await loop.run_in_executor(
+                        None, lambda: json.dumps(json.loads(snapshot), indent=2)
+                    )
+                    # Fichier temporaire puis remplacement atomique, comme pour les données du ManagerCog
+                    tmp_path = f"{file_path}.tmp"
+                    async with aiofiles.open(tmp_path, 'w', encoding='utf-8') as f:
+                        await f.write(json_string)
+                    await loop.run_in_executor(None, _durable_replace, tmp_path, file_path)
+                except Exception as e:
+                    print(f"Erreur lors de la sauvegarde de {file_path}: {e}")
+
+    def _schedule_entrants_save(self):
+        """Regroupe les sauvegardes déclenchées par les réactions (une écriture par fenêtre de quelques secondes)."""
+        if self._save_scheduled:
+            return
+        self._save_scheduled = True
+
+        async def delayed_save():
+            await asyncio.sleep(ENTRANTS_SAVE_DELAY_SECONDS)
+            self._save_scheduled = False
+            await self._save_giveaways()
+        self._spawn(delayed_save())
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    # --- Suivi des participants ---
+
+    def _is_entry_event(self, payload: discord.RawReactionActionEvent) -> bool:
+        return (
+            str(payload.message_id) in self.active_giveaways
+            and str(payload.message_id) not in self._ending
+            and str(payload.emoji) == GIVEAWAY_EMOJI
+            and payload.user_id != self.bot.user.id
+        )
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
+        if not self._is_entry_event(payload) or (payload.member and payload.member.bot):
+            return
+        msg_id = str(payload.message_id)
+        if msg_id in self._reconciling:
+            self._reconciling[msg_id].append((True, payload.user_id))
+        entrants = self.entrants.setdefault(msg_id, set())
+        if payload.user_id not in entrants:
+            entrants.add(payload.user_id)
+            self._schedule_entrants_save()
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
+        if not self._is_entry_event(payload):
+            return
+        msg_id = str(payload.message_id)
+        if msg_id in self._reconciling:
+            self._reconciling[msg_id].append((False, payload.user_id))
+        entrants = self.entrants.get(msg_id)
+        if entrants and payload.user_id in entrants:
+            entrants.discard(payload.user_id)
+            self._schedule_entrants_save()
+
+    async def _reconcile_entrants(self):
+        """
+        Au démarrage uniquement : les réactions ajoutées ou retirées pendant l'arrêt du bot n'ont pas été
+        reçues, la liste des participants de chaque giveaway actif est donc relue une fois depuis Discord.
+        """
+        for msg_id, data in list(self.active_giveaways.items()):
+            channel = self.bot.get_channel(data["channel_id"])
+            if not channel:
+                continue
+            # Les réactions reçues pendant la relecture sont notées puis rejouées sur la liste relue.
+            self._reconciling[msg_id] = []
             try:
-                loop = asyncio.get_running_loop()
-                json_string = await loop.run_in_executor(
-                    None, lambda: json.dumps(self.active_giveaways, indent=2)
-                )
-                async with aiofiles.open(GIVEAWAYS_FILE, 'w', encoding='utf-8') as f:
-                    await f.write(json_string)
-            except Exception as e:
-                print(f"Erreur lors de la sauvegarde de {GIVEAWAYS_FILE}: {e}")
+                giveaway_msg = await channel.fetch_message(int(msg_id))
+                reaction = discord.utils.get(giveaway_msg.reactions, emoji=GIVEAWAY_EMOJI)
+                fetched = {user.id async for user in reaction.users() if not user.bot} if reaction else set()
+                for added, user_id in self._reconciling[msg_id]:
+                    if added:
+                        fetched.add(user_id)
+                    else:
+                        fetched.discard(user_id)
+                if msg_id in self.active_giveaways:
+                    self.entrants[msg_id] = fetched
+            except (discord.NotFound, discord.Forbidden, discord.HTTPException) as e:
+                print(f"Impossible de resynchroniser les participants du giveaway {msg_id}: {e}")
+            finally:
+                del self._reconciling[msg_id]
+        if self.active_giveaways:
+            await self._save_giveaways()
+            print(f"Participants resynchronisés pour {len(self.active_giveaways)} giveaway(s) actif(s).")
 
     @app_commands.command(name="giveaway_start", description="[Admin] Lance un nouveau giveaway.")
-    @app_commands.describe(duree="Durée du giveaway (ex: 7d, 12h, 30m).", gagnants="Nombre de gagnants.", prix="Le prix à gagner.")
+    @app_commands.describe(duree="Durée du giveaway (ex: 7d, 12h, 30m).", gagnants="Nombre de gagnants.", prix="Le prix à gagner.", ponderation="Pondération des chances de gain (égales par défaut).")
+    @app_commands.choices(ponderation=[app_commands.Choice(name=label, value=key) for key, label in WEIGHTING_POLICIES.items()])
     @app_commands.default_permissions(administrator=True)
-    async def giveaway_start(self, interaction: discord.Interaction, duree: str, gagnants: app_commands.Range[int, 1, 25], prix: str):
+    async def giveaway_start(self, interaction: discord.Interaction, duree: str, gagnants: app_commands.Range[int, 1, 25], prix: str, ponderation: Optional[str] = None):
         if not self.manager:
             return await interaction.response.send_message("Erreur interne.", ephemeral=True)
             
@@ -104,11 +295,13 @@ class GiveawayCog(commands.Cog):
         )
         embed.add_field(name="Fin du giveaway", value=f"<t:{end_timestamp}:R> (<t:{end_timestamp}:F>)", inline=False)
         embed.add_field(name="Gagnants", value=str(gagnants), inline=True)
+        if ponderation and ponderation != "none":
+            embed.add_field(name="Tirage", value=WEIGHTING_POLICIES[ponderation], inline=True)
         embed.set_footer(text=f"Réagissez avec 🎉 pour participer !")
 
         try:
             giveaway_msg = await channel.send(embed=embed)
-            await giveaway_msg.add_reaction("🎉")
+            await giveaway_msg.add_reaction(GIVEAWAY_EMOJI)
         except discord.Forbidden:
             return await interaction.response.send_message(f"Je n'ai pas la permission d'envoyer des messages ou d'ajouter des réactions dans {channel.mention}.", ephemeral=True)
         
@@ -116,9 +309,13 @@ class GiveawayCog(commands.Cog):
             "end_time": end_time.isoformat(),
             "winner_count": gagnants,
             "prize": prix,
+            "weighting": ponderation or "none",
             "channel_id": channel.id,
             "guild_id": interaction.guild.id
         }
+        self.entrants[str(giveaway_msg.id)] = set()
+        # Réveille le planificateur si ce giveaway se termine avant tous les autres
+        self.scheduler.schedule(end_time.timestamp(), str(giveaway_msg.id), "giveaway")
         await self._save_giveaways()
 
         await interaction.response.send_message(f"Giveaway lancé dans {channel.mention} !", ephemeral=True)
@@ -129,9 +326,38 @@ class GiveawayCog(commands.Cog):
     async def giveaway_reroll(self, interaction: discord.Interaction, message_id: str):
         await interaction.response.defer(ephemeral=True)
 
+        # Tirage parmi les participants figés à la clôture : aucun appel à Discord pour les relire.
+        snapshot = self.snapshots.get(message_id.strip())
+        if not snapshot:
+            # Giveaway terminé avant l'introduction des snapshots (ou sorti de l'historique) : relecture des réactions
+            return await self._reroll_from_reactions(interaction, message_id)
+        if not snapshot["entrants"]:
+            return await interaction.followup.send("Personne n'a participé à ce giveaway.", ephemeral=True)
+
+        # Les gagnants déjà tirés ne sont pas retenus tant qu'il reste d'autres participants
+        weights = snapshot.get("weights") or [1.0] * len(snapshot["entrants"])
+        candidates = [(uid, w) for uid, w in zip(snapshot["entrants"], weights) if uid not in snapshot["winners"]]
+        candidates = candidates or list(zip(snapshot["entrants"], weights))
+        seed = random.SystemRandom().getrandbits(64)
+        index = AliasSampler.sample_distinct([w for _, w in candidates], 1, random.Random(seed))
+        if not index:
+            return await interaction.followup.send("Aucun participant n'a de chance de gain.", ephemeral=True)
+        winner_id = candidates[index[0]][0]
+        snapshot["winners"].append(winner_id)
+        snapshot.setdefault("rerolls", []).append({"seed": seed, "winner": winner_id})
+        await self._save_giveaways(snapshots=True)
+
+        channel = self.bot.get_channel(snapshot["channel_id"])
+        if not channel:
+            return await interaction.followup.send(f"Nouveau gagnant : <@{winner_id}> (salon du giveaway introuvable).", ephemeral=True)
+        await channel.send(f"🎉 Nouveau tirage ! Le nouveau gagnant est <@{winner_id}> ! Félicitations !")
+        await interaction.followup.send("Le nouveau gagnant a été tiré au sort.", ephemeral=True)
+
+    async def _reroll_from_reactions(self, interaction: discord.Interaction, message_id: str):
+        """Relance sans snapshot : les participants sont relus depuis les réactions du message, dans le salon courant."""
         try:
             msg_id_int = int(message_id)
-            channel = interaction.channel # Assume it's in the same channel, could be improved
+            channel = interaction.channel
             giveaway_msg = await channel.fetch_message(msg_id_int)
         except (ValueError, discord.NotFound, discord.Forbidden):
             return await interaction.followup.send("Impossible de trouver le message du giveaway. Assurez-vous d'utiliser la commande dans le bon canal avec un ID de message valide.", ephemeral=True)
@@ -139,7 +365,7 @@ class GiveawayCog(commands.Cog):
         if not giveaway_msg.embeds:
             return await interaction.followup.send("Ce message n'est pas un message de giveaway.", ephemeral=True)
 
-        reaction = discord.utils.get(giveaway_msg.reactions, emoji="🎉")
+        reaction = discord.utils.get(giveaway_msg.reactions, emoji=GIVEAWAY_EMOJI)
         if not reaction:
             return await interaction.followup.send("Aucune réaction de participation trouvée.", ephemeral=True)
 
@@ -148,36 +374,54 @@ class GiveawayCog(commands.Cog):
             return await interaction.followup.send("Personne n'a participé à ce giveaway.", ephemeral=True)
 
         winner = random.choice(users)
-        
         await giveaway_msg.channel.send(f"🎉 Nouveau tirage ! Le nouveau gagnant est {winner.mention} ! Félicitations !")
         await interaction.followup.send("Le nouveau gagnant a été tiré au sort.", ephemeral=True)
 
-    @tasks.loop(seconds=15)
-    async def check_giveaways(self):
-        now = datetime.now(timezone.utc)
-        ended_giveaways = []
-
-        # Create a copy of keys to avoid runtime dictionary size change errors
-        giveaway_ids = list(self.active_giveaways.keys())
-
-        for msg_id in giveaway_ids:
-            data = self.active_giveaways.get(msg_id)
-            if not data: continue
-            
-            end_time = datetime.fromisoformat(data["end_time"])
-            if now >= end_time:
-                ended_giveaways.append(msg_id)
-
-        if not ended_giveaways:
-            return
-
-        for msg_id in ended_giveaways:
-            await self.end_giveaway(msg_id)
-        
-        for msg_id in ended_giveaways:
+    def _entry_weights(self, policy: str, entrants: list[int]) -> Optional[list[float]]:
+        """Poids de chaque participant selon la politique du giveaway (None pour des chances égales)."""
+        if policy not in ("level", "vip", "guild") or not self.manager:
+            return None
+        weighting = self.manager.config.get("GIVEAWAY_CONFIG", {}).get("WEIGHTING", {})
+        now_ts = datetime.now(timezone.utc).timestamp()
+        weights = []
+        for user_id in entrants:
+            user_data = self.manager.user_data.get(str(user_id), {})
+            weight = 1.0
+            if policy == "level":
+                weight += weighting.get("LEVEL_BONUS_PER_LEVEL", 0.1) * max(user_data.get("level", 1) - 1, 0)
+            elif policy == "vip":
+                vip = user_data.get("vip_premium")
+                if vip and vip.get("end_timestamp", 0) > now_ts:
+                    weight = weighting.get("VIP_PREMIUM_MULTIPLIER", 2.0)
+            elif policy == "guild" and user_data.get("guild_id"):
+                weight = weighting.get("GUILD_MEMBER_MULTIPLIER", 1.5)
+            weights.append(round(weight, 4))
+        return weights
+
+    async def _giveaway_scheduler_loop(self):
+        """Dort jusqu'à la fin du prochain giveaway puis lance la clôture des giveaways arrivés à terme."""
+        await self.bot.wait_until_ready()
+        await self._reconcile_entrants()
+        while True:
+            await self.scheduler.wait()
+            now_ts = datetime.now(timezone.utc).timestamp()
+            for _, msg_id, _ in self.scheduler.pop_due(now_ts):
+                if msg_id in self.active_giveaways and msg_id not in self._ending:
+                    self._ending.add(msg_id)
+                    self._spawn(self._finish_giveaway(msg_id))
+
+    async def _finish_giveaway(self, msg_id: str):
+        """Clôture un giveaway (au plus `MAX_CONCURRENT_ENDS` à la fois) puis le retire des giveaways actifs."""
+        try:
+            async with self._end_semaphore:
+                await self.end_giveaway(msg_id)
+        except Exception as e:
+            print(f"Erreur lors de la clôture du giveaway {msg_id}: {e}")
+        finally:
             self.active_giveaways.pop(msg_id, None)
-        
-        await self._save_giveaways()
+            self.entrants.pop(msg_id, None)
+            self._ending.discard(msg_id)
+            await self._save_giveaways(snapshots=True)
 
     async def end_giveaway(self, msg_id: str):
         data = self.active_giveaways.get(msg_id)
@@ -189,47 +433,51 @@ class GiveawayCog(commands.Cog):
         channel = guild.get_channel(data["channel_id"])
         if not channel: return
 
-        try:
-            giveaway_msg = await channel.fetch_message(int(msg_id))
-        except (discord.NotFound, discord.Forbidden):
-            return
-
-        reaction = discord.utils.get(giveaway_msg.reactions, emoji="🎉")
-        users = [user async for user in reaction.users() if not user.bot]
+        # Participants suivis en direct : le tirage ne relit pas les réactions.
+        # La graine et les poids sont conservés avec le snapshot pour pouvoir rejouer et vérifier le tirage.
+        entrants = sorted(self.entrants.get(msg_id, ()))
+        policy = data.get("weighting", "none")
+        weights = self._entry_weights(policy, entrants)
+        seed = random.SystemRandom().getrandbits(64)
+        rng = random.Random(seed)
+        if weights is None:
+            winner_ids = rng.sample(entrants, min(data["winner_count"], len(entrants)))
+        else:
+            winner_ids = [entrants[i] for i in AliasSampler.sample_distinct(weights, data["winner_count"], rng)]
+        self.snapshots[msg_id] = {
+            "prize": data["prize"], "channel_id": data["channel_id"], "guild_id": data["guild_id"],
+            "ended_at": datetime.now(timezone.utc).isoformat(), "entrants": entrants, "winners": list(winner_ids),
+            "policy": policy, "seed": seed, "weights": weights
+        }
+        for old_id in list(self.snapshots)[:-MAX_SNAPSHOTS]:
+            del self.snapshots[old_id]
 
-        if not users:
+        if not winner_ids:
             winners_text = "Personne n'a participé... 😢"
             await channel.send(f"Le giveaway pour **{data['prize']}** est terminé. {winners_text}")
         else:
-            winner_count = min(data["winner_count"], len(users))
-            winners = random.sample(users, winner_count)
-            winners_mention = ", ".join([w.mention for w in winners])
+            winners_mention = ", ".join(f"<@{uid}>" for uid in winner_ids)
             winners_text = f"Félicitations à {winners_mention} ! Vous avez gagné **{data['prize']}** !"
             await channel.send(winners_text)
 
-        # Edit original message
-        new_embed = giveaway_msg.embeds[0].copy()
-        new_embed.title = "🎉 GIVEAWAY TERMINÉ 🎉"
-        new_embed.description = f"**Prix :** {data['prize']}"
-        new_embed.color = discord.Color.dark_grey()
-        if users and 'winners' in locals():
-            new_embed.add_field(name="Gagnant(s)", value=", ".join([w.display_name for w in winners]), inline=False)
+        # Edit original message (reconstruit à partir des données : pas besoin de relire le message)
+        new_embed = discord.Embed(
+            title="🎉 GIVEAWAY TERMINÉ 🎉",
+            description=f"**Prix :** {data['prize']}",
+            color=discord.Color.dark_grey()
+        )
+        new_embed.add_field(name="Gagnants", value=str(data["winner_count"]), inline=True)
+        if winner_ids:
+            names = [(guild.get_member(uid).display_name if guild.get_member(uid) else f"<@{uid}>") for uid in winner_ids]
+            new_embed.add_field(name="Gagnant(s)", value=", ".join(names), inline=False)
         else:
             new_embed.add_field(name="Gagnant(s)", value="Aucun participant.", inline=False)
-        
-        field_to_remove_index = -1
-        for i, field in enumerate(new_embed.fields):
-            if "Fin du giveaway" in field.name:
-                field_to_remove_index = i
-                break
-        if field_to_remove_index != -1:
-            new_embed.remove_field(field_to_remove_index)
-            
-        await giveaway_msg.edit(embed=new_embed, view=None)
+        new_embed.set_footer(text=f"{len(entrants)} participant(s)")
 
-    @check_giveaways.before_loop
-    async def before_check_giveaways(self):
-        await self.bot.wait_until_ready()
+        try:
+            await channel.get_partial_message(int(msg_id)).edit(embed=new_embed, view=None)
+        except (discord.NotFound, discord.Forbidden):
+            pass
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(GiveawayCog(bot))
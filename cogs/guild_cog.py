@@ -12,7 +12,7 @@ from typing import List, Dict, Any, Optional
 import aiofiles
 import re
 
-from .manager_cog import ManagerCog
+from .manager_cog import ManagerCog, OutboundDispatcher
 
 # --- Modals & Views ---
 
@@ -61,28 +61,31 @@ class ForceOfficialView(discord.ui.View):
         guild_id = self.guild_id
         user_id_str = str(interaction.user.id)
         
-        guild_data = self.manager.guild_data.get(guild_id)
-        if not guild_data or guild_data["owner_id"] != user_id_str:
-            return await interaction.followup.send("Vous n'êtes pas autorisé à faire cela.", ephemeral=True)
+        async with self.manager.locks.hold(guilds=[guild_id], users=[user_id_str]):
+            guild_data = self.manager.guild_data.get(guild_id)
+            if not guild_data or guild_data["owner_id"] != user_id_str:
+                return await interaction.followup.send("Vous n'êtes pas autorisé à faire cela.", ephemeral=True)
         
-        if guild_data.get("status") == "official":
-            return await interaction.followup.send("Votre guilde est déjà officielle !", ephemeral=True)
+            if guild_data.get("status") == "official":
+                return await interaction.followup.send("Votre guilde est déjà officielle !", ephemeral=True)
 
-        guild_config = self.manager.config["GAMIFICATION_CONFIG"]["GUILD_SYSTEM"]
-        cost = guild_config.get("FORCE_OFFICIAL_COST", 3)
-        user_credit = self.manager.user_data[user_id_str].get("store_credit", 0)
+            guild_config = self.manager.config["GAMIFICATION_CONFIG"]["GUILD_SYSTEM"]
+            cost = guild_config.get("FORCE_OFFICIAL_COST", 3)
+            user_credit = self.manager.user_data[user_id_str].get("store_credit", 0)
 
-        if user_credit < cost:
-            return await interaction.followup.send(f"Vous n'avez pas assez de crédits. Il vous faut {cost} crédits.", ephemeral=True)
+            if user_credit < cost:
+                return await interaction.followup.send(f"Vous n'avez pas assez de crédits. Il vous faut {cost} crédits.", ephemeral=True)
 
-        await self.manager.add_transaction(user_id_str, "store_credit", -cost, f"Officialisation de la guilde {guild_data['name']}")
-        
-        guild_data["status"] = "official"
-        await self.manager.announce_guild_official(interaction.guild, guild_data)
+            await self.manager.add_transaction(user_id_str, "store_credit", -cost, f"Officialisation de la guilde {guild_data['name']}")
         
-        await self.manager._save_json_data_async(self.manager.GUILD_DATA_FILE, self.manager.guild_data)
-        await self.manager._save_json_data_async(self.manager.USER_DATA_FILE, self.manager.user_data)
+            guild_data["status"] = "official"
+            self.manager.guild_index.update_xp(guild_id, guild_data)
         
+            self.manager.mark_dirty(self.manager.GUILD_DATA_FILE, guild_id)
+            self.manager.mark_dirty(self.manager.USER_DATA_FILE, user_id_str)
+
+        # Appels Discord hors verrou
+        await self.manager.announce_guild_official(interaction.guild, guild_data)
         await interaction.followup.send(f"Votre guilde est maintenant officielle ! {cost} crédits ont été déduits.", ephemeral=True)
         button.disabled = True
         self.children[1].disabled = True
@@ -102,6 +105,8 @@ class GuildCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.manager: Optional[ManagerCog] = None
+        # Membres dont la guilde est en cours de création (rôle et canal pas encore créés)
+        self._creating: set = set()
 
     async def cog_load(self):
         self.manager = self.bot.get_cog('ManagerCog')
@@ -139,18 +144,37 @@ class GuildCog(commands.Cog):
         guild_config = self.manager.config["GAMIFICATION_CONFIG"]["GUILD_SYSTEM"]
         user_id_str = str(interaction.user.id)
         
-        # Validation du nom et de la couleur
-        if any(g['name'].lower() == nom.lower() for g in self.manager.guild_data.values()):
-            return await interaction.followup.send("Une guilde avec ce nom existe déjà.", ephemeral=True)
-        
         if not re.match(r'^#(?:[0-9a-fA-F]{3}){1,2}$', couleur_hex):
             return await interaction.followup.send("Le format de la couleur est invalide. Utilisez un code hexadécimal (ex: #FF5733).", ephemeral=True)
-        
+
+        # Sous verrou, le temps de vérifier, débiter et réserver le nom : deux créations simultanées ne peuvent pas
+        # prendre le même, et une modale soumise deux fois ne débite pas deux fois le membre.
+        # Les appels Discord (rôle, canal) sont faits ensuite, hors verrou.
+        guild_id = str(uuid.uuid4())
         cost = guild_config.get("CREATION_COST", 5)
-        
-        # Déduction des crédits
-        await self.manager.add_transaction(user_id_str, "store_credit", -cost, f"Création de la guilde {nom}")
-        
+        async with self.manager.locks.hold(guilds=[f"name:{nom.casefold()}"], users=[user_id_str]):
+            # Appartenance et crédits ont été vérifiés avant d'ouvrir la modale ;
+            # on les revérifie ici car ils ont pu changer pendant que la modale était ouverte.
+            user_data = self.manager.user_data[user_id_str]
+            if user_data.get("guild_id") or user_id_str in self._creating:
+                return await interaction.followup.send("Vous faites déjà partie d'une guilde.", ephemeral=True)
+            if not self.manager.guild_index.reserve(nom, guild_id):
+                return await interaction.followup.send("Une guilde avec ce nom existe déjà.", ephemeral=True)
+            if user_data.get("store_credit", 0) < cost:
+                self.manager.guild_index.release(nom, guild_id)
+                return await interaction.followup.send(f"Il vous faut {cost} crédits pour fonder une guilde.", ephemeral=True)
+        
+            # Déduction des crédits
+            await self.manager.add_transaction(user_id_str, "store_credit", -cost, f"Création de la guilde {nom}")
+            self._creating.add(user_id_str)
+
+        async def abort(message: str):
+            async with self.manager.locks.hold(guilds=[f"name:{nom.casefold()}"], users=[user_id_str]):
+                self.manager.guild_index.release(nom, guild_id)
+                self._creating.discard(user_id_str)
+                await self.manager.add_transaction(user_id_str, "store_credit", cost, f"Remboursement création guilde {nom} échouée")
+            await interaction.followup.send(message, ephemeral=True)
+
         # Création du rôle
         try:
             guild_role = await interaction.guild.create_role(
@@ -162,14 +186,14 @@ class GuildCog(commands.Cog):
             )
             await interaction.user.add_roles(guild_role)
         except Exception as e:
-            await self.manager.add_transaction(user_id_str, "store_credit", cost, f"Remboursement création guilde {nom} échouée")
-            return await interaction.followup.send(f"Erreur lors de la création du rôle de guilde : {e}", ephemeral=True)
-            
+            return await abort(f"Erreur lors de la création du rôle de guilde : {e}")
+        
         # Création du canal
         category_name = self.manager.config["CHANNELS"].get("GUILD_PRIVATE_CATEGORY")
         category = discord.utils.get(interaction.guild.categories, name=category_name)
         if not category:
-            return await interaction.followup.send(f"La catégorie '{category_name}' pour les guildes est introuvable.", ephemeral=True)
+            await guild_role.delete()
+            return await abort(f"La catégorie '{category_name}' pour les guildes est introuvable.")
         
         overwrites = {
             interaction.guild.default_role: discord.PermissionOverwrite(view_channel=False),
@@ -181,24 +205,25 @@ class GuildCog(commands.Cog):
             guild_channel = await category.create_text_channel(name=channel_name, overwrites=overwrites, reason=f"Création de la guilde {nom}")
         except Exception as e:
             await guild_role.delete()
-            await self.manager.add_transaction(user_id_str, "store_credit", cost, f"Remboursement création guilde {nom} échouée")
-            return await interaction.followup.send(f"Erreur lors de la création du canal de guilde : {e}", ephemeral=True)
+            return await abort(f"Erreur lors de la création du canal de guilde : {e}")
 
         # Enregistrement des données
-        guild_id = str(uuid.uuid4())
-        async with self.manager.data_lock:
+        async with self.manager.locks.hold(guilds=[guild_id], users=[user_id_str]):
             self.manager.guild_data[guild_id] = {
                 "id": guild_id, "name": nom, "owner_id": user_id_str,
                 "members": [user_id_str], "status": "pending",
                 "created_at": datetime.now(timezone.utc).isoformat(),
                 "total_xp": self.manager.user_data[user_id_str].get("xp", 0),
-                "weekly_xp": self.manager.user_data[user_id_str].get("weekly_xp", 0),
+                "weekly_xp": self.manager.weekly_value(self.manager.user_data[user_id_str], "weekly_xp"),
+                "weekly_epoch": self.manager.current_week(),
                 "role_id": guild_role.id, "channel_id": guild_channel.id
             }
+            self.manager.guild_index.add(guild_id, self.manager.guild_data[guild_id])
             self.manager.user_data[user_id_str]["guild_id"] = guild_id
+            self._creating.discard(user_id_str)
 
-            await self.manager._save_json_data_async(self.manager.GUILD_DATA_FILE, self.manager.guild_data)
-            await self.manager._save_json_data_async(self.manager.USER_DATA_FILE, self.manager.user_data)
+            self.manager.mark_dirty(self.manager.GUILD_DATA_FILE, guild_id)
+            self.manager.mark_dirty(self.manager.USER_DATA_FILE, user_id_str)
         
         force_official_cost = guild_config.get('FORCE_OFFICIAL_COST', 3)
         view = ForceOfficialView(self.manager, guild_id)
@@ -231,7 +256,7 @@ class GuildCog(commands.Cog):
              return await interaction.followup.send(f"{membre.display_name} est déjà dans une guilde.", ephemeral=True)
 
         max_members = self.manager.config["GAMIFICATION_CONFIG"]["GUILD_SYSTEM"].get("MAX_MEMBERS", 10)
-        if len(guild_data["members"]) >= max_members:
+        if self.manager.guild_index.member_count(guild_id) >= max_members:
             return await interaction.followup.send("Votre guilde a atteint le nombre maximum de membres.", ephemeral=True)
 
         view = GuildInviteView(self.manager, guild_id, interaction.user, membre)
@@ -251,38 +276,45 @@ class GuildCog(commands.Cog):
         if not guild_id or guild_id not in self.manager.guild_data:
             return await interaction.followup.send("Vous n'êtes pas dans une guilde.", ephemeral=True)
         
-        guild_data = self.manager.guild_data[guild_id]
-        guild_name = guild_data['name']
-        
-        guild_role = interaction.guild.get_role(guild_data['role_id'])
-        if guild_role and guild_role in interaction.user.roles:
-            await interaction.user.remove_roles(guild_role)
+        # Données modifiées sous verrou ; rôles, canal et annonce sont traités après l'avoir relâché.
+        async with self.manager.locks.hold(guilds=[guild_id], users=[user_id_str]):
+            guild_data = self.manager.guild_data.get(guild_id)
+            if not guild_data or user_data.get("guild_id") != guild_id:
+                return await interaction.followup.send("Vous n'êtes pas dans une guilde.", ephemeral=True)
+            guild_name = guild_data['name']
+            dissolved = guild_data["owner_id"] == user_id_str
 
-        async with self.manager.data_lock:
-            if guild_data["owner_id"] == user_id_str:
-                announcement_channel_name = self.manager.config["CHANNELS"].get("GUILD_ANNOUNCEMENTS")
-                announcement_channel = discord.utils.get(interaction.guild.text_channels, name=announcement_channel_name)
-                if announcement_channel:
-                    await announcement_channel.send(f"⚔️ La guilde **{guild_name}** a été dissoute car son chef, {interaction.user.mention}, est parti.")
-
-                # Supprimer rôle et canal
-                if guild_role: await guild_role.delete(reason=f"Guilde {guild_name} dissoute")
-                guild_channel = interaction.guild.get_channel(guild_data['channel_id'])
-                if guild_channel: await guild_channel.delete(reason=f"Guilde {guild_name} dissoute")
-                
+            if dissolved:
                 # Retirer la guilde pour tous les membres
                 for member_id in guild_data["members"]:
                     if member_id in self.manager.user_data:
                         self.manager.user_data[member_id]["guild_id"] = None
+                self.manager.mark_dirty(self.manager.USER_DATA_FILE, *guild_data["members"])
+                self.manager.guild_index.remove(guild_id, guild_data)
                 del self.manager.guild_data[guild_id]
                 message = f"Vous avez dissous la guilde **{guild_name}**."
             else:
-                guild_data["members"].remove(user_id_str)
+                self.manager.guild_index.remove_member(guild_id, guild_data, user_id_str)
                 user_data["guild_id"] = None
                 message = f"Vous avez quitté la guilde **{guild_name}**."
             
-            await self.manager._save_json_data_async(self.manager.GUILD_DATA_FILE, self.manager.guild_data)
-            await self.manager._save_json_data_async(self.manager.USER_DATA_FILE, self.manager.user_data)
+            self.manager.mark_dirty(self.manager.GUILD_DATA_FILE, guild_id)
+            self.manager.mark_dirty(self.manager.USER_DATA_FILE, user_id_str)
+
+        guild_role = interaction.guild.get_role(guild_data['role_id'])
+        if guild_role and guild_role in interaction.user.roles:
+            await interaction.user.remove_roles(guild_role)
+
+        if dissolved:
+            announcement_channel_name = self.manager.config["CHANNELS"].get("GUILD_ANNOUNCEMENTS")
+            announcement_channel = discord.utils.get(interaction.guild.text_channels, name=announcement_channel_name)
+            if announcement_channel:
+                await announcement_channel.send(f"⚔️ La guilde **{guild_name}** a été dissoute car son chef, {interaction.user.mention}, est parti.")
+
+            # Supprimer rôle et canal
+            if guild_role: await guild_role.delete(reason=f"Guilde {guild_name} dissoute")
+            guild_channel = interaction.guild.get_channel(guild_data['channel_id'])
+            if guild_channel: await guild_channel.delete(reason=f"Guilde {guild_name} dissoute")
             
         guild_master_role = discord.utils.get(interaction.guild.roles, name=self.manager.config["ROLES"].get("GUILD_MASTER"))
         if guild_master_role and guild_master_role in interaction.user.roles:
@@ -305,26 +337,32 @@ class GuildCog(commands.Cog):
         if guild_data["owner_id"] != user_id_str:
             return await interaction.followup.send("Seul le chef de guilde peut la renommer.", ephemeral=True)
         
-        cost = self.manager.config["GAMIFICATION_CONFIG"]["GUILD_SYSTEM"].get("NAME_CHANGE_COST", 4)
-        if user_data.get("store_credit", 0) < cost:
-            return await interaction.followup.send(f"Il vous faut {cost} crédits pour renommer votre guilde.", ephemeral=True)
+        async with self.manager.locks.hold(guilds=[guild_id, f"name:{nouveau_nom.casefold()}"], users=[user_id_str]):
+            cost = self.manager.config["GAMIFICATION_CONFIG"]["GUILD_SYSTEM"].get("NAME_CHANGE_COST", 4)
+            if user_data.get("store_credit", 0) < cost:
+                return await interaction.followup.send(f"Il vous faut {cost} crédits pour renommer votre guilde.", ephemeral=True)
         
-        if any(g['name'].lower() == nouveau_nom.lower() for g in self.manager.guild_data.values()):
-            return await interaction.followup.send("Une guilde avec ce nom existe déjà.", ephemeral=True)
+            if self.manager.guild_index.name_taken(nouveau_nom):
+                return await interaction.followup.send("Une guilde avec ce nom existe déjà.", ephemeral=True)
 
-        await self.manager.add_transaction(user_id_str, "store_credit", -cost, f"Renommage de la guilde {guild_data['name']}")
-        
-        old_name = guild_data['name']
-        guild_data['name'] = nouveau_nom
-        
-        role = interaction.guild.get_role(guild_data['role_id'])
-        if role: await role.edit(name=nouveau_nom)
+            await self.manager.add_transaction(user_id_str, "store_credit", -cost, f"Renommage de la guilde {guild_data['name']}")
         
-        channel = interaction.guild.get_channel(guild_data['channel_id'])
-        if channel: await channel.edit(name=f"🛡️-{nouveau_nom.lower().replace(' ', '-')}")
+            old_name = guild_data['name']
+            guild_data['name'] = nouveau_nom
+            self.manager.guild_index.rename(guild_id, old_name, nouveau_nom)
         
-        await self.manager._save_json_data_async(self.manager.GUILD_DATA_FILE, self.manager.guild_data)
-        await self.manager._save_json_data_async(self.manager.USER_DATA_FILE, self.manager.user_data)
+            self.manager.mark_dirty(self.manager.GUILD_DATA_FILE, guild_id)
+            self.manager.mark_dirty(self.manager.USER_DATA_FILE, user_id_str)
+
+        # Hors verrou : Discord limite les renommages de canal (2 par 10 minutes), l'appel peut attendre longtemps.
+        # Un renommage plus récent arrivé entre-temps l'emporte.
+        try:
+            role = interaction.guild.get_role(guild_data['role_id'])
+            if role and guild_data['name'] == nouveau_nom: await role.edit(name=nouveau_nom)
+            channel = interaction.guild.get_channel(guild_data['channel_id'])
+            if channel and guild_data['name'] == nouveau_nom: await channel.edit(name=f"🛡️-{nouveau_nom.lower().replace(' ', '-')}")
+        except discord.HTTPException as e:
+            print(f"Impossible de renommer le rôle ou le canal de la guilde {nouveau_nom}: {e}")
         
         await interaction.followup.send(f"Votre guilde a été renommée de '{old_name}' à '{nouveau_nom}' pour {cost} crédits.", ephemeral=True)
 
@@ -333,15 +371,16 @@ class GuildCog(commands.Cog):
     async def classement_guildes(self, interaction: discord.Interaction):
         await interaction.response.defer()
         
-        official_guilds = [g for g in self.manager.guild_data.values() if g.get('status') == 'official']
-        sorted_guilds = sorted(official_guilds, key=lambda g: g.get('total_xp', 0), reverse=True)
+        # Classement maintenu au fil des gains d'XP : seul le top 15 est parcouru.
+        guild_index = self.manager.guild_index
 
         embed = discord.Embed(title="🏆 Classement des Guildes Officielles 🏆", color=discord.Color.from_rgb(153, 45, 34))
         
         leaderboard_text = ""
-        for i, guild_data in enumerate(sorted_guilds[:15]):
+        for i, (guild_id, total_xp) in enumerate(guild_index.ranking.top(15)):
             rank = i + 1
-            leaderboard_text += f"`#{rank: <3}` **{guild_data['name']}** - {int(guild_data.get('total_xp', 0))} XP ({len(guild_data['members'])} membres)\n"
+            guild_data = self.manager.guild_data[guild_id]
+            leaderboard_text += f"`#{rank: <3}` **{guild_data['name']}** - {int(total_xp)} XP ({guild_index.member_count(guild_id)} membres)\n"
         
         if not leaderboard_text:
             leaderboard_text = "Aucune guilde officielle n'est encore classée. Fondez la vôtre avec `/guilde fonder` et recrutez des membres !"
@@ -377,11 +416,11 @@ class GuildInviteView(discord.ui.View):
         self.manager.initialize_user_data(user_id_str)
         user_data = self.manager.user_data[user_id_str]
 
-        if user_data.get("guild_id"):
-            await interaction.edit_original_response(content="Vous avez déjà rejoint une guilde.", view=None)
-            return
-            
-        async with self.manager.data_lock:
+        async with self.manager.locks.hold(guilds=[self.guild_id], users=[user_id_str]):
+            if user_data.get("guild_id"):
+                await interaction.edit_original_response(content="Vous avez déjà rejoint une guilde.", view=None)
+                return
+
             guild_data = self.manager.guild_data.get(self.guild_id)
             if not guild_data:
                 await interaction.edit_original_response(content="Cette guilde n'existe plus.", view=None)
@@ -389,26 +428,29 @@ class GuildInviteView(discord.ui.View):
 
             guild_config = self.manager.config.get("GAMIFICATION_CONFIG", {}).get("GUILD_SYSTEM", {})
             max_members = guild_config.get("MAX_MEMBERS", 10)
-            if len(guild_data["members"]) >= max_members:
+            if self.manager.guild_index.member_count(self.guild_id) >= max_members:
                 await interaction.edit_original_response(content="Cette guilde est pleine.", view=None)
                 return
 
-            guild_data["members"].append(user_id_str)
+            self.manager.guild_index.add_member(self.guild_id, guild_data, user_id_str)
             user_data["guild_id"] = self.guild_id
             
-            # Donner le rôle de la guilde
-            guild_role = interaction.guild.get_role(guild_data['role_id'])
-            if guild_role:
-                await interaction.user.add_roles(guild_role)
-            
             # Vérifier si la guilde devient officielle
             official_threshold = guild_config.get("MIN_MEMBERS_FOR_OFFICIAL_STATUS", 7)
-            if guild_data.get("status") == "pending" and len(guild_data["members"]) >= official_threshold:
+            became_official = guild_data.get("status") == "pending" and self.manager.guild_index.member_count(self.guild_id) >= official_threshold
+            if became_official:
                 guild_data["status"] = "official"
-                await self.manager.announce_guild_official(interaction.guild, guild_data)
+                self.manager.guild_index.update_xp(self.guild_id, guild_data)
                 
-            await self.manager._save_json_data_async(self.manager.GUILD_DATA_FILE, self.manager.guild_data)
-            await self.manager._save_json_data_async(self.manager.USER_DATA_FILE, self.manager.user_data)
+            self.manager.mark_dirty(self.manager.GUILD_DATA_FILE, self.guild_id)
+            self.manager.mark_dirty(self.manager.USER_DATA_FILE, user_id_str)
+
+        # Appels Discord hors verrou : donner le rôle de la guilde, annoncer l'officialisation
+        guild_role = interaction.guild.get_role(guild_data['role_id'])
+        if guild_role:
+            await interaction.user.add_roles(guild_role)
+        if became_official:
+            await self.manager.announce_guild_official(interaction.guild, guild_data)
         
         for item in self.children: item.disabled = True
         await interaction.edit_original_response(content=f"Vous avez rejoint la guilde **{guild_data['name']}** !", view=self)
@@ -438,7 +480,7 @@ async def announce_guild_official(self, guild: discord.Guild, guild_data: dict):
             description=f"La guilde **{guild_data['name']}**, fondée par {owner.mention if owner else 'un chef'}, a atteint le statut officiel ! Souhaitez-leur la bienvenue !",
             color=discord.Color.green()
         )
-        await announcement_channel.send(embed=embed)
+        self.outbound.notify(announcement_channel, OutboundDispatcher.ANNOUNCEMENT, embed=embed)
 
 # This function needs to be added to the ManagerCog class
 ManagerCog.announce_guild_official = announce_guild_official
@@ -12,6 +12,16 @@ from typing import List, Dict, Any, Optional
 import aiofiles
 import re
 import traceback
+import sqlite3
+import threading
+import contextlib
+import bisect
+import heapq
+import itertools
+import collections
+import multiprocessing
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
 
 # Dépendance pour la génération d'image
 try:
@@ -48,6 +58,1527 @@ def create_gradient(width, height, color1_rgb, color2_rgb):
     return base.resize((width, height), Image.Resampling.BICUBIC)
 
 
+class ProfileCardAssets:
+    """
+    Cache LRU des éléments statiques de la carte de profil, par palette et badge (donc par palier de niveau) :
+    fond pré-composé (bordure, surface arrondie, anneau de l'avatar, fond de la barre d'XP, libellés fixes)
+    et badge redimensionné. Les polices et le masque de l'avatar, identiques pour tous, sont chargés une fois.
+    Un rendu ne fait plus que copier le fond, coller l'avatar et écrire les textes variables.
+    La mémoire occupée par les images est plafonnée à `max_bytes` ; les entrées les moins récentes sont évincées.
+    """
+    WIDTH, HEIGHT = 900, 300
+    AVATAR_SIZE = 160
+    AVATAR_POS = (50, (300 - 160) // 2)
+    AVATAR_BORDER = 8
+    TEXT_X = 250
+    INFO_X = 900 - 250
+    BAR = (250, 190, 900 - 250 - 50, 30)
+    BADGE_SIZE = 80
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "collections.OrderedDict[tuple, dict]" = collections.OrderedDict()
+        self._bytes = 0
+        self._fonts: Optional[tuple] = None
+        self._avatar_mask = None
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    @property
+    def fonts(self) -> tuple:
+        if self._fonts is None:
+            try:
+                self._fonts = (
+                    ImageFont.truetype("assets/Inter-Bold.ttf", 40),
+                    ImageFont.truetype("assets/Inter-Regular.ttf", 22),
+                    ImageFont.truetype("assets/Inter-Regular.ttf", 18)
+                )
+            except IOError:
+                print("Police Inter non trouvée, utilisation de la police par défaut.")
+                self._fonts = (ImageFont.load_default(size=40), ImageFont.load_default(size=22), ImageFont.load_default(size=18))
+        return self._fonts
+
+    @property
+    def avatar_mask(self):
+        if self._avatar_mask is None:
+            self._avatar_mask = Image.new('L', (self.AVATAR_SIZE, self.AVATAR_SIZE), 0)
+            ImageDraw.Draw(self._avatar_mask).ellipse((0, 0, self.AVATAR_SIZE, self.AVATAR_SIZE), fill=255)
+        return self._avatar_mask
+
+    def get(self, palette: dict, badge_path: Optional[str]) -> dict:
+        key = (json.dumps(palette, sort_keys=True), badge_path)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.stats["hits"] += 1
+            self._entries.move_to_end(key)
+            return entry
+
+        self.stats["misses"] += 1
+        entry = self._build(palette, badge_path)
+        self._entries[key] = entry
+        self._bytes += entry["nbytes"]
+        # On garde toujours au moins l'entrée qui vient d'être construite.
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted["nbytes"]
+            self.stats["evictions"] += 1
+        return entry
+
+    def _build(self, palette: dict, badge_path: Optional[str]) -> dict:
+        W, H = self.WIDTH, self.HEIGHT
+        # La surface peut être un dégradé (liste) ou une couleur unie (str)
+        surface_colors = palette['surface']
+        if isinstance(surface_colors, list) and len(surface_colors) > 1:
+            surface_color_1, surface_color_2 = hex_to_rgb(surface_colors[0]), hex_to_rgb(surface_colors[1])
+        else:
+            solid_color = surface_colors[0] if isinstance(surface_colors, list) else surface_colors
+            surface_color_1 = surface_color_2 = hex_to_rgb(solid_color)
+        text_color = hex_to_rgb(palette['text'])
+        accent_color = hex_to_rgb(palette['accent'])
+
+        background = Image.new('RGB', (W, H), hex_to_rgb(palette['background']))
+        mask = Image.new('L', (W - 30, H - 30), 0)
+        ImageDraw.Draw(mask).rounded_rectangle((0, 0, W - 30, H - 30), radius=20, fill=255)
+        background.paste(create_gradient(W - 30, H - 30, surface_color_1, surface_color_2), (15, 15), mask)
+
+        draw = ImageDraw.Draw(background)
+        x, y, border = self.AVATAR_POS[0], self.AVATAR_POS[1], self.AVATAR_BORDER
+        draw.ellipse((x - border // 2, y - border // 2, x + self.AVATAR_SIZE + border // 2, y + self.AVATAR_SIZE + border // 2), fill=accent_color)
+        _, _, font_small = self.fonts
+        draw.text((self.INFO_X, 55), "Classement", font=font_small, fill=text_color)
+        draw.text((self.INFO_X + 120, 55), "Crédits", font=font_small, fill=text_color)
+        bar_x, bar_y, bar_w, bar_h = self.BAR
+        bar_bg_color = tuple(int(c * 0.5) for c in accent_color) # Couleur d'accent plus sombre
+        draw.rounded_rectangle((bar_x, bar_y, bar_x + bar_w, bar_y + bar_h), radius=15, fill=bar_bg_color)
+
+        badge = None
+        if badge_path:
+            try:
+                badge = Image.open(badge_path).convert("RGBA").resize((self.BADGE_SIZE, self.BADGE_SIZE), Image.Resampling.LANCZOS)
+            except FileNotFoundError:
+                print(f"Fichier de badge introuvable : {badge_path}")
+
+        nbytes = W * H * 3 + (self.BADGE_SIZE * self.BADGE_SIZE * 4 if badge else 0)
+        return {
+            "background": background, "badge": badge, "text_color": text_color, "accent_color": accent_color, "nbytes": nbytes
+        }
+
+
+# --- Rendu des cartes de profil ---
+
+# Cache des éléments statiques propre à chaque processus de rendu (partagé entre threads en mode repli).
+_card_assets: Optional[ProfileCardAssets] = None
+_card_assets_lock = threading.Lock()
+
+
+def render_profile_card(spec: dict) -> tuple:
+    """
+    Dessine une carte de profil à partir d'une description sérialisable (statistiques, octets de l'avatar, palette).
+    Exécutée dans un processus ou un thread de rendu : aucun objet Discord ni accès au ManagerCog.
+    Retourne `(png, succès du cache)`.
+    """
+    global _card_assets
+    with _card_assets_lock:
+        if _card_assets is None:
+            _card_assets = ProfileCardAssets(spec.get("cache_max_bytes", 16 * 1024 * 1024))
+        hits_before = _card_assets.stats["hits"]
+        assets = _card_assets.get(spec["palette"], spec["badge_path"])
+        cache_hit = _card_assets.stats["hits"] > hits_before
+        font_bold, font_regular, font_small = _card_assets.fonts
+        avatar_mask = _card_assets.avatar_mask
+
+    layout = ProfileCardAssets
+    W, H = layout.WIDTH, layout.HEIGHT
+    TEXT_COLOR = assets["text_color"]
+    ACCENT_COLOR = assets["accent_color"]
+
+    img = assets["background"].copy()
+    draw = ImageDraw.Draw(img)
+
+    # --- Avatar ---
+    avatar_img = Image.open(io.BytesIO(spec["avatar"])).convert("RGBA")
+    avatar_img = avatar_img.resize((layout.AVATAR_SIZE, layout.AVATAR_SIZE), Image.Resampling.LANCZOS)
+    img.paste(avatar_img, layout.AVATAR_POS, avatar_mask)
+
+    # --- Textes ---
+    text_x = layout.TEXT_X
+    # Nom de l'utilisateur
+    if spec["glow"]:
+        glow_color = tuple(min(255, c + 50) for c in ACCENT_COLOR) # Couleur d'accent plus claire
+        for offset in [(-2, -2), (2, -2), (-2, 2), (2, 2)]:
+            draw.text((text_x + offset[0], 50 + offset[1]), spec["display_name"], font=font_bold, fill=glow_color)
+    draw.text((text_x, 50), spec["display_name"], font=font_bold, fill=TEXT_COLOR)
+
+    # Niveau
+    draw.text((text_x, 105), f"NIVEAU {spec['level']}", font=font_regular, fill=ACCENT_COLOR)
+
+    # Informations à droite
+    info_x = layout.INFO_X
+    draw.text((info_x, 80), spec["rank"], font=font_regular, fill=TEXT_COLOR)
+    draw.text((info_x + 120, 80), f"{spec['store_credit']:.2f}", font=font_regular, fill=TEXT_COLOR)
+
+    # --- Barre d'XP ---
+    current_xp_in_level, needed_xp_for_level = spec["xp_current"], spec["xp_needed"]
+    xp_progress = current_xp_in_level / needed_xp_for_level if needed_xp_for_level > 0 else 1
+    xp_progress = max(0, min(1, xp_progress))
+
+    bar_x, bar_y, bar_w, bar_h = layout.BAR
+    if xp_progress > 0:
+        draw.rounded_rectangle((bar_x, bar_y, bar_x + (bar_w * xp_progress), bar_y + bar_h), radius=15, fill=ACCENT_COLOR)
+
+    xp_text = f"{int(current_xp_in_level)} / {int(needed_xp_for_level)} XP"
+    text_bbox = draw.textbbox((0,0), xp_text, font=font_small)
+    xp_text_width = text_bbox[2] - text_bbox[0]
+    xp_text_height = text_bbox[3] - text_bbox[1]
+    draw.text((bar_x + (bar_w - xp_text_width) / 2, bar_y + (bar_h - xp_text_height) / 2 - 2), xp_text, font=font_small, fill=TEXT_COLOR)
+
+    # --- Badge (au premier plan, il chevauche la barre d'XP) ---
+    badge_img = assets["badge"]
+    if badge_img:
+        img.paste(badge_img, (W - layout.BADGE_SIZE - 40, H - layout.BADGE_SIZE - 40), badge_img)
+
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue(), cache_hit
+
+
+class ProfileRenderer:
+    """
+    Exécute `render_profile_card` hors de la boucle asyncio, dans un pool de processus (repli sur un pool de threads
+    si les processus sont indisponibles ou si le pool casse). Chaque rendu occupe une place réservée par `try_reserve`
+    avant le premier `await` de l'appelant et rendue par `release` ; au-delà de `max_pending` places, la réservation
+    échoue et l'appelant affiche le profil en embed texte.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 8, use_processes: bool = True, cache_max_bytes: int = 16 * 1024 * 1024):
+        self.max_workers = max(max_workers, 1)
+        self.max_pending = max(max_pending, 1)
+        self.use_processes = use_processes
+        self.cache_max_bytes = cache_max_bytes
+        self.mode: Optional[str] = None
+        self._executor: Optional[concurrent.futures.Executor] = None
+        self._pending = 0
+        self.stats = {
+            "rendered": 0, "overloaded": 0, "failed": 0, "fallbacks": 0,
+            "cache_hits": 0, "cache_misses": 0, "max_ms": 0.0
+        }
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    @property
+    def overloaded(self) -> bool:
+        return self._pending >= self.max_pending
+
+    def try_reserve(self) -> bool:
+        """Réserve une place de rendu (vérification et réservation d'un seul tenant, sans `await`)."""
+        if self.overloaded:
+            self.stats["overloaded"] += 1
+            return False
+        self._pending += 1
+        return True
+
+    def release(self):
+        self._pending -= 1
+
+    def _start(self):
+        if self.use_processes:
+            try:
+                # "spawn" : un fork du processus du bot (boucle asyncio, threads, sockets) n'est pas sûr.
+                self._executor = concurrent.futures.ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+                self.mode = "processus"
+                return
+            except (OSError, NotImplementedError, ValueError) as e:
+                print(f"Pool de processus indisponible pour le rendu des profils, repli sur des threads : {e}")
+        self._executor = concurrent.futures.ThreadPoolExecutor(self.max_workers, thread_name_prefix="profile-card")
+        self.mode = "threads"
+
+    def _fall_back_to_threads(self, error: Exception):
+        print(f"Pool de processus de rendu hors service ({error!r}), repli sur des threads.")
+        self.stats["fallbacks"] += 1
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.use_processes = False
+        self._start()
+
+    async def render(self, spec: dict) -> bytes:
+        """Retourne le PNG de la carte. L'appelant doit détenir une place obtenue par `try_reserve`."""
+        if self._executor is None:
+            self._start()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        spec = dict(spec, cache_max_bytes=self.cache_max_bytes)
+        try:
+            try:
+                png_data, cache_hit = await loop.run_in_executor(self._executor, render_profile_card, spec)
+            except (BrokenProcessPool, OSError) as e:
+                if self.mode != "processus":
+                    raise
+                self._fall_back_to_threads(e)
+                png_data, cache_hit = await loop.run_in_executor(self._executor, render_profile_card, spec)
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+
+        self.stats["rendered"] += 1
+        self.stats["cache_hits" if cache_hit else "cache_misses"] += 1
+        self.stats["max_ms"] = max(self.stats["max_ms"], (loop.time() - started) * 1000)
+        return png_data
+
+    def close(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# --- Moteurs de stockage ---
+
+class JsonStorageBackend:
+    """Stockage historique : un fichier JSON par jeu de données, réécrit entièrement à chaque sauvegarde."""
+    name = "json"
+
+    def __init__(self, manager: 'ManagerCog'):
+        self.manager = manager
+
+    async def load(self, file_path: str) -> Any:
+        return await self.manager._load_json_data_async(file_path)
+
+    async def save(self, file_path: str, data: Any, keys: set, full: bool) -> Optional[int]:
+        return await self.manager._save_json_data_async(file_path, data)
+
+    def close(self):
+        pass
+
+
+class SQLiteStorageBackend:
+    """
+    Stockage SQLite (mode WAL) : chaque enregistrement (utilisateur, guilde, action en attente)
+    est une ligne, et une sauvegarde ne réécrit que les lignes modifiées dans une seule transaction.
+    """
+    name = "sqlite"
+    # Jeux de données imbriqués sur deux niveaux (ex: pending_actions["cashouts"][msg_id])
+    NESTED_STORES = {"pending_actions": ("transactions", "cashouts")}
+
+    def __init__(self, db_path: str):
+        dir_name = os.path.dirname(db_path)
+        if dir_name and not os.path.exists(dir_name):
+            os.makedirs(dir_name)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS records (store TEXT NOT NULL, key TEXT NOT NULL, data TEXT NOT NULL, PRIMARY KEY (store, key))"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+
+    @staticmethod
+    def store_name(file_path: str) -> str:
+        return os.path.splitext(os.path.basename(file_path))[0]
+
+    @staticmethod
+    def _encode_key(key: Any) -> str:
+        return "/".join(str(part) for part in key) if isinstance(key, tuple) else str(key)
+
+    def _lookup(self, store: str, data: Any, key: Any) -> Any:
+        if isinstance(key, tuple):
+            return data.get(key[0], {}).get(key[1])
+        return data.get(key)
+
+    def _iter_records(self, store: str, data: Any):
+        if store in self.NESTED_STORES:
+            for kind, records in data.items():
+                for record_id, record in records.items():
+                    yield (kind, record_id), record
+        else:
+            yield from data.items()
+
+    def _load_sync(self, store: str) -> Any:
+        with self._lock:
+            rows = self.conn.execute("SELECT key, data FROM records WHERE store = ?", (store,)).fetchall()
+        if store in self.NESTED_STORES:
+            result = {kind: {} for kind in self.NESTED_STORES[store]}
+            for key, raw in rows:
+                kind, _, record_id = key.partition("/")
+                result.setdefault(kind, {})[record_id] = json.loads(raw)
+            return result
+        return {key: json.loads(raw) for key, raw in rows}
+
+    def _write_sync(self, store: str, upserts: list, deletes: list, full: bool):
+        with self._lock, self.conn:
+            if full:
+                self.conn.execute("DELETE FROM records WHERE store = ?", (store,))
+            if deletes:
+                self.conn.executemany("DELETE FROM records WHERE store = ? AND key = ?", [(store, k) for k in deletes])
+            if upserts:
+                self.conn.executemany(
+                    "INSERT INTO records (store, key, data) VALUES (?, ?, ?) "
+                    "ON CONFLICT(store, key) DO UPDATE SET data = excluded.data",
+                    [(store, k, v) for k, v in upserts]
+                )
+
+    async def load(self, file_path: str) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._load_sync, self.store_name(file_path))
+
+    async def save(self, file_path: str, data: Any, keys: set, full: bool) -> Optional[int]:
+        store = self.store_name(file_path)
+        try:
+            # Sérialisation sur la boucle : seuls les enregistrements modifiés sont concernés
+            records = self._iter_records(store, data) if full else ((key, self._lookup(store, data, key)) for key in keys)
+            upserts, deletes = [], []
+            for key, record in records:
+                if record is None:
+                    deletes.append(self._encode_key(key))
+                else:
+                    upserts.append((self._encode_key(key), json.dumps(record, ensure_ascii=False)))
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._write_sync, store, upserts, deletes, full)
+            return sum(len(raw.encode('utf-8')) for _, raw in upserts)
+        except Exception as e:
+            print(f"Erreur lors de la sauvegarde SQLite de '{store}': {e}")
+            return None
+
+    def is_migrated(self) -> bool:
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'json_migrated_at'").fetchone()
+        return row is not None
+
+    async def migrate_from_json(self, manager: 'ManagerCog', file_paths: List[str]):
+        """Migration unique : importe les fichiers JSON existants dans la base SQLite."""
+        if self.is_migrated():
+            return
+        loop = asyncio.get_running_loop()
+        for file_path in file_paths:
+            if not os.path.exists(file_path):
+                continue
+            data = await manager._load_json_data_async(file_path)
+            store = self.store_name(file_path)
+            upserts = [(self._encode_key(key), json.dumps(record, ensure_ascii=False)) for key, record in self._iter_records(store, data)]
+            await loop.run_in_executor(None, self._write_sync, store, upserts, [], True)
+            print(f"Migration SQLite : {len(upserts)} enregistrement(s) importé(s) depuis {file_path}.")
+
+        def mark_migrated():
+            with self._lock, self.conn:
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated_at', ?)", (datetime.now(timezone.utc).isoformat(),))
+        await loop.run_in_executor(None, mark_migrated)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def _durable_replace(tmp_path: str, file_path: str):
+    """Force l'écriture sur disque d'un fichier temporaire puis le substitue atomiquement à la cible."""
+    fd = os.open(tmp_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp_path, file_path)
+
+
+class EventJournal:
+    """
+    Journal append-only des mutations de solde (add_transaction).
+    Chaque événement est une ligne JSON compacte ; la synchronisation disque (fsync) est faite par groupes.
+    Lors d'une sauvegarde complète des données utilisateurs (snapshot), le segment actif est scellé
+    puis supprimé une fois la sauvegarde réussie.
+    """
+
+    def __init__(self, path: str, fsync_interval_ms: int = 200, fsync_batch_size: int = 64):
+        self.path = path
+        self.fsync_interval = fsync_interval_ms / 1000
+        self.fsync_batch_size = fsync_batch_size
+        self.seq = 0
+        self.events_since_compaction = 0
+        self._file = None
+        self._sealed_files: list = []
+        self._unsynced = 0
+        self._io_lock = threading.Lock()
+        self._sync_event = asyncio.Event()
+        self._sync_task: Optional[asyncio.Task] = None
+        self.stats = {"appended": 0, "fsyncs": 0, "bytes": 0, "replayed": 0, "compactions": 0}
+
+    def _segments(self) -> List[str]:
+        """Segments scellés (en attente de compaction), du plus ancien au plus récent."""
+        dir_name = os.path.dirname(self.path) or "."
+        prefix = os.path.basename(self.path) + "."
+        if not os.path.exists(dir_name):
+            return []
+        numbers = [int(name[len(prefix):]) for name in os.listdir(dir_name) if name.startswith(prefix) and name[len(prefix):].isdigit()]
+        return [f"{self.path}.{n}" for n in sorted(numbers)]
+
+    def read_events(self) -> List[Dict[str, Any]]:
+        """Relit tous les événements encore présents (segments scellés puis segment actif)."""
+        events = []
+        for segment in self._segments() + [self.path]:
+            if not os.path.exists(segment):
+                continue
+            with open(segment, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        events.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # Dernière ligne tronquée par un arrêt brutal : on l'ignore
+                        print(f"Journal : ligne corrompue ignorée dans {segment}.")
+        return events
+
+    def open(self, last_seq: int):
+        dir_name = os.path.dirname(self.path)
+        if dir_name and not os.path.exists(dir_name):
+            os.makedirs(dir_name)
+        self.seq = last_seq
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._sync_task = asyncio.create_task(self._sync_loop())
+
+    def append(self, user_id: str, type: str, amount: float, description: str, timestamp: str) -> int:
+        self.seq += 1
+        line = json.dumps({"s": self.seq, "u": user_id, "t": type, "a": amount, "d": description, "ts": timestamp}, ensure_ascii=False, separators=(',', ':')) + "\n"
+        with self._io_lock:
+            self._file.write(line)
+        self._unsynced += 1
+        self.events_since_compaction += 1
+        self.stats["appended"] += 1
+        self.stats["bytes"] += len(line.encode('utf-8'))
+        if self._unsynced >= self.fsync_batch_size:
+            self._sync_event.set()
+        return self.seq
+
+    def _sync_now(self):
+        with self._io_lock:
+            if self._file is None or self._file.closed:
+                return
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self.stats["fsyncs"] += 1
+
+    async def commit(self):
+        """Synchronise sur disque les événements écrits depuis le dernier fsync."""
+        if not self._unsynced:
+            return
+        self._unsynced = 0
+        await asyncio.get_running_loop().run_in_executor(None, self._sync_now)
+
+    async def _sync_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._sync_event.wait(), timeout=self.fsync_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._sync_event.clear()
+            try:
+                await self.commit()
+            except Exception as e:
+                print(f"Erreur lors de la synchronisation du journal: {e}")
+
+    def seal(self) -> int:
+        """
+        Scelle le segment actif et en ouvre un nouveau. Retourne le numéro du segment scellé.
+        Seuls le renommage et l'ouverture sont faits ici ; le fsync du segment scellé est fait par `sync_sealed`.
+        """
+        with self._io_lock:
+            self._file.flush()
+            segments = self._segments()
+            number = int(segments[-1].rsplit(".", 1)[1]) + 1 if segments else 1
+            os.replace(self.path, f"{self.path}.{number}")
+            self._sealed_files.append(self._file)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._unsynced = 0
+        self.events_since_compaction = 0
+        return number
+
+    def _sync_sealed_now(self):
+        while self._sealed_files:
+            sealed_file = self._sealed_files.pop(0)
+            os.fsync(sealed_file.fileno())
+            sealed_file.close()
+            self.stats["fsyncs"] += 1
+
+    async def sync_sealed(self):
+        """Synchronise sur disque puis ferme les segments scellés, hors de la boucle asyncio."""
+        if self._sealed_files:
+            await asyncio.get_running_loop().run_in_executor(None, self._sync_sealed_now)
+
+    def discard_sealed(self, up_to: int):
+        """Supprime les segments scellés couverts par un snapshot réussi."""
+        for segment in self._segments():
+            if int(segment.rsplit(".", 1)[1]) <= up_to:
+                os.remove(segment)
+        self.stats["compactions"] += 1
+
+    def close(self):
+        if self._sync_task:
+            self._sync_task.cancel()
+        self._sync_sealed_now()
+        if self._file and not self._file.closed:
+            self._sync_now()
+            with self._io_lock:
+                self._file.close()
+
+
+# --- Verrous par clé ---
+
+class _KeyedLock:
+    __slots__ = ("lock", "owner", "depth", "waiters", "since")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.owner: Optional[asyncio.Task] = None
+        self.depth = 0
+        self.waiters = 0
+        self.since = 0.0
+
+
+class LockManager:
+    """
+    Verrous asyncio par clé : deux utilisateurs (ou deux guildes) différents ne s'attendent jamais.
+
+    Ordre d'acquisition, toujours respecté par `hold()` :
+      1. actions en attente  ("pending", "cashout:<id>" / "transaction:<id>")
+      2. guildes             ("guild", <guild_id> ou "name:<nom>")
+      3. utilisateurs        ("user", <user_id>)
+    À rang égal, les clés sont triées par identifiant. Toutes les clés d'une opération
+    doivent être demandées dans un seul `hold()` ; un `hold()` imbriqué qui remonte
+    l'ordre est signalé dans `stats["order_violations"]`.
+    Les verrous sont réentrants pour la tâche qui les détient.
+    """
+    _RANK = {"pending": 0, "guild": 1, "user": 2}
+
+    def __init__(self):
+        self._locks: Dict[tuple, _KeyedLock] = {}
+        self._held: Dict[asyncio.Task, List[tuple]] = {}
+        self.stats = {"acquisitions": 0, "contended": 0, "wait_total_ms": 0.0, "wait_max_ms": 0.0, "order_violations": 0}
+
+    @contextlib.asynccontextmanager
+    async def hold(self, *, users=(), guilds=(), pending=()):
+        keys = {("user", str(k)) for k in users} | {("guild", str(k)) for k in guilds} | {("pending", str(k)) for k in pending}
+        ordered = sorted(keys, key=lambda k: (self._RANK[k[0]], k[1]))
+        acquired = []
+        try:
+            for key in ordered:
+                await self._acquire(key)
+                acquired.append(key)
+            yield
+        finally:
+            for key in reversed(acquired):
+                self._release(key)
+
+    async def _acquire(self, key: tuple):
+        task = asyncio.current_task()
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = _KeyedLock()
+        if entry.owner is task:
+            entry.depth += 1
+            return
+
+        held = self._held.setdefault(task, [])
+        if held and max(self._RANK[k[0]] for k in held) > self._RANK[key[0]]:
+            self.stats["order_violations"] += 1
+            print(f"⚠️ Ordre des verrous non respecté : {key} demandé après {held}")
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        if entry.lock.locked():
+            self.stats["contended"] += 1
+        entry.waiters += 1
+        try:
+            await entry.lock.acquire()
+        finally:
+            entry.waiters -= 1
+        entry.since = loop.time()
+        waited_ms = (entry.since - start) * 1000
+        entry.owner = task
+        entry.depth = 1
+        held.append(key)
+        self.stats["acquisitions"] += 1
+        self.stats["wait_total_ms"] += waited_ms
+        self.stats["wait_max_ms"] = max(self.stats["wait_max_ms"], waited_ms)
+
+    def _release(self, key: tuple):
+        entry = self._locks[key]
+        entry.depth -= 1
+        if entry.depth:
+            return
+        held = self._held.get(entry.owner)
+        if held:
+            held.remove(key)
+            if not held:
+                del self._held[entry.owner]
+        entry.owner = None
+        entry.lock.release()
+        # On ne conserve que les verrous utiles pour borner la mémoire.
+        if not entry.waiters and not entry.lock.locked():
+            del self._locks[key]
+
+    def holders(self) -> List[tuple]:
+        """Verrous actuellement détenus : (clé, nom de la tâche, durée de détention en ms, nb en attente)."""
+        now = asyncio.get_running_loop().time()
+        return [
+            (key, entry.owner.get_name() if entry.owner else "?", (now - entry.since) * 1000, entry.waiters)
+            for key, entry in self._locks.items() if entry.lock.locked()
+        ]
+
+
+# --- Courbe de niveaux ---
+
+class LevelCurve:
+    """
+    Seuils d'XP précalculés, construits une seule fois au chargement de la configuration.
+    Le niveau L (L >= 2) est atteint à `int(base_xp * multiplier ** (L - 1))` XP ; le niveau 1 à 0 XP.
+    La table est étendue à la demande au-delà du plafond initial.
+    """
+    MAX_LEVEL = 10_000
+
+    def __init__(self, base_xp: float, multiplier: float, initial_cap: int = 200):
+        self.base_xp = base_xp
+        self.multiplier = multiplier
+        self._thresholds: List[int] = [0]  # _thresholds[L - 1] = XP totale requise pour le niveau L
+        self._extend(initial_cap)
+
+    def _extend(self, max_level: int):
+        max_level = min(max_level, self.MAX_LEVEL)
+        try:
+            while len(self._thresholds) < max_level:
+                level = len(self._thresholds) + 1
+                threshold = int(self.base_xp * (self.multiplier ** (level - 1)))
+                if threshold <= self._thresholds[-1]:
+                    # Courbe non croissante (multiplicateur <= 1) : on force la progression.
+                    threshold = self._thresholds[-1] + 1
+                self._thresholds.append(threshold)
+        except OverflowError:
+            pass
+
+    @property
+    def max_level(self) -> int:
+        return len(self._thresholds)
+
+    def threshold(self, level: int) -> int:
+        """XP totale requise pour atteindre `level`."""
+        if level > len(self._thresholds):
+            self._extend(level)
+            if level > len(self._thresholds):
+                return self._thresholds[-1]
+        return self._thresholds[max(level, 1) - 1]
+
+    def level_for_xp(self, xp: float) -> int:
+        """Niveau correspondant à une quantité d'XP (recherche dichotomique)."""
+        while xp >= self._thresholds[-1] and len(self._thresholds) < self.MAX_LEVEL:
+            before = len(self._thresholds)
+            self._extend(before * 2)
+            if len(self._thresholds) == before:
+                break
+        return max(1, bisect.bisect_right(self._thresholds, xp))
+
+    def xp_to_next(self, xp: float, level: int) -> float:
+        """XP manquante pour passer du niveau `level` au suivant."""
+        return self.threshold(level + 1) - xp
+
+    def progress(self, xp: float, level: int) -> tuple[float, int]:
+        """(XP acquise dans le niveau actuel, XP totale du niveau actuel)."""
+        start = self.threshold(level)
+        return xp - start, self.threshold(level + 1) - start
+
+
+# --- Semaines de classement ---
+
+WEEK_SECONDS = 7 * 86400
+# Le 1er janvier 1970 était un jeudi : décalage de 3 jours pour que les semaines commencent le lundi 00:00 UTC.
+_WEEK_OFFSET = 3 * 86400
+
+
+def week_epoch(timestamp: Optional[float] = None) -> int:
+    """Numéro de la semaine contenant `timestamp` (maintenant par défaut)."""
+    if timestamp is None:
+        timestamp = datetime.now(timezone.utc).timestamp()
+    return int((timestamp + _WEEK_OFFSET) // WEEK_SECONDS)
+
+
+def week_epoch_end(epoch: int) -> float:
+    """Timestamp du début de la semaine suivant `epoch`."""
+    return (epoch + 1) * WEEK_SECONDS - _WEEK_OFFSET
+
+
+# --- Résolution des bonus ---
+
+class BoostResolver:
+    """
+    Tables de paliers (prestige, VIP, commissions) triées une seule fois au chargement de la
+    configuration, et cache par utilisateur du multiplicateur d'XP et du taux de commission.
+    Une entrée reste valable jusqu'à la prochaine expiration (VIP ou booster) de l'utilisateur ;
+    les changements de niveau, achats et expirations l'invalident explicitement.
+    """
+
+    def __init__(self, config: dict):
+        gamification = config.get("GAMIFICATION_CONFIG", {})
+        premium = gamification.get("VIP_SYSTEM", {}).get("PREMIUM", {})
+        prestige = [{"level": int(level), "xp_bonus": data.get("xp_bonus", 0.0)} for level, data in gamification.get("PRESTIGE_LEVELS", {}).items()]
+        self._prestige = self._compile(prestige, "level", "xp_bonus")
+        self._vip_xp = self._compile(premium.get("XP_BOOST_TIERS", []), "consecutive_periods", "boost")
+        self._vip_commission = self._compile(premium.get("COMMISSION_BONUS_TIERS", []), "consecutive_periods", "bonus")
+        self._commission = self._compile(gamification.get("AFFILIATE_SYSTEM", {}).get("COMMISSION_TIERS", []), "level", "rate")
+        self._cache: Dict[str, tuple] = {}
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    @staticmethod
+    def _compile(tiers: list, key: str, value: str) -> tuple:
+        ordered = sorted(tiers, key=lambda t: t[key])
+        return [t[key] for t in ordered], [t[value] for t in ordered]
+
+    @staticmethod
+    def _lookup(table: tuple, x: float) -> float:
+        """Valeur du palier le plus haut tel que x >= seuil, 0 sinon."""
+        keys, values = table
+        i = bisect.bisect_right(keys, x)
+        return values[i - 1] if i else 0.0
+
+    def prestige_xp_bonus(self, level: int) -> float:
+        return self._lookup(self._prestige, level)
+
+    def vip_xp_boost(self, consecutive_periods: int) -> float:
+        return self._lookup(self._vip_xp, consecutive_periods)
+
+    def vip_commission_bonus(self, consecutive_periods: int) -> float:
+        return self._lookup(self._vip_commission, consecutive_periods)
+
+    def base_commission_rate(self, level: int) -> float:
+        return self._lookup(self._commission, level)
+
+    def rates(self, user_id: str, user_data: dict, now: float) -> tuple[float, float]:
+        """(multiplicateur d'XP, taux de commission) effectifs de l'utilisateur."""
+        entry = self._cache.get(user_id)
+        if entry and now < entry[2]:
+            self.stats["hits"] += 1
+            return entry[0], entry[1]
+        self.stats["misses"] += 1
+
+        level = user_data.get("level", 1)
+        valid_until = float("inf")
+        xp_multiplier = 1.0 + self.prestige_xp_bonus(level) + user_data.get("loyalty_xp_bonus", 0.0)
+        commission_rate = self.base_commission_rate(level) + user_data.get("loyalty_commission_bonus", 0.0)
+
+        vip = user_data.get("vip_premium")
+        if vip and vip.get("end_timestamp", 0) > now:
+            periods = vip.get("consecutive_periods", 1)
+            xp_multiplier += self.vip_xp_boost(periods)
+            commission_rate += self.vip_commission_bonus(periods)
+            valid_until = min(valid_until, vip["end_timestamp"])
+
+        # Booster hebdo du podium d'affiliation : valable uniquement pendant la semaine où il a été décerné.
+        best_commission_booster = 0.0
+        booster_epoch = user_data.get("affiliate_booster_epoch")
+        if user_data.get("affiliate_booster") and booster_epoch == week_epoch(now):
+            best_commission_booster = user_data["affiliate_booster"]
+            valid_until = min(valid_until, week_epoch_end(booster_epoch))
+
+        # Boosters de la boutique : XP cumulables, commission non cumulable avec le booster hebdo.
+        for boost in user_data.get("active_boosts") or []:
+            expires_at = boost.get("expires_at", 0)
+            if expires_at <= now:
+                continue
+            if boost.get("type") == "xp":
+                xp_multiplier += boost.get("rate", 0.0)
+            elif boost.get("type") == "commission":
+                best_commission_booster = max(best_commission_booster, boost.get("rate", 0.0))
+            valid_until = min(valid_until, expires_at)
+        commission_rate += best_commission_booster
+
+        self._cache[user_id] = (xp_multiplier, commission_rate, valid_until)
+        return xp_multiplier, commission_rate
+
+    def invalidate(self, user_id: Optional[str] = None):
+        """Invalide le cache d'un utilisateur, ou de tous sans argument."""
+        self.stats["invalidations"] += 1
+        if user_id is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(user_id, None)
+
+
+# --- Index des succès ---
+
+class AchievementIndex:
+    """
+    Succès regroupés par compteur déclencheur (`message_count`, `purchase_count`...) et triés par seuil.
+    Un curseur par utilisateur et par compteur pointe sur le prochain seuil non atteint :
+    vérifier un compteur coûte une comparaison tant que ce seuil n'est pas franchi.
+    Le premier passage d'un utilisateur depuis la construction de l'index évalue tous les compteurs
+    (seuils déjà dépassés au chargement, succès ajoutés au catalogue) ; les suivants sont incrémentaux.
+    """
+
+    def __init__(self, achievements: list):
+        grouped: Dict[str, list] = {}
+        for achievement in achievements:
+            trigger = achievement.get("trigger", {})
+            if "type" in trigger and "value" in trigger:
+                grouped.setdefault(trigger["type"], []).append(achievement)
+        self._thresholds: Dict[str, List[float]] = {}
+        self._achievements: Dict[str, list] = {}
+        for trigger_type, entries in grouped.items():
+            entries.sort(key=lambda a: a["trigger"]["value"])
+            self._thresholds[trigger_type] = [a["trigger"]["value"] for a in entries]
+            self._achievements[trigger_type] = entries
+        self._cursors: Dict[str, Dict[str, int]] = {}
+        self._checked: set = set()
+
+    @property
+    def trigger_types(self):
+        return self._thresholds.keys()
+
+    def is_checked(self, user_id: str) -> bool:
+        return user_id in self._checked
+
+    def mark_checked(self, user_id: str):
+        self._checked.add(user_id)
+
+    def _cursor(self, user_id: str, trigger_type: str, unlocked: list) -> int:
+        cursors = self._cursors.setdefault(user_id, {})
+        if trigger_type not in cursors:
+            entries = self._achievements[trigger_type]
+            position = 0
+            while position < len(entries) and entries[position]["id"] in unlocked:
+                position += 1
+            cursors[trigger_type] = position
+        return cursors[trigger_type]
+
+    def reached(self, user_id: str, trigger_type: str, value: float, unlocked: list) -> list:
+        """Succès de ce compteur nouvellement atteints ; avance le curseur de l'utilisateur."""
+        thresholds = self._thresholds.get(trigger_type)
+        if not thresholds:
+            return []
+        position = self._cursor(user_id, trigger_type, unlocked)
+        if position >= len(thresholds) or value < thresholds[position]:
+            return []
+        end = bisect.bisect_right(thresholds, value, position)
+        reached = [a for a in self._achievements[trigger_type][position:end] if a["id"] not in unlocked]
+        entries = self._achievements[trigger_type]
+        while end < len(entries) and entries[end]["id"] in unlocked:
+            end += 1
+        self._cursors[user_id][trigger_type] = end
+        return reached
+
+
+# --- Index des missions ---
+
+class MissionIndex:
+    """
+    Utilisateurs ayant une mission active et non complétée, regroupés par action (`send_message`, `affiliate_sale`...).
+    Une action sans mission correspondante pour l'utilisateur se résout par une simple recherche dans un ensemble.
+    """
+    SLOTS = ("current_daily_mission", "current_weekly_mission")
+
+    def __init__(self):
+        self._users: Dict[str, set] = {}
+        self._actions: Dict[str, set] = {}
+
+    def reindex(self, user_id: str, user_data: dict):
+        """Recalcule les entrées d'un utilisateur après une assignation ou une complétion."""
+        for action_id in self._actions.pop(user_id, ()):
+            users = self._users[action_id]
+            users.discard(user_id)
+            if not users:
+                del self._users[action_id]
+        actions = {mission["id"] for mission in (user_data.get(slot) for slot in self.SLOTS) if mission and not mission.get("completed")}
+        if actions:
+            self._actions[user_id] = actions
+            for action_id in actions:
+                self._users.setdefault(action_id, set()).add(user_id)
+
+    def rebuild(self, user_data: dict):
+        self._users.clear()
+        self._actions.clear()
+        for user_id, data in user_data.items():
+            self.reindex(user_id, data)
+
+    def has(self, action_id: str, user_id: str) -> bool:
+        return user_id in self._users.get(action_id, ())
+
+    def __len__(self) -> int:
+        return len(self._actions)
+
+
+# --- Envoi des notifications ---
+
+class OutboundDispatcher:
+    """
+    File d'envoi centrale des messages Discord non interactifs (annonces, MP, journaux).
+    Le code métier appelle `notify()` qui retourne immédiatement ; des workers en nombre borné
+    envoient ensuite les messages, une route (salon ou MP) à la fois, par ordre de priorité :
+    alertes staff > confirmations d'achat > annonces > MP.
+    - Fusion : un message portant une `merge_key` remplace celui encore en attente sur la même route.
+    - Rejet : au-delà de `max_pending`, les annonces et MP sont abandonnés (jamais staff/achats).
+    - 429 : la route est mise en pause le temps indiqué par Discord puis le message est retenté.
+    """
+    STAFF, PURCHASE, ANNOUNCEMENT, DM = range(4)
+    PRIORITY_NAMES = ("staff", "achats", "annonces", "MP")
+
+    def __init__(self, max_concurrency: int = 4, max_pending: int = 5000, max_retries: int = 3):
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self._routes: Dict[tuple, dict] = {}
+        self._ready: list = []
+        self._busy: set = set()
+        self._pending = 0
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._workers: List[asyncio.Task] = []
+        self.stats = {
+            "queued": 0, "sent": 0, "merged": 0, "dropped": 0, "failed": 0, "forbidden": 0,
+            "rate_limited": 0, "max_wait_ms": 0.0, "pending_by_priority": [0, 0, 0, 0]
+        }
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def start(self):
+        for i in range(self.max_concurrency):
+            self._workers.append(asyncio.create_task(self._worker(), name=f"outbound-{i}"))
+
+    async def close(self):
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+
+    async def drain(self, timeout: float):
+        """Attend (au plus `timeout` secondes) que tous les messages en attente soient envoyés."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while (self._pending or self._busy) and loop.time() < deadline:
+            await asyncio.sleep(0.1)
+
+    def notify(self, target: Optional[discord.abc.Messageable], priority: int, content: Optional[str] = None, *,
+               embed: Optional[discord.Embed] = None, view: Optional[discord.ui.View] = None, merge_key: Any = None) -> bool:
+        """Met un message en file. Retourne False s'il a été rejeté."""
+        if target is None:
+            return False
+        route = ("dm" if isinstance(target, (discord.User, discord.Member)) else "channel", target.id)
+        payload = {key: value for key, value in (("content", content), ("embed", embed), ("view", view)) if value is not None}
+        state = self._routes.setdefault(route, {"target": target, "queue": [], "merge": {}})
+
+        if merge_key is not None and merge_key in state["merge"]:
+            state["merge"][merge_key][2] = payload
+            self.stats["merged"] += 1
+            return True
+        if self._pending >= self.max_pending and priority >= self.ANNOUNCEMENT:
+            self.stats["dropped"] += 1
+            if not state["queue"] and route not in self._busy:
+                del self._routes[route]
+            return False
+
+        entry = [priority, next(self._seq), payload, merge_key, asyncio.get_running_loop().time(), 0]
+        self._push(route, state, entry)
+        self.stats["queued"] += 1
+        return True
+
+    def _push(self, route: tuple, state: dict, entry: list):
+        heapq.heappush(state["queue"], entry)
+        if entry[3] is not None:
+            state["merge"][entry[3]] = entry
+        self._pending += 1
+        self.stats["pending_by_priority"][entry[0]] += 1
+        if route not in self._busy:
+            heapq.heappush(self._ready, (entry[0], entry[1], route))
+            self._wakeup.set()
+
+    def _next_route(self) -> Optional[tuple]:
+        while self._ready:
+            _, _, route = heapq.heappop(self._ready)
+            state = self._routes.get(route)
+            if route not in self._busy and state and state["queue"]:
+                return route
+        return None
+
+    async def _worker(self):
+        while True:
+            route = self._next_route()
+            if route is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            state = self._routes[route]
+            entry = heapq.heappop(state["queue"])
+            if entry[3] is not None:
+                state["merge"].pop(entry[3], None)
+            self._pending -= 1
+            self.stats["pending_by_priority"][entry[0]] -= 1
+            self._busy.add(route)
+            try:
+                await self._deliver(route, state, entry)
+            finally:
+                self._busy.discard(route)
+                if state["queue"]:
+                    head = state["queue"][0]
+                    heapq.heappush(self._ready, (head[0], head[1], route))
+                    self._wakeup.set()
+                else:
+                    self._routes.pop(route, None)
+
+    async def _deliver(self, route: tuple, state: dict, entry: list):
+        wait_ms = (asyncio.get_running_loop().time() - entry[4]) * 1000
+        self.stats["max_wait_ms"] = max(self.stats["max_wait_ms"], wait_ms)
+        try:
+            await state["target"].send(**entry[2])
+            self.stats["sent"] += 1
+        except discord.Forbidden:
+            # MP fermés ou permissions manquantes : rien à retenter.
+            self.stats["forbidden"] += 1
+        except discord.HTTPException as e:
+            if e.status == 429 and entry[5] < self.max_retries:
+                self.stats["rate_limited"] += 1
+                entry[5] += 1
+                headers = getattr(e.response, "headers", None) or {}
+                retry_after = float(headers.get("Retry-After", 2 ** entry[5]))
+                # La route reste occupée pendant la pause : les autres routes continuent d'avancer.
+                await asyncio.sleep(retry_after)
+                if entry[3] is not None and entry[3] in state["merge"]:
+                    # Une version plus récente du message est arrivée pendant la pause.
+                    self.stats["merged"] += 1
+                    return
+                heapq.heappush(state["queue"], entry)
+                if entry[3] is not None:
+                    state["merge"][entry[3]] = entry
+                self._pending += 1
+                self.stats["pending_by_priority"][entry[0]] += 1
+            else:
+                self.stats["failed"] += 1
+                print(f"Échec de l'envoi vers {route} : {e}")
+        except Exception as e:
+            self.stats["failed"] += 1
+            print(f"Erreur inattendue lors de l'envoi vers {route} : {e}")
+
+
+# --- Limitation de débit ---
+
+class TokenBucket:
+    """Seau à jetons : `rate` jetons par seconde, au plus `capacity` accumulés (rafale autorisée)."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = max(rate, 0.01)
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Attend qu'un jeton soit disponible puis le consomme (les appelants sont servis dans l'ordre)."""
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self._updated is not None:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# --- Synchronisation des rôles ---
+
+class RoleSync:
+    """
+    Applique un état voulu des rôles (membre -> rôles à ajouter / à retirer) avec un seul appel par membre.
+    - Fusion : les demandes en attente pour un même membre sont regroupées ; la plus récente l'emporte sur un même rôle.
+    - Diff : la liste finale est calculée à partir des rôles en cache au moment de l'envoi ; aucun appel si rien ne change.
+    - Un membre à la fois : une demande arrivée pendant un envoi repart des rôles renvoyés par Discord, pas du cache.
+    - Débit : sémaphore (appels simultanés) + seau à jetons ; un 429 met la demande en pause le temps indiqué.
+    """
+
+    def __init__(self, max_concurrency: int = 4, rate: float = 5.0, burst: float = 10.0, max_retries: int = 3):
+        self.max_retries = max_retries
+        self._semaphore = asyncio.Semaphore(max(max_concurrency, 1))
+        self._bucket = TokenBucket(rate, burst)
+        self._pending: Dict[int, dict] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self.stats = {
+            "requested": 0, "merged": 0, "edits": 0, "unchanged": 0, "roles_added": 0, "roles_removed": 0,
+            "rate_limited": 0, "failed": 0
+        }
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def request(self, member: discord.Member, add=(), remove=(), reason: Optional[str] = None) -> asyncio.Future:
+        """Met en file un changement de rôles ; le futur renvoyé vaut True si un appel a modifié le membre."""
+        add = {role for role in add if role is not None}
+        remove = {role for role in remove if role is not None} - add
+        self.stats["requested"] += 1
+        entry = self._pending.get(member.id)
+        if entry:
+            self.stats["merged"] += 1
+            entry["member"] = member
+            entry["add"] = (entry["add"] - remove) | add
+            entry["remove"] = (entry["remove"] - add) | remove
+        else:
+            entry = {"member": member, "add": add, "remove": remove, "reasons": [], "future": asyncio.get_running_loop().create_future()}
+            self._pending[member.id] = entry
+        if reason and reason not in entry["reasons"]:
+            entry["reasons"].append(reason)
+        if member.id not in self._tasks:
+            self._tasks[member.id] = asyncio.create_task(self._run(member.id))
+        return entry["future"]
+
+    async def apply(self, changes: Dict[discord.Member, tuple], reason: Optional[str] = None) -> int:
+        """Applique `{membre: (rôles à ajouter, rôles à retirer)}` et retourne le nombre de membres modifiés."""
+        futures = [self.request(member, add, remove, reason) for member, (add, remove) in changes.items()]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        return sum(1 for result in results if result is True)
+
+    async def _run(self, member_id: int):
+        latest: Optional[discord.Member] = None
+        try:
+            while member_id in self._pending:
+                async with self._semaphore:
+                    await self._bucket.acquire()
+                    # Dernier moment pour fusionner : l'entrée n'est retirée qu'une fois le créneau d'envoi obtenu.
+                    entry = self._pending.pop(member_id)
+                    try:
+                        latest = await self._edit(latest or entry["member"], entry)
+                    except Exception as e:
+                        self.stats["failed"] += 1
+                        print(f"Erreur inattendue lors de la mise à jour des rôles de {member_id} : {e}")
+                        if not entry["future"].done():
+                            entry["future"].set_result(False)
+        finally:
+            self._tasks.pop(member_id, None)
+
+    async def _edit(self, member: discord.Member, entry: dict) -> discord.Member:
+        current = [role for role in member.roles if not role.is_default()]
+        current_ids = {role.id for role in current}
+        remove_ids = {role.id for role in entry["remove"]}
+        to_add = [role for role in entry["add"] if role.id not in current_ids]
+        target = [role for role in current if role.id not in remove_ids] + to_add
+        added, removed = len(to_add), len(current_ids & remove_ids)
+        future = entry["future"]
+        if not added and not removed:
+            self.stats["unchanged"] += 1
+            future.set_result(False)
+            return member
+
+        reason = "; ".join(entry["reasons"])[:512] or None
+        attempt = 0
+        while True:
+            try:
+                updated = await member.edit(roles=target, reason=reason)
+            except discord.Forbidden as e:
+                self.stats["failed"] += 1
+                print(f"Permissions insuffisantes pour modifier les rôles de {member.display_name} : {e}")
+                future.set_result(False)
+                return member
+            except discord.HTTPException as e:
+                if e.status == 429 and attempt < self.max_retries:
+                    self.stats["rate_limited"] += 1
+                    attempt += 1
+                    headers = getattr(e.response, "headers", None) or {}
+                    await asyncio.sleep(float(headers.get("Retry-After", 2 ** attempt)))
+                    continue
+                self.stats["failed"] += 1
+                print(f"Impossible de modifier les rôles de {member.display_name} : {e}")
+                future.set_result(False)
+                return member
+            break
+
+        self.stats["edits"] += 1
+        self.stats["roles_added"] += added
+        self.stats["roles_removed"] += removed
+        future.set_result(True)
+        return updated or member
+
+
+# --- Échéances ---
+
+class ExpiryScheduler:
+    """
+    Échéances `(timestamp, utilisateur, type)` dans un tas binaire. La boucle propriétaire dort jusqu'à la
+    plus proche échéance et est réveillée si une échéance plus proche est ajoutée entre-temps.
+    Une entrée devenue caduque (abonnement renouvelé...) est simplement ignorée par le traitement.
+    """
+    # Réveil de sécurité si l'horloge système est ajustée pendant une longue attente
+    MAX_SLEEP_SECONDS = 3600
+
+    def __init__(self):
+        self._heap: List[tuple] = []
+        self._wakeup = asyncio.Event()
+        self.stats = {"scheduled": 0, "fired": 0, "max_lateness_ms": 0.0}
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    @property
+    def next_deadline(self) -> Optional[float]:
+        return self._heap[0][0] if self._heap else None
+
+    def schedule(self, expires_at: float, user_id: str, kind: str):
+        entry = (expires_at, user_id, kind)
+        heapq.heappush(self._heap, entry)
+        self.stats["scheduled"] += 1
+        if self._heap[0] is entry:
+            self._wakeup.set()
+
+    def rebuild(self, entries: List[tuple]):
+        self._heap = list(entries)
+        heapq.heapify(self._heap)
+        self._wakeup.set()
+
+    async def wait(self):
+        """Attend la prochaine échéance (ou l'ajout d'une échéance plus proche)."""
+        self._wakeup.clear()
+        delay = self.MAX_SLEEP_SECONDS
+        if self._heap:
+            delay = min(delay, self._heap[0][0] - datetime.now(timezone.utc).timestamp())
+        if delay <= 0:
+            return
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    def pop_due(self, now: float) -> List[tuple]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap))
+        if due:
+            self.stats["fired"] += len(due)
+            self.stats["max_lateness_ms"] = max(self.stats["max_lateness_ms"], (now - due[0][0]) * 1000)
+        return due
+
+
+# --- Index de classement ---
+
+class _RankNode:
+    __slots__ = ("key", "priority", "size", "left", "right")
+
+    def __init__(self, key: tuple):
+        self.key = key
+        self.priority = random.random()
+        self.size = 1
+        self.left = None
+        self.right = None
+
+
+class RankIndex:
+    """
+    Arbre d'ordre statistique (treap augmenté de la taille des sous-arbres) sur une valeur par utilisateur.
+    Les clés sont `(-valeur, user_id)` : le rang 1 est la plus grande valeur, égalités départagées par id.
+    Mise à jour, rang d'un utilisateur et accès au i-ème élément en O(log n).
+    """
+
+    def __init__(self):
+        self._root: Optional[_RankNode] = None
+        self._values: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    @staticmethod
+    def _size(node: Optional[_RankNode]) -> int:
+        return node.size if node else 0
+
+    def _update_size(self, node: _RankNode):
+        node.size = 1 + self._size(node.left) + self._size(node.right)
+
+    def _split(self, node: Optional[_RankNode], key: tuple):
+        """Sépare en (clés < key, clés >= key)."""
+        if node is None:
+            return None, None
+        if node.key < key:
+            left, right = self._split(node.right, key)
+            node.right = left
+            self._update_size(node)
+            return node, right
+        left, right = self._split(node.left, key)
+        node.left = right
+        self._update_size(node)
+        return left, node
+
+    def _merge(self, left: Optional[_RankNode], right: Optional[_RankNode]) -> Optional[_RankNode]:
+        if left is None or right is None:
+            return left or right
+        if left.priority > right.priority:
+            left.right = self._merge(left.right, right)
+            self._update_size(left)
+            return left
+        right.left = self._merge(left, right.left)
+        self._update_size(right)
+        return right
+
+    def _erase(self, node: Optional[_RankNode], key: tuple) -> Optional[_RankNode]:
+        if node is None:
+            return None
+        if node.key == key:
+            return self._merge(node.left, node.right)
+        if key < node.key:
+            node.left = self._erase(node.left, key)
+        else:
+            node.right = self._erase(node.right, key)
+        self._update_size(node)
+        return node
+
+    def update(self, user_id: str, value: float):
+        previous = self._values.get(user_id)
+        if previous == value:
+            return
+        if previous is not None:
+            self._root = self._erase(self._root, (-previous, user_id))
+        self._values[user_id] = value
+        key = (-value, user_id)
+        left, right = self._split(self._root, key)
+        self._root = self._merge(self._merge(left, _RankNode(key)), right)
+
+    def remove(self, user_id: str):
+        previous = self._values.pop(user_id, None)
+        if previous is not None:
+            self._root = self._erase(self._root, (-previous, user_id))
+
+    def rebuild(self, values: Dict[str, float]):
+        """Reconstruit l'index en O(n log n) : arbre équilibré, priorités décroissantes par niveau."""
+        self._values = dict(values)
+        keys = sorted((-value, user_id) for user_id, value in self._values.items())
+
+        def build(low: int, high: int) -> Optional[_RankNode]:
+            if low >= high:
+                return None
+            middle = (low + high) // 2
+            node = _RankNode(keys[middle])
+            node.left = build(low, middle)
+            node.right = build(middle + 1, high)
+            node.size = high - low
+            return node
+
+        self._root = build(0, len(keys))
+        priorities = iter(sorted((random.random() for _ in keys), reverse=True))
+        level = [self._root] if self._root else []
+        while level:
+            for node in level:
+                node.priority = next(priorities)
+            level = [child for node in level for child in (node.left, node.right) if child]
+
+    def rank(self, user_id: str) -> Optional[int]:
+        """Rang (1 = premier) de l'utilisateur, ou None s'il n'est pas classé."""
+        value = self._values.get(user_id)
+        if value is None:
+            return None
+        key = (-value, user_id)
+        node, before = self._root, 0
+        while node:
+            if key < node.key:
+                node = node.left
+            elif key > node.key:
+                before += self._size(node.left) + 1
+                node = node.right
+            else:
+                return before + self._size(node.left) + 1
+        return None
+
+    def _select(self, index: int) -> tuple:
+        node = self._root
+        while node:
+            left_size = self._size(node.left)
+            if index < left_size:
+                node = node.left
+            elif index == left_size:
+                return node.key
+            else:
+                index -= left_size + 1
+                node = node.right
+        raise IndexError(index)
+
+    def page(self, offset: int, limit: int) -> List[tuple]:
+        """[(user_id, valeur)] pour les rangs offset+1 à offset+limit."""
+        end = min(offset + limit, len(self._values))
+        return [(key[1], -key[0]) for key in map(self._select, range(max(offset, 0), end))]
+
+    def top(self, k: int) -> List[tuple]:
+        return self.page(0, k)
+
+
+# --- Index des guildes ---
+
+class GuildIndex:
+    """
+    Index du système de guildes : nom normalisé (casefold) -> id, membres sous forme d'ensembles,
+    et classement XP des guildes officielles. La liste `members` des enregistrements reste le format
+    persisté ; elle est réécrite à partir de l'ensemble à chaque changement.
+    """
+
+    def __init__(self):
+        self.by_name: Dict[str, str] = {}
+        self.members: Dict[str, set] = {}
+        self.ranking = RankIndex()
+
+    @staticmethod
+    def name_key(name: str) -> str:
+        return name.casefold()
+
+    def rebuild(self, guild_data: dict):
+        self.by_name = {self.name_key(record["name"]): guild_id for guild_id, record in guild_data.items()}
+        self.members = {guild_id: set(record.get("members", [])) for guild_id, record in guild_data.items()}
+        self.ranking.rebuild({guild_id: record.get("total_xp", 0) for guild_id, record in guild_data.items() if record.get("status") == "official"})
+
+    def name_taken(self, name: str) -> bool:
+        return self.name_key(name) in self.by_name
+
+    def add(self, guild_id: str, record: dict):
+        self.by_name[self.name_key(record["name"])] = guild_id
+        self.members[guild_id] = set(record.get("members", []))
+        self.update_xp(guild_id, record)
+
+    def remove(self, guild_id: str, record: dict):
+        self.by_name.pop(self.name_key(record["name"]), None)
+        self.members.pop(guild_id, None)
+        self.ranking.remove(guild_id)
+
+    def reserve(self, name: str, guild_id: str) -> bool:
+        """Réserve un nom pour une guilde en cours de création (pas encore d'enregistrement). False s'il est pris."""
+        key = self.name_key(name)
+        if key in self.by_name:
+            return False
+        self.by_name[key] = guild_id
+        return True
+
+    def release(self, name: str, guild_id: str):
+        """Libère un nom réservé par `reserve` si la création a échoué."""
+        key = self.name_key(name)
+        if self.by_name.get(key) == guild_id:
+            del self.by_name[key]
+
+    def rename(self, guild_id: str, old_name: str, new_name: str):
+        self.by_name.pop(self.name_key(old_name), None)
+        self.by_name[self.name_key(new_name)] = guild_id
+
+    def add_member(self, guild_id: str, record: dict, user_id: str):
+        members = self.members.setdefault(guild_id, set())
+        members.add(user_id)
+        record["members"] = sorted(members)
+
+    def remove_member(self, guild_id: str, record: dict, user_id: str):
+        members = self.members.setdefault(guild_id, set())
+        members.discard(user_id)
+        record["members"] = sorted(members)
+
+    def member_count(self, guild_id: str) -> int:
+        return len(self.members.get(guild_id, ()))
+
+    def update_xp(self, guild_id: str, record: dict):
+        """Met à jour le classement ; seules les guildes officielles y figurent."""
+        if record.get("status") == "official":
+            self.ranking.update(guild_id, record.get("total_xp", 0))
+
+
 # --- Classes pour les Vues d'Interaction ---
 
 class MissionView(discord.ui.View):
@@ -66,7 +1597,7 @@ class MissionView(discord.ui.View):
         
         status_text = "activées" if new_status else "désactivées"
         await interaction.response.send_message(f"Vos notifications de mission par message privé sont maintenant {status_text}.", ephemeral=True)
-        await self.manager._save_json_data_async(self.manager.USER_DATA_FILE, self.manager.user_data)
+        self.manager.mark_dirty(self.manager.USER_DATA_FILE, user_id_str)
 
 
 class ChallengeSubmissionModal(discord.ui.Modal, title="Soumission de Défi"):
@@ -106,7 +1637,7 @@ class CashoutRequestView(discord.ui.View):
         await interaction.response.defer()
         msg_id = str(interaction.message.id)
         
-        async with self.manager.data_lock:
+        async with self.manager.locks.hold(pending=[f"cashout:{msg_id}"]):
             cashout_data = self.manager.pending_actions["cashouts"].get(msg_id)
             if not cashout_data:
                 button.disabled = True
@@ -123,9 +1654,7 @@ class CashoutRequestView(discord.ui.View):
             member = interaction.guild.get_member(cashout_data['user_id'])
             if member:
                 await self.manager.check_achievements(member)
-                try:
-                    await member.send(f"✅ Votre demande de retrait de `{cashout_data['euros_to_send']:.2f}€` a été approuvée ! Le paiement sera effectué sous peu sur l'adresse `{cashout_data['paypal_email']}`.")
-                except discord.Forbidden: pass
+                self.manager.outbound.notify(member, OutboundDispatcher.DM, f"✅ Votre demande de retrait de `{cashout_data['euros_to_send']:.2f}€` a été approuvée ! Le paiement sera effectué sous peu sur l'adresse `{cashout_data['paypal_email']}`.")
                 
                 # --- Logique de Commission de Second Niveau ---
                 if user_data.get("referrer"):
@@ -148,9 +1677,7 @@ class CashoutRequestView(discord.ui.View):
                             f"**Montant :** `{commission_earned:.2f}` crédits\n**Source :** Retrait de `{member.display_name}`",
                             discord.Color.from_rgb(0, 255, 255) # Cyan
                         )
-                        try:
-                            await referrer.send(f"💎 Votre filleul {member.display_name} a effectué un retrait ! En tant que Parrain Pro, vous gagnez **{commission_earned:.2f} crédits** de commission.")
-                        except discord.Forbidden: pass
+                        self.manager.outbound.notify(referrer, OutboundDispatcher.DM, f"💎 Votre filleul {member.display_name} a effectué un retrait ! En tant que Parrain Pro, vous gagnez **{commission_earned:.2f} crédits** de commission.")
 
             await self.manager.log_public_transaction(
                 interaction.guild,
@@ -169,7 +1696,8 @@ class CashoutRequestView(discord.ui.View):
             await interaction.message.edit(embed=embed, view=self)
 
             del self.manager.pending_actions["cashouts"][msg_id]
-            await self.manager._save_json_data_async(self.manager.PENDING_ACTIONS_FILE, self.manager.pending_actions)
+            self.manager.mark_dirty(self.manager.PENDING_ACTIONS_FILE, ("cashouts", msg_id), urgent=True)
+            self.manager.mark_dirty(self.manager.USER_DATA_FILE, user_id_str)
         
         await interaction.followup.send("Demande approuvée.", ephemeral=True)
 
@@ -179,7 +1707,7 @@ class CashoutRequestView(discord.ui.View):
         await interaction.response.defer()
         msg_id = str(interaction.message.id)
 
-        async with self.manager.data_lock:
+        async with self.manager.locks.hold(pending=[f"cashout:{msg_id}"]):
             cashout_data = self.manager.pending_actions["cashouts"].get(msg_id)
             if not cashout_data:
                 button.disabled = True
@@ -199,9 +1727,7 @@ class CashoutRequestView(discord.ui.View):
             
             member = interaction.guild.get_member(cashout_data['user_id'])
             if member:
-                try:
-                    await member.send(f"❌ Votre demande de retrait a été refusée par le staff. Vos `{cashout_data['credit_to_deduct']:.2f}` crédits vous ont été remboursés.")
-                except discord.Forbidden: pass
+                self.manager.outbound.notify(member, OutboundDispatcher.DM, f"❌ Votre demande de retrait a été refusée par le staff. Vos `{cashout_data['credit_to_deduct']:.2f}` crédits vous ont été remboursés.")
             
             embed = interaction.message.embeds[0]
             embed.color = discord.Color.red()
@@ -213,7 +1739,8 @@ class CashoutRequestView(discord.ui.View):
             await interaction.message.edit(embed=embed, view=self)
 
             del self.manager.pending_actions["cashouts"][msg_id]
-            await self.manager._save_json_data_async(self.manager.PENDING_ACTIONS_FILE, self.manager.pending_actions)
+            self.manager.mark_dirty(self.manager.PENDING_ACTIONS_FILE, ("cashouts", msg_id), urgent=True)
+            self.manager.mark_dirty(self.manager.USER_DATA_FILE, user_id_str)
 
         await interaction.followup.send("Demande refusée et crédits remboursés.", ephemeral=True)
 
@@ -332,20 +1859,82 @@ class ManagerCog(commands.Cog):
     PENDING_ACTIONS_FILE = 'data/pending_actions.json'
     GUILD_DATA_FILE = 'data/guild_data.json'
 
+    BOT_STATE_FILE = 'data/bot_state.json'
+
+    # Champs classés par les index de classement (/classement, /affiliation, carte de profil, podiums)
+    RANKED_FIELDS = ("xp", "weekly_xp", "affiliate_earnings", "weekly_affiliate_earnings")
+    # Compteurs hebdomadaires : remis à zéro au premier accès d'une nouvelle semaine (voir `_roll_weekly`)
+    WEEKLY_FIELDS = ("weekly_xp", "weekly_affiliate_earnings")
+
+    # Fichiers gérés par la persistance différée -> attribut contenant les données
+    PERSISTED_STORES = {
+        USER_DATA_FILE: "user_data",
+        GUILD_DATA_FILE: "guild_data",
+        PENDING_ACTIONS_FILE: "pending_actions",
+        BOT_STATE_FILE: "bot_state",
+    }
+
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.data_lock = asyncio.Lock()
+        self.locks = LockManager()
         
         self.config = {}
+        self.level_curve = LevelCurve(150, 1.6)
+        self.boost_resolver = BoostResolver({})
         self.products = []
         self.achievements = []
+        self.achievement_index = AchievementIndex([])
+        self._touched_counters: Dict[str, set] = {}
+        self.mission_index = MissionIndex()
         self.knowledge_base = {}
         self.user_data = {}
+        self.rankings: Dict[str, RankIndex] = {field: RankIndex() for field in self.RANKED_FIELDS}
+        self.guild_index = GuildIndex()
+        # Index inverse des parrainages : parrain -> ensemble de ses filleuls
+        self.referees: Dict[str, set] = {}
+        # Index hebdomadaires de la semaine écoulée (podiums) et semaine couverte par les index courants
+        self.last_week_rankings: Dict[str, RankIndex] = {field: RankIndex() for field in self.WEEKLY_FIELDS}
+        self._ranking_week = week_epoch()
         self.guild_data = {}
-        self.invites_cache = {}
+        # Invitations connues par serveur : code -> (utilisations, id de l'inviteur, utilisations max)
+        self.invites_cache: Dict[int, Dict[str, tuple]] = {}
+        self._join_queue: asyncio.Queue = asyncio.Queue()
+        self._invite_task: Optional[asyncio.Task] = None
+        self.invite_stats = {"joins": 0, "attributed": 0, "attributed_by_order": 0, "unattributed": 0, "fetches": 0, "largest_burst": 0}
         self.current_challenge: Optional[Dict[str, Any]] = None
         self.pending_actions = {}
+        self.bot_state = {}
+
+        # --- Persistance différée (write-behind) ---
+        self._dirty_records: Dict[str, set] = {}
+        self._full_dirty: set = set()
+        self._save_requests: Dict[str, int] = {}
+        self._flush_event = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self.storage = JsonStorageBackend(self)
+        self.journal: Optional[EventJournal] = None
+        self.persistence_stats = {
+            "flushes": 0, "bytes_written": 0, "coalesced_writes": 0,
+            "save_requests": 0, "failed_flushes": 0, "last_flush_ms": 0.0
+        }
+
+        # --- Ingestion des messages par micro-lots ---
+        self._message_queue: Optional[asyncio.Queue] = None
+        self._ingestion_task: Optional[asyncio.Task] = None
+        self.outbound = OutboundDispatcher()
+        self.weekly_rollover_report: Optional[Dict[str, Any]] = None
+        self.role_sync = RoleSync()
+        self.card_renderer = ProfileRenderer()
+        self.role_reconcile_report: Optional[Dict[str, Any]] = None
+        self._mission_fanout_task: Optional[asyncio.Task] = None
+        self.expiry = ExpiryScheduler()
+        self._expiry_task: Optional[asyncio.Task] = None
+        self.ingestion_stats = {
+            "queued": 0, "dropped": 0, "batches": 0, "processed": 0,
+            "last_batch_size": 0, "last_batch_ms": 0.0, "max_batch_ms": 0.0, "last_latency_ms": 0.0
+        }
         
         if not IMAGING_AVAILABLE:
             print("⚠️ ATTENTION: La librairie 'Pillow' est manquante. La commande /profil utilisera un embed standard.")
@@ -365,17 +1954,59 @@ class ManagerCog(commands.Cog):
     async def cog_load(self):
         print("Chargement des données du ManagerCog...")
         await self._load_all_data()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        outbound_config = self.config.get("OUTBOUND_CONFIG", {})
+        self.outbound = OutboundDispatcher(
+            outbound_config.get("MAX_CONCURRENCY", 4),
+            outbound_config.get("MAX_PENDING", 5000),
+            outbound_config.get("MAX_RETRIES", 3)
+        )
+        self.outbound.start()
+        role_sync_config = self.config.get("ROLE_SYNC", {})
+        self.role_sync = RoleSync(
+            role_sync_config.get("MAX_CONCURRENCY", 4),
+            role_sync_config.get("RATE_PER_SECOND", 5),
+            role_sync_config.get("BURST", 10)
+        )
+        card_config = self.config.get("PROFILE_CARD_CONFIG", {})
+        render_config = card_config.get("RENDER", {})
+        self.card_renderer = ProfileRenderer(
+            render_config.get("MAX_WORKERS", 2),
+            render_config.get("MAX_PENDING", 8),
+            render_config.get("USE_PROCESSES", True),
+            int(card_config.get("ASSET_CACHE_MAX_MB", 16) * 1024 * 1024)
+        )
+        ingestion_config = self.config.get("GAMIFICATION_CONFIG", {}).get("XP_SYSTEM", {}).get("INGESTION", {})
+        self._message_queue = asyncio.Queue(maxsize=ingestion_config.get("MAX_QUEUE_SIZE", 10000))
+        self._ingestion_task = asyncio.create_task(self._message_ingestion_loop())
+        self._invite_task = asyncio.create_task(self._invite_tracker_loop())
         self.bot.add_view(VerificationView(self))
         self.bot.add_view(TicketCreationView(self))
         self.bot.add_view(TicketCloseView(self))
         self.bot.add_view(CashoutRequestView(self))
         self.bot.add_view(MissionView(self))
 
-    def cog_unload(self):
+    async def cog_unload(self):
         self.weekly_leaderboard_task.cancel()
         self.mission_assignment_task.cancel()
-        self.check_expired_subscriptions_task.cancel()
-        self.check_expired_boosts_task.cancel()
+        self.reward_roles_reconcile_task.cancel()
+        if self._expiry_task:
+            self._expiry_task.cancel()
+        if self._ingestion_task:
+            self._ingestion_task.cancel()
+        if self._mission_fanout_task:
+            self._mission_fanout_task.cancel()
+        if self._invite_task:
+            self._invite_task.cancel()
+        await self.outbound.drain(5)
+        await self.outbound.close()
+        self.card_renderer.close()
+        if self._flush_task:
+            self._flush_task.cancel()
+        await self.flush_pending_writes()
+        if self.journal:
+            self.journal.close()
+        self.storage.close()
         print("ManagerCog déchargé.")
 
     @commands.Cog.listener()
@@ -400,14 +2031,17 @@ class ManagerCog(commands.Cog):
             if not self.mission_assignment_task.is_running():
                 self.mission_assignment_task.start()
                 print("Tâche de fond 'mission_assignment_task' démarrée.")
-            if not self.check_expired_subscriptions_task.is_running():
-                self.check_expired_subscriptions_task.start()
-                print("Tâche de fond 'check_expired_subscriptions_task' démarrée.")
-            if not self.check_expired_boosts_task.is_running():
-                self.check_expired_boosts_task.start()
-                print("Tâche de fond 'check_expired_boosts_task' démarrée.")
+            if not self.reward_roles_reconcile_task.is_running():
+                self.reward_roles_reconcile_task.change_interval(hours=self.config.get("ROLE_SYNC", {}).get("RECONCILE_INTERVAL_HOURS", 6))
+                self.reward_roles_reconcile_task.start()
+                print("Tâche de fond 'reward_roles_reconcile_task' démarrée.")
+            if not self._expiry_task or self._expiry_task.done():
+                self._expiry_task = asyncio.create_task(self._expiry_loop())
+                print("Planificateur des expirations (boosters, abonnements) démarré.")
         except Exception as e:
             print(f"Erreur au démarrage des tâches de fond: {e}")
+        # Reprise d'un envoi des missions interrompu par un redémarrage
+        self._start_mission_fanout()
 
     async def _load_json_data_async(self, file_path: str) -> any:
         if not os.path.exists(file_path):
@@ -418,7 +2052,7 @@ class ManagerCog(commands.Cog):
             default_content = '{}'
             if 'pending_actions' in file_path:
                 default_content = '{"transactions": {}, "cashouts": {}}'
-            elif any(x in file_path for x in ['user_data', 'challenge', 'guild_data']):
+            elif any(x in file_path for x in ['user_data', 'challenge', 'guild_data', 'bot_state']):
                 default_content = '{}'
             else:
                 default_content = '[]'
@@ -436,28 +2070,145 @@ class ManagerCog(commands.Cog):
             print(f"Erreur lors du chargement de {file_path}: {e}")
             return {} if any(x in file_path for x in ['user_data', 'guild_data']) else []
 
-    async def _save_json_data_async(self, file_path: str, data: any):
-        async with self.data_lock:
+    async def _save_json_data_async(self, file_path: str, data: any) -> Optional[int]:
+        """Écrit immédiatement un fichier JSON. Retourne le nombre d'octets écrits, ou None en cas d'échec."""
+        try:
+            loop = asyncio.get_running_loop()
+            # Snapshot sur la boucle, d'un seul tenant (encodeur C, sans indentation) : aucune modification
+            # ne peut s'intercaler. La mise en forme indentée, plus lente, est faite sur ce texte figé.
+            snapshot = json.dumps(data, ensure_ascii=False)
+            json_string = await loop.run_in_executor(
+                None, lambda: json.dumps(json.loads(snapshot), indent=2, ensure_ascii=False)
+            )
+            # Écriture dans un fichier temporaire puis remplacement atomique :
+            # un arrêt brutal pendant la sauvegarde ne corrompt jamais le fichier existant.
+            tmp_path = f"{file_path}.tmp"
+            async with aiofiles.open(tmp_path, 'w', encoding='utf-8') as f:
+                await f.write(json_string)
+            await loop.run_in_executor(None, _durable_replace, tmp_path, file_path)
+            return len(json_string.encode('utf-8'))
+        except Exception as e:
+            print(f"Erreur lors de la sauvegarde de {file_path}: {e}")
+            return None
+
+    def mark_dirty(self, file_path: str, *keys: Any, urgent: bool = False):
+        """
+        Marque des enregistrements comme modifiés. L'écriture est différée et regroupée
+        par la tâche de fond (intervalle ou seuil de modifications atteint).
+        Sans clé, tout le fichier est considéré comme modifié.
+        """
+        self.persistence_stats["save_requests"] += 1
+        self._save_requests[file_path] = self._save_requests.get(file_path, 0) + 1
+        dirty = self._dirty_records.setdefault(file_path, set())
+        if keys:
+            dirty.update(keys)
+        else:
+            self._full_dirty.add(file_path)
+
+        threshold = self.config.get("PERSISTENCE_CONFIG", {}).get("DIRTY_THRESHOLD", 200)
+        dirty_count = sum(len(records) for records in self._dirty_records.values()) + len(self._full_dirty)
+        if urgent or dirty_count >= threshold:
+            self._flush_event.set()
+
+    async def flush_pending_writes(self):
+        """Écrit tous les fichiers modifiés depuis le dernier passage."""
+        async with self._flush_lock:
+            if self.journal:
+                await self.journal.commit()
+            if not self._dirty_records:
+                return
+            dirty, self._dirty_records = self._dirty_records, {}
+            full, self._full_dirty = self._full_dirty, set()
+            requests, self._save_requests = self._save_requests, {}
+
+            # Le snapshot des utilisateurs couvre tous les événements journalisés jusqu'ici :
+            # on scelle le segment actif, il sera supprimé si la sauvegarde réussit.
+            # Les utilisateurs sont sauvegardés en premier : les backends sérialisent avant leur premier `await`,
+            # le snapshot est donc pris dans la même étape que le scellement.
+            sealed_segment = None
+            if self.journal and self.USER_DATA_FILE in dirty:
+                sealed_segment = self.journal.seal()
+
+            start = asyncio.get_running_loop().time()
+            for file_path, keys in sorted(dirty.items(), key=lambda item: item[0] != self.USER_DATA_FILE):
+                data = getattr(self, self.PERSISTED_STORES.get(file_path, ""), None)
+                if data is None:
+                    continue
+                written = await self.storage.save(file_path, data, keys, file_path in full)
+                if file_path == self.USER_DATA_FILE and sealed_segment is not None:
+                    await self.journal.sync_sealed()
+                if written is None:
+                    # Échec : on remet les enregistrements en attente pour le prochain passage
+                    self.persistence_stats["failed_flushes"] += 1
+                    self._dirty_records.setdefault(file_path, set()).update(keys)
+                    if file_path in full:
+                        self._full_dirty.add(file_path)
+                    self._save_requests[file_path] = self._save_requests.get(file_path, 0) + requests.get(file_path, 0)
+                    continue
+                self.persistence_stats["flushes"] += 1
+                self.persistence_stats["bytes_written"] += written
+                self.persistence_stats["coalesced_writes"] += max(0, requests.get(file_path, 1) - 1)
+                if file_path == self.USER_DATA_FILE and sealed_segment is not None:
+                    self.journal.discard_sealed(sealed_segment)
+            self.persistence_stats["last_flush_ms"] = (asyncio.get_running_loop().time() - start) * 1000
+
+    async def _flush_loop(self):
+        """Tâche de fond : vide les écritures en attente à intervalle régulier ou dès que le seuil est atteint."""
+        while True:
+            interval = self.config.get("PERSISTENCE_CONFIG", {}).get("FLUSH_INTERVAL_SECONDS", 10)
             try:
-                loop = asyncio.get_running_loop()
-                json_string = await loop.run_in_executor(
-                    None, lambda: json.dumps(data, indent=2, ensure_ascii=False)
-                )
-                async with aiofiles.open(file_path, 'w', encoding='utf-8') as f:
-                    await f.write(json_string)
+                await asyncio.wait_for(self._flush_event.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            try:
+                await self.flush_pending_writes()
             except Exception as e:
-                print(f"Erreur lors de la sauvegarde de {file_path}: {e}")
+                print(f"Erreur lors de l'écriture différée des données: {e}")
+                traceback.print_exc()
     
+    async def _init_storage(self):
+        """Choisit le moteur de stockage selon PERSISTENCE_CONFIG.BACKEND ("json" par défaut, ou "sqlite")."""
+        persistence_config = self.config.get("PERSISTENCE_CONFIG", {})
+        if persistence_config.get("BACKEND", "json") == "sqlite":
+            try:
+                backend = SQLiteStorageBackend(persistence_config.get("SQLITE_PATH", "data/bot.sqlite3"))
+                await backend.migrate_from_json(self, list(self.PERSISTED_STORES.keys()))
+                self.storage = backend
+                print(f"✅ Stockage SQLite (WAL) actif : {backend.db_path}")
+                return
+            except Exception as e:
+                print(f"Erreur lors de l'initialisation du stockage SQLite, retour au JSON : {e}")
+                traceback.print_exc()
+        self.storage = JsonStorageBackend(self)
+
+    def _build_config_tables(self):
+        """Précalcule les structures dérivées de la configuration (courbe de niveaux, paliers de bonus)."""
+        xp_config = self.config.get("GAMIFICATION_CONFIG", {}).get("XP_SYSTEM", {})
+        self.level_curve = LevelCurve(
+            xp_config.get("LEVEL_UP_FORMULA_BASE_XP", 150),
+            xp_config.get("LEVEL_UP_FORMULA_MULTIPLIER", 1.6)
+        )
+        self.boost_resolver = BoostResolver(self.config)
+
     async def _load_all_data(self):
+        try:
+            self.config = await self._load_json_data_async(self.CONFIG_FILE)
+        except Exception as e:
+            print(f"Erreur critique lors du chargement du fichier pour 'config': {e}")
+            self.config = {}
+        self._build_config_tables()
+        await self._init_storage()
+
         tasks = {
-            "config": self._load_json_data_async(self.CONFIG_FILE),
             "products": self._load_json_data_async(self.PRODUCTS_FILE),
             "achievements": self._load_json_data_async(self.ACHIEVEMENTS_FILE),
             "knowledge_base": self._load_json_data_async(self.KNOWLEDGE_BASE_FILE),
-            "user_data": self._load_json_data_async(self.USER_DATA_FILE),
-            "guild_data": self._load_json_data_async(self.GUILD_DATA_FILE),
+            "user_data": self.storage.load(self.USER_DATA_FILE),
+            "guild_data": self.storage.load(self.GUILD_DATA_FILE),
             "current_challenge": self._load_json_data_async(self.CURRENT_CHALLENGE_FILE),
-            "pending_actions": self._load_json_data_async(self.PENDING_ACTIONS_FILE)
+            "pending_actions": self.storage.load(self.PENDING_ACTIONS_FILE),
+            "bot_state": self.storage.load(self.BOT_STATE_FILE)
         }
         results = await asyncio.gather(*tasks.values(), return_exceptions=True)
         
@@ -467,14 +2218,128 @@ class ManagerCog(commands.Cog):
             if isinstance(result, Exception):
                 print(f"Erreur critique lors du chargement du fichier pour '{name}': {result}")
                 default_val = []
-                if name in ['user_data', 'guild_data', 'current_challenge', 'pending_actions', 'knowledge_base']:
+                if name in ['user_data', 'guild_data', 'current_challenge', 'pending_actions', 'knowledge_base', 'bot_state']:
                     default_val = {}
                 setattr(self, name, default_val)
             else:
                  setattr(self, name, result)
 
+        self.achievement_index = AchievementIndex(self.achievements)
+        # Nouvel index : chaque utilisateur repasse par une vérification complète.
+        self._touched_counters.clear()
+        self._init_journal()
+        self._stamp_weekly_epochs()
+        self._build_rankings()
+        self.mission_index.rebuild(self.user_data)
+        self.guild_index.rebuild(self.guild_data)
+        self._build_referral_index()
+        self._build_expiry_schedule()
         print("Toutes les données de configuration ont été chargées.")
 
+    def _build_rankings(self):
+        epoch = week_epoch()
+        self._ranking_week = epoch
+        for field, index in self.rankings.items():
+            if field not in self.WEEKLY_FIELDS:
+                index.rebuild({user_id: data.get(field, 0) for user_id, data in self.user_data.items()})
+                continue
+            # Index hebdomadaires : seuls les compteurs de la semaine en cours (resp. écoulée) y figurent
+            current, previous = {}, {}
+            for user_id, data in self.user_data.items():
+                last_week = data.get("last_week") or {}
+                if data.get("weekly_epoch") == epoch:
+                    current[user_id] = data.get(field, 0)
+                    if last_week.get("epoch") == epoch - 1:
+                        previous[user_id] = last_week.get(field, 0)
+                elif data.get("weekly_epoch") == epoch - 1:
+                    previous[user_id] = data.get(field, 0)
+            index.rebuild(current)
+            self.last_week_rankings[field].rebuild(previous)
+
+    def _build_referral_index(self):
+        self.referees = {}
+        for user_id, data in self.user_data.items():
+            if data.get("referrer"):
+                self.referees.setdefault(data["referrer"], set()).add(user_id)
+
+    def _stamp_weekly_epochs(self):
+        """Migration unique : rattache les compteurs hebdomadaires existants (sans numéro de semaine) à la semaine en cours."""
+        epoch = week_epoch()
+        stamped = False
+        for store in (self.user_data, self.guild_data):
+            for record in store.values():
+                if "weekly_epoch" not in record:
+                    record["weekly_epoch"] = epoch
+                    stamped = True
+                if record.get("affiliate_booster") and "affiliate_booster_epoch" not in record:
+                    record["affiliate_booster_epoch"] = epoch
+                    stamped = True
+        if stamped:
+            self.mark_dirty(self.USER_DATA_FILE)
+            self.mark_dirty(self.GUILD_DATA_FILE)
+
+    # --- Compteurs hebdomadaires ---
+
+    def _advance_ranking_week(self, epoch: int):
+        """Bascule les index hebdomadaires sur une nouvelle semaine en O(1) : l'index courant devient celui de la semaine écoulée."""
+        if epoch <= self._ranking_week:
+            return
+        for field in self.WEEKLY_FIELDS:
+            self.last_week_rankings[field] = self.rankings[field] if epoch == self._ranking_week + 1 else RankIndex()
+            self.rankings[field] = RankIndex()
+        self._ranking_week = epoch
+
+    def current_week(self) -> int:
+        """Semaine en cours ; le premier appel d'une nouvelle semaine bascule les index hebdomadaires."""
+        epoch = week_epoch()
+        self._advance_ranking_week(epoch)
+        return epoch
+
+    def _roll_weekly(self, record: dict, epoch: int, fields: tuple = WEEKLY_FIELDS) -> bool:
+        """
+        Remet à zéro les compteurs hebdomadaires d'un enregistrement (utilisateur ou guilde) datant d'une
+        semaine antérieure à `epoch`. Les valeurs de la semaine écoulée restent dans `last_week` pour le podium.
+        """
+        stored = record.get("weekly_epoch", epoch)
+        if stored >= epoch:
+            return False
+        record["last_week"] = {"epoch": stored, **{field: record.get(field, 0) for field in fields}} if stored == epoch - 1 else None
+        for field in fields:
+            record[field] = 0
+        record["weekly_epoch"] = epoch
+        return True
+
+    def weekly_value(self, record: dict, field: str) -> float:
+        """Valeur d'un compteur hebdomadaire, nulle si elle date d'une semaine antérieure."""
+        return record.get(field, 0) if record.get("weekly_epoch") == week_epoch() else 0
+
+    def _init_journal(self):
+        """Ouvre le journal des transactions et rejoue les événements postérieurs au dernier snapshot."""
+        journal_config = self.config.get("PERSISTENCE_CONFIG", {}).get("JOURNAL", {})
+        if not journal_config.get("ENABLED", False):
+            return
+        journal = EventJournal(
+            journal_config.get("PATH", "data/journal.log"),
+            journal_config.get("FSYNC_INTERVAL_MS", 200),
+            journal_config.get("FSYNC_BATCH_SIZE", 64)
+        )
+        last_seq = max((data.get("journal_seq", 0) for data in self.user_data.values()), default=0)
+        replayed_users = set()
+        for event in journal.read_events():
+            last_seq = max(last_seq, event["s"])
+            user_id = event["u"]
+            # Chaque utilisateur mémorise le dernier événement appliqué : rien n'est rejoué deux fois
+            if user_id in self.user_data and self.user_data[user_id].get("journal_seq", 0) >= event["s"]:
+                continue
+            self._apply_transaction(user_id, event["t"], event["a"], event["d"], event["ts"], event["s"])
+            replayed_users.add(user_id)
+        journal.stats["replayed"] = len(replayed_users)
+        journal.open(last_seq)
+        self.journal = journal
+        if replayed_users:
+            print(f"Journal : transactions rejouées pour {len(replayed_users)} utilisateur(s).")
+            self.mark_dirty(self.USER_DATA_FILE, *replayed_users, urgent=True)
+
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
         if message.author.bot or not message.guild:
@@ -484,13 +2349,89 @@ class ManagerCog(commands.Cog):
         if len(message.content.split()) < xp_config.get("ANTI_FARM_MIN_WORDS", 0):
             return
 
-        user_id_str = str(message.author.id)
-        self.initialize_user_data(user_id_str)
-        
-        if xp_config.get("ENABLED", False):
-            await self.grant_xp(message.author, "message", f"Message dans #{message.channel.name}")
-        
-        await self.update_mission_progress(message.author, "send_message", 1)
+        # Le traitement (XP, niveaux, succès, missions) est fait par lots dans `_message_ingestion_loop` :
+        # le gestionnaire d'événements ne fait qu'empiler et rend la main immédiatement.
+        if self._message_queue is None:
+            return
+        try:
+            self._message_queue.put_nowait((message.author, message.channel.name, datetime.now().timestamp()))
+            self.ingestion_stats["queued"] += 1
+        except asyncio.QueueFull:
+            self.ingestion_stats["dropped"] += 1
+
+    async def _message_ingestion_loop(self):
+        """Vide la file des messages par micro-lots (intervalle ou taille maximale atteinte)."""
+        ingestion_config = self.config.get("GAMIFICATION_CONFIG", {}).get("XP_SYSTEM", {}).get("INGESTION", {})
+        interval = ingestion_config.get("BATCH_INTERVAL_MS", 250) / 1000
+        max_batch_size = ingestion_config.get("MAX_BATCH_SIZE", 500)
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._message_queue.get()]
+            deadline = loop.time() + interval
+            while len(batch) < max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._message_queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            start = loop.time()
+            try:
+                await self._process_message_batch(batch)
+            except Exception as e:
+                print(f"Erreur lors du traitement d'un lot de {len(batch)} messages : {e}")
+                traceback.print_exc()
+            batch_ms = (loop.time() - start) * 1000
+            stats = self.ingestion_stats
+            stats["batches"] += 1
+            stats["processed"] += len(batch)
+            stats["last_batch_size"] = len(batch)
+            stats["last_batch_ms"] = batch_ms
+            stats["max_batch_ms"] = max(stats["max_batch_ms"], batch_ms)
+            stats["last_latency_ms"] = (datetime.now().timestamp() - batch[0][2]) * 1000
+
+    async def _process_message_batch(self, batch: list):
+        """Regroupe un lot par membre : un gain d'XP, une mise à jour de mission et une sauvegarde par membre."""
+        xp_config = self.config.get("GAMIFICATION_CONFIG", {}).get("XP_SYSTEM", {})
+        per_user: Dict[str, list] = {}
+        for author, channel_name, timestamp in batch:
+            entry = per_user.setdefault(str(author.id), [author, channel_name, []])
+            entry[0], entry[1] = author, channel_name
+            entry[2].append(timestamp)
+
+        for user_id_str, (member, channel_name, timestamps) in per_user.items():
+            self.initialize_user_data(user_id_str)
+            self.ensure_missions(user_id_str, member)
+            if xp_config.get("ENABLED", False):
+                await self._grant_message_xp(member, timestamps, channel_name, xp_config)
+            await self.update_mission_progress(member, "send_message", len(timestamps))
+
+        self.mark_dirty(self.USER_DATA_FILE, *per_user.keys())
+
+    async def _grant_message_xp(self, member: discord.Member, timestamps: List[float], channel_name: str, xp_config: dict):
+        """Applique le délai anti-farm à tous les messages du lot puis accorde l'XP cumulée en une fois."""
+        user_id_str = str(member.id)
+        user_data = self.user_data[user_id_str]
+        if user_data.get("xp_gated", False):
+            return
+
+        cooldown = xp_config["ANTI_FARM_COOLDOWN_SECONDS"]
+        last_rewarded = user_data.get("last_message_timestamp", 0)
+        rewarded, xp_to_add = 0, 0
+        for timestamp in timestamps:
+            if timestamp - last_rewarded >= cooldown:
+                rewarded += 1
+                xp_to_add += random.randint(*xp_config["XP_PER_MESSAGE"])
+                last_rewarded = timestamp
+        if not rewarded:
+            return
+
+        user_data["last_message_timestamp"] = last_rewarded
+        reason = f"Message dans #{channel_name}" if rewarded == 1 else f"{rewarded} messages (dernier dans #{channel_name})"
+        await self.add_transaction(user_id_str, "message_count", rewarded, reason)
+        await self.grant_xp(member, xp_to_add, reason)
 
 
     @commands.Cog.listener()
@@ -507,35 +2448,127 @@ class ManagerCog(commands.Cog):
                     print(f"Permissions manquantes pour assigner le rôle '{unverified_role_name}' à {member.name}")
 
         self.initialize_user_data(str(member.id))
-        old_invites = self.invites_cache.get(member.guild.id, {})
-        new_invites = await member.guild.invites()
-        inviter = None
-        for invite in new_invites:
-            if invite.code in old_invites and invite.uses > old_invites[invite.code].uses:
-                inviter = invite.inviter
-                break
-        if inviter and inviter.id != member.id:
-            user_id_str = str(member.id)
-            self.initialize_user_data(str(inviter.id))
-            self.user_data[user_id_str]["referrer"] = str(inviter.id)
-            
-            await self.add_transaction(
-                str(inviter.id),
-                "referral_count", 1, f"Parrainage de {member.name}"
-            )
-
-            print(f"{member.name} a été invité par {inviter.name}")
-            await self._save_json_data_async(self.USER_DATA_FILE, self.user_data)
-
-        await self._update_invite_cache(member.guild)
+        # L'attribution du parrain est faite par `_invite_tracker_loop`, une seule lecture des invitations par rafale.
+        self._join_queue.put_nowait(member)
 
     @commands.Cog.listener()
     async def on_invite_create(self, invite: discord.Invite):
-        await self._update_invite_cache(invite.guild)
+        # Mise à jour locale depuis l'événement : aucune requête vers Discord.
+        if invite.guild:
+            self.invites_cache.setdefault(invite.guild.id, {})[invite.code] = (
+                invite.uses or 0, invite.inviter.id if invite.inviter else None, invite.max_uses or 0
+            )
 
     @commands.Cog.listener()
     async def on_invite_delete(self, invite: discord.Invite):
-        await self._update_invite_cache(invite.guild)
+        # L'entrée est gardée jusqu'au prochain relevé : une invitation supprimée parce qu'elle a atteint
+        # son nombre maximal d'utilisations doit encore pouvoir expliquer l'arrivée en attente.
+        pass
+
+    async def _invite_tracker_loop(self):
+        """
+        Traite les arrivées par rafales : après la première arrivée, on attend `BATCH_WINDOW_MS` pour regrouper
+        les suivantes, puis une seule lecture des invitations par serveur sert à attribuer toute la rafale.
+        Après une rafale ambiguë (plusieurs inviteurs), les arrivées sont traitées une par une, avec une lecture
+        par membre, pendant `SEQUENTIAL_MODE_SECONDS`.
+        """
+        tracking_config = self.config.get("INVITE_TRACKING", {})
+        window = tracking_config.get("BATCH_WINDOW_MS", 1000) / 1000
+        sequential_seconds = tracking_config.get("SEQUENTIAL_MODE_SECONDS", 60)
+        loop = asyncio.get_running_loop()
+        sequential_until = 0.0
+        while True:
+            burst = [await self._join_queue.get()]
+            if loop.time() >= sequential_until:
+                await asyncio.sleep(window)
+                while not self._join_queue.empty():
+                    burst.append(self._join_queue.get_nowait())
+            self.invite_stats["joins"] += len(burst)
+            self.invite_stats["largest_burst"] = max(self.invite_stats["largest_burst"], len(burst))
+
+            by_guild: Dict[int, list] = {}
+            for member in burst:
+                by_guild.setdefault(member.guild.id, []).append(member)
+            for members in by_guild.values():
+                try:
+                    if await self._attribute_joins(members[0].guild, members):
+                        sequential_until = loop.time() + sequential_seconds
+                except Exception as e:
+                    print(f"Erreur lors de l'attribution des parrainages : {e}")
+                    traceback.print_exc()
+
+    async def _attribute_joins(self, guild: discord.Guild, members: list) -> bool:
+        """
+        Attribue les arrivées aux inviteurs d'après l'écart d'utilisations entre deux relevés des invitations.
+        Retourne True si la rafale était ambiguë (plusieurs inviteurs ou écarts incomplets).
+        """
+        old_invites = self.invites_cache.get(guild.id, {})
+        new_invites = await self._update_invite_cache(guild)
+        if new_invites is None:
+            return False
+
+        # Utilisations supplémentaires par inviteur depuis le dernier relevé, dans l'ordre des invitations
+        deltas: Dict[Optional[int], int] = {}
+        for code, (uses, inviter_id, _) in new_invites.items():
+            previous_uses = old_invites[code][0] if code in old_invites else 0
+            if uses > previous_uses:
+                deltas[inviter_id] = deltas.get(inviter_id, 0) + uses - previous_uses
+        # Invitations disparues depuis le dernier relevé : supprimées en atteignant leur maximum d'utilisations
+        for code, (uses, inviter_id, max_uses) in old_invites.items():
+            if code not in new_invites and max_uses and max_uses > uses:
+                deltas[inviter_id] = deltas.get(inviter_id, 0) + max_uses - uses
+        total = sum(deltas.values())
+
+        # Arrivées survenues après la fenêtre mais avant le relevé : déjà comptées dans les écarts,
+        # elles sont rattachées à cette rafale au lieu de fausser la suivante.
+        requeue = []
+        while total > len(members) and not self._join_queue.empty():
+            member = self._join_queue.get_nowait()
+            if member.guild.id == guild.id:
+                self.invite_stats["joins"] += 1
+                members.append(member)
+            else:
+                requeue.append(member)
+        for member in requeue:
+            self._join_queue.put_nowait(member)
+
+        # Cas sûr : un seul inviteur explique toutes les arrivées.
+        if len(deltas) == 1 and total == len(members):
+            inviter_id = next(iter(deltas))
+            for member in members:
+                if inviter_id and inviter_id != member.id:
+                    await self._record_referral(member, str(inviter_id))
+            return False
+
+        # Une utilisation par inviteur et autant d'arrivées : appariement dans l'ordre d'arrivée.
+        if total == len(members) and all(count == 1 for count in deltas.values()):
+            self.invite_stats["attributed_by_order"] += len(members)
+            for member, inviter_id in zip(members, deltas):
+                if inviter_id and inviter_id != member.id:
+                    await self._record_referral(member, str(inviter_id))
+            return True
+
+        self.invite_stats["unattributed"] += len(members)
+        print(
+            f"Parrainage non attribué pour {len(members)} arrivée(s) ({', '.join(m.name for m in members)}) : "
+            f"utilisations par inviteur {deltas or 'aucune (lien personnalisé ?)'}"
+        )
+        return True
+
+    async def _record_referral(self, member: discord.Member, inviter_id_str: str):
+        user_id_str = str(member.id)
+        self.initialize_user_data(inviter_id_str)
+        self.user_data[user_id_str]["referrer"] = inviter_id_str
+        self.referees.setdefault(inviter_id_str, set()).add(user_id_str)
+        
+        await self.add_transaction(
+            inviter_id_str,
+            "referral_count", 1, f"Parrainage de {member.name}"
+        )
+
+        self.invite_stats["attributed"] += 1
+        print(f"{member.name} a été invité par {inviter_id_str}")
+        self.mark_dirty(self.USER_DATA_FILE, user_id_str, inviter_id_str)
 
     def initialize_user_data(self, user_id: str):
         if user_id not in self.user_data:
@@ -550,7 +2583,10 @@ class ManagerCog(commands.Cog):
                 "current_prestige_challenge": None,
                 "join_timestamp": datetime.now(timezone.utc).timestamp(),
                 "weekly_affiliate_earnings": 0.0,
+                "weekly_epoch": week_epoch(),
+                "last_week": None,
                 "affiliate_booster": 0.0,
+                "affiliate_booster_epoch": None,
                 "loyalty_commission_bonus": 0.0,
                 "loyalty_xp_bonus": 0.0,
                 "vip_premium": None,
@@ -562,33 +2598,63 @@ class ManagerCog(commands.Cog):
                 "current_daily_mission": None,
                 "current_weekly_mission": None
             }
+            for field, index in self.rankings.items():
+                index.update(user_id, self.user_data[user_id][field])
             print(f"Nouvel utilisateur initialisé : {user_id}")
     
     async def add_transaction(self, user_id: str, type: str, amount: float, description: str):
         """Ajoute une transaction à l'historique de l'utilisateur et met à jour son solde."""
+        timestamp = datetime.now(timezone.utc).isoformat()
+        seq = self.journal.append(user_id, type, amount, description, timestamp) if self.journal else None
+        self._apply_transaction(user_id, type, amount, description, timestamp, seq)
+        self.mark_dirty(self.USER_DATA_FILE, user_id)
+        # Un utilisateur encore jamais vérifié aura une vérification complète : inutile de suivre ses compteurs.
+        if type in self.achievement_index.trigger_types and self.achievement_index.is_checked(user_id):
+            self._touched_counters.setdefault(user_id, set()).add(type)
+
+        if self.journal:
+            snapshot_every = self.config.get("PERSISTENCE_CONFIG", {}).get("JOURNAL", {}).get("SNAPSHOT_EVERY_EVENTS", 5000)
+            if self.journal.events_since_compaction >= snapshot_every:
+                self._flush_event.set()
+
+    def _apply_transaction(self, user_id: str, type: str, amount: float, description: str, timestamp: str, seq: Optional[int] = None):
+        """Applique une transaction en mémoire (utilisé en direct et lors du rejeu du journal)."""
         self.initialize_user_data(user_id)
         user_data = self.user_data[user_id]
-        
-        if type in user_data:
-            user_data[type] += amount
-        else:
-             user_data[type] = amount
+
+        counted = True
+        if type in self.WEEKLY_FIELDS:
+            epoch = week_epoch(datetime.fromisoformat(timestamp).timestamp())
+            self._advance_ranking_week(epoch)
+            self._roll_weekly(user_data, epoch)
+            # Rejeu d'un événement d'une semaine déjà close pour cet utilisateur : seul l'historique le garde
+            counted = user_data["weekly_epoch"] == epoch
+
+        if counted:
+            user_data[type] = user_data.get(type, 0) + amount
+        if type in self.rankings and (type not in self.WEEKLY_FIELDS or user_data.get("weekly_epoch") == self._ranking_week):
+            self.rankings[type].update(user_id, user_data[type])
         
         if "transaction_log" not in user_data:
             user_data["transaction_log"] = []
             
         log_entry = {
-            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "timestamp": timestamp,
             "type": type,
             "amount": amount,
             "description": description
         }
         user_data["transaction_log"].append(log_entry)
+        if type == "level":
+            self.boost_resolver.invalidate(user_id)
         
         # Garder le log à une taille raisonnable
         max_log_size = self.config.get("TRANSACTION_LOG_CONFIG", {}).get("MAX_USER_LOG_SIZE", 50)
         if len(user_data["transaction_log"]) > max_log_size:
             user_data["transaction_log"] = user_data["transaction_log"][-max_log_size:]
+
+        if seq is not None:
+            user_data["journal_seq"] = seq
             
     async def grant_xp(self, user: discord.Member, source: any, reason: str):
         user_id_str = str(user.id)
@@ -613,35 +2679,8 @@ class ManagerCog(commands.Cog):
         
         if xp_to_add == 0: return
 
-        # --- Application des boosts d'XP ---
-        total_boost = 1.0
-        
-        # Prestige boost
-        prestige_config = self.config.get("GAMIFICATION_CONFIG", {}).get("PRESTIGE_LEVELS", {})
-        prestige_bonus = 0.0
-        for level_str, data in sorted(prestige_config.items(), key=lambda x: int(x[0]), reverse=True):
-            if user_data['level'] >= int(level_str):
-                prestige_bonus = data.get('xp_bonus', 0.0)
-                break
-        total_boost += prestige_bonus
-        
-        # VIP Premium boost
-        if user_data.get("vip_premium") and user_data.get("vip_premium", {}).get("end_timestamp", 0) > now:
-            vip_system = self.config.get("GAMIFICATION_CONFIG", {}).get("VIP_SYSTEM", {})
-            consecutive_periods = user_data["vip_premium"].get("consecutive_periods", 1)
-            for tier in sorted(vip_system.get("PREMIUM",{}).get("XP_BOOST_TIERS",[]), key=lambda x: x['consecutive_periods'], reverse=True):
-                if consecutive_periods >= tier['consecutive_periods']:
-                    total_boost += tier['boost']
-                    break
-        
-        # Loyalty boost (permanent)
-        total_boost += user_data.get("loyalty_xp_bonus", 0.0)
-
-        # Active Boosters (from shop, cumulative)
-        if user_data.get("active_boosts"):
-            for boost in user_data["active_boosts"]:
-                if boost.get("type") == "xp" and boost.get("expires_at", 0) > now:
-                    total_boost += boost.get("rate", 0.0)
+        # --- Application des boosts d'XP (prestige, VIP, fidélité, boosters) ---
+        total_boost, _ = self.boost_resolver.rates(user_id_str, user_data, now)
         
         final_xp = int(xp_to_add * total_boost)
         
@@ -651,14 +2690,18 @@ class ManagerCog(commands.Cog):
         # Add XP to guild if member of one
         guild_id = user_data.get("guild_id")
         if guild_id and str(guild_id) in self.guild_data:
-            async with self.data_lock:
-                self.guild_data[str(guild_id)]["total_xp"] = self.guild_data[str(guild_id)].get("total_xp", 0) + final_xp
-                self.guild_data[str(guild_id)]["weekly_xp"] = self.guild_data[str(guild_id)].get("weekly_xp", 0) + final_xp
+            # Mise à jour synchrone (aucun await) : pas besoin de verrou.
+            guild_record = self.guild_data[str(guild_id)]
+            guild_record["total_xp"] = guild_record.get("total_xp", 0) + final_xp
+            self.guild_index.update_xp(str(guild_id), guild_record)
+            self._roll_weekly(guild_record, week_epoch(now), ("weekly_xp",))
+            guild_record["weekly_xp"] = guild_record.get("weekly_xp", 0) + final_xp
         
         await self.check_level_up(user)
         await self.check_achievements(user)
-        await self._save_json_data_async(self.USER_DATA_FILE, self.user_data)
-        await self._save_json_data_async(self.GUILD_DATA_FILE, self.guild_data)
+        self.mark_dirty(self.USER_DATA_FILE, user_id_str)
+        if guild_id and str(guild_id) in self.guild_data:
+            self.mark_dirty(self.GUILD_DATA_FILE, str(guild_id))
 
 
     async def check_referral_milestones(self, user: discord.Member):
@@ -681,9 +2724,7 @@ class ManagerCog(commands.Cog):
                 xp_gain = xp_config["XP_BONUS_REFERRAL_HITS_LVL_5"]
                 await self.grant_xp(referrer, xp_gain, f"Filleul {user.display_name} a atteint le niveau 5")
                 user_data["lvl5_milestone_rewarded"] = True
-                try:
-                    await referrer.send(f"🚀 Votre filleul {user.mention} a atteint le niveau 5 rapidement ! Vous gagnez **{xp_gain} XP** bonus !")
-                except discord.Forbidden: pass
+                self.outbound.notify(referrer, OutboundDispatcher.DM, f"🚀 Votre filleul {user.mention} a atteint le niveau 5 rapidement ! Vous gagnez **{xp_gain} XP** bonus !")
 
     async def check_level_up(self, user: discord.Member):
         user_id_str = str(user.id)
@@ -691,15 +2732,8 @@ class ManagerCog(commands.Cog):
 
         if user_data.get("xp_gated", False): return
 
-        xp_config = self.config["GAMIFICATION_CONFIG"]["XP_SYSTEM"]
-        base_xp = xp_config["LEVEL_UP_FORMULA_BASE_XP"]
-        multiplier = xp_config["LEVEL_UP_FORMULA_MULTIPLIER"]
         old_level = user_data["level"]
-        
-        target_level = old_level
-        while user_data["xp"] >= int(base_xp * (multiplier ** (target_level - 1))):
-            target_level += 1
-        target_level -=1 # Go back to the level they actually reached
+        target_level = max(old_level, self.level_curve.level_for_xp(user_data["xp"]))
 
         if target_level == old_level: return
 
@@ -722,8 +2756,7 @@ class ManagerCog(commands.Cog):
                     value=challenge_data['description'] + "\n\nUtilise la commande `/prestige` pour revoir ce défi ou `/soumettre_defi` lorsque tu l'as complété.",
                     inline=False
                 )
-                try: await user.send(embed=dm_embed)
-                except discord.Forbidden: pass
+                self.outbound.notify(user, OutboundDispatcher.DM, embed=dm_embed)
                 hit_gate = True
                 break
         
@@ -737,7 +2770,8 @@ class ManagerCog(commands.Cog):
         channel_name = self.config["CHANNELS"]["LEVEL_UP_ANNOUNCEMENTS"]
         channel = discord.utils.get(user.guild.text_channels, name=channel_name)
         if channel:
-            await channel.send(f"🎉 Bravo {user.mention}, tu as atteint le niveau **{new_level}** !")
+            # Plusieurs montées de niveau rapprochées ne donnent lieu qu'à une annonce (la dernière).
+            self.outbound.notify(channel, OutboundDispatcher.ANNOUNCEMENT, f"🎉 Bravo {user.mention}, tu as atteint le niveau **{new_level}** !", merge_key=("level_up", user.id))
 
         try:
             embed_dm = discord.Embed(
@@ -748,14 +2782,16 @@ class ManagerCog(commands.Cog):
             
             reward_text = "Aucune nouvelle récompense de rôle pour ce niveau."
             level_rewards = self.config.get("GAMIFICATION_CONFIG", {}).get("LEVEL_REWARDS", {})
+            reward_roles = []
             for level_str, reward_data in level_rewards.items():
                 if old_level < int(level_str) <= new_level:
                     if reward_data.get("type") == "role":
                         role_name = reward_data.get("value")
                         reward_text = f"Tu as obtenu le rôle **{role_name}** !"
-                        role_to_add = discord.utils.get(user.guild.roles, name=role_name)
-                        if role_to_add and role_to_add not in user.roles:
-                            await user.add_roles(role_to_add, reason=f"Récompense de niveau {new_level}")
+                        reward_roles.append(discord.utils.get(user.guild.roles, name=role_name))
+            # Plusieurs paliers franchis d'un coup : un seul appel pour tous les rôles.
+            if any(reward_roles):
+                self.role_sync.request(user, add=reward_roles, reason=f"Récompense de niveau {new_level}")
             embed_dm.add_field(name="🎁 Récompense de Rôle", value=reward_text, inline=False)
             
             next_aff_tier = next((t for t in sorted(self.config["GAMIFICATION_CONFIG"]["AFFILIATE_SYSTEM"]["COMMISSION_TIERS"], key=lambda x: x['level']) if new_level < t['level']), None)
@@ -766,24 +2802,28 @@ class ManagerCog(commands.Cog):
 
             embed_dm.add_field(name="🚀 Prochains Objectifs", value=motivation_text, inline=False)
             
-            await user.send(embed=embed_dm)
+            self.outbound.notify(user, OutboundDispatcher.DM, embed=embed_dm, merge_key="level_up")
         except (discord.Forbidden, Exception) as e:
             print(f"Erreur lors de l'envoi du DM de level up: {e}")
 
         await self.check_achievements(user)
-        await self._save_json_data_async(self.USER_DATA_FILE, self.user_data)
+        self.mark_dirty(self.USER_DATA_FILE, user_id_str)
 
 
     async def check_achievements(self, user: discord.Member):
+        """Vérifie tous les compteurs au premier appel pour ce membre, puis seulement ceux modifiés depuis l'appel précédent."""
         user_id_str = str(user.id)
+        if not self.achievement_index.is_checked(user_id_str):
+            self.achievement_index.mark_checked(user_id_str)
+            self._touched_counters.pop(user_id_str, None)
+            touched = set(self.achievement_index.trigger_types)
+        else:
+            touched = self._touched_counters.pop(user_id_str, None)
+        if not touched or user_id_str not in self.user_data: return
         user_stats = self.user_data[user_id_str]
-        for achievement in self.achievements:
-            if achievement["id"] in user_stats.get("achievements", []): continue
-            trigger = achievement["trigger"]
-            trigger_type = trigger["type"]
-            trigger_value = trigger["value"]
-            user_value = user_stats.get(trigger_type, 0)
-            if user_value >= trigger_value:
+        unlocked = user_stats.get("achievements", [])
+        for trigger_type in touched:
+            for achievement in self.achievement_index.reached(user_id_str, trigger_type, user_stats.get(trigger_type, 0), unlocked):
                 await self.grant_achievement(user, achievement)
     
     async def grant_achievement(self, user: discord.Member, achievement: dict):
@@ -799,9 +2839,9 @@ class ManagerCog(commands.Cog):
             embed = discord.Embed(title="🏆 Nouveau Succès Débloqué !", description=f"Félicitations {user.mention} pour avoir débloqué le succès **{achievement['name']}** !", color=discord.Color.gold())
             embed.add_field(name="Description", value=achievement['description'], inline=False)
             embed.add_field(name="Récompense", value=f"{xp_reward} XP", inline=False)
-            await channel.send(embed=embed)
+            self.outbound.notify(channel, OutboundDispatcher.ANNOUNCEMENT, embed=embed)
         print(f"Succès '{achievement['name']}' accordé à {user.name}")
-        await self._save_json_data_async(self.USER_DATA_FILE, self.user_data)
+        self.mark_dirty(self.USER_DATA_FILE, user_id_str)
         
     async def record_purchase(self, user_id: int, product: dict, option: Optional[dict], credit_used: float, guild_id: int) -> tuple[bool, str]:
         user_id_str = str(user_id)
@@ -824,6 +2864,7 @@ class ManagerCog(commands.Cog):
             return True, "Booster activé."
 
 
+        self.ensure_missions(user_id_str, member)
         await self.add_transaction(user_id_str, "purchase_count", 1, f"Achat: {product_display_name}")
         await self.add_transaction(user_id_str, "purchase_total_value", price, f"Achat: {product_display_name}")
         
@@ -855,43 +2896,10 @@ class ManagerCog(commands.Cog):
                 if product.get('margin_type') == 'net' and purchase_cost >= 0:
                     commissionable_amount = max(0, price - purchase_cost)
                 
-                # Commission Rate Calculation
-                affiliate_config = self.config["GAMIFICATION_CONFIG"]["AFFILIATE_SYSTEM"]
+                # Commission Rate Calculation : niveau, booster (hebdo ou boutique, non cumulables),
+                # fidélité et VIP Premium
                 referrer_data = self.user_data[referrer_id_str]
-                referrer_level = referrer_data.get('level', 1)
-                
-                # Base Rate
-                base_rate = 0.0
-                for tier in sorted(affiliate_config["COMMISSION_TIERS"], key=lambda x: x['level'], reverse=True):
-                    if referrer_level >= tier['level']:
-                        base_rate = tier['rate']
-                        break
-                
-                # Get best temporary booster (non-cumulative)
-                best_temp_booster_rate = 0.0
-                weekly_booster = referrer_data.get('affiliate_booster', 0.0)
-                
-                active_shop_boosters = [
-                    b['rate'] for b in referrer_data.get('active_boosts', []) 
-                    if b.get('type') == 'commission' and b.get('expires_at', 0) > datetime.now(timezone.utc).timestamp()
-                ]
-                shop_booster = max(active_shop_boosters) if active_shop_boosters else 0.0
-                
-                best_temp_booster_rate = max(weekly_booster, shop_booster)
-
-                total_rate = base_rate + best_temp_booster_rate
-                
-                # Loyalty Bonus (permanent)
-                total_rate += referrer_data.get('loyalty_commission_bonus', 0.0)
-
-                # VIP Premium Bonus
-                if referrer_data.get("vip_premium") and referrer_data.get("vip_premium", {}).get("end_timestamp", 0) > datetime.now(timezone.utc).timestamp():
-                     vip_system = self.config.get("GAMIFICATION_CONFIG", {}).get("VIP_SYSTEM", {})
-                     consecutive_periods = referrer_data["vip_premium"].get("consecutive_periods", 1)
-                     for tier in sorted(vip_system.get("PREMIUM",{}).get("COMMISSION_BONUS_TIERS",[]), key=lambda x: x['consecutive_periods'], reverse=True):
-                         if consecutive_periods >= tier['consecutive_periods']:
-                             total_rate += tier['bonus']
-                             break
+                _, total_rate = self.boost_resolver.rates(referrer_id_str, referrer_data, datetime.now(timezone.utc).timestamp())
 
                 commission_earned = commissionable_amount * total_rate
                 await self.add_transaction(referrer_id_str, "store_credit", commission_earned, f"Commission sur achat de {member.display_name}")
@@ -906,16 +2914,16 @@ class ManagerCog(commands.Cog):
                     discord.Color.purple()
                 )
 
-                try:
-                    await referrer.send(f"🎉 Bonne nouvelle ! Votre filleul {member.display_name} a fait un achat. Vous avez gagné **{commission_earned:.2f} crédits** (Taux: {total_rate*100:.1f}%)!")
-                except discord.Forbidden: pass
+                self.outbound.notify(referrer, OutboundDispatcher.PURCHASE, f"🎉 Bonne nouvelle ! Votre filleul {member.display_name} a fait un achat. Vous avez gagné **{commission_earned:.2f} crédits** (Taux: {total_rate*100:.1f}%)!")
                 await self.check_achievements(referrer)
                 await self.update_mission_progress(referrer, "affiliate_sale", 1)
                 await self.update_mission_progress(referrer, "affiliate_earn", commission_earned)
 
         
         await self.check_achievements(member)
-        await self._save_json_data_async(self.USER_DATA_FILE, self.user_data)
+        self.mark_dirty(self.USER_DATA_FILE, user_id_str)
+        if referrer_id_str:
+            self.mark_dirty(self.USER_DATA_FILE, referrer_id_str)
         return True, "Achat enregistré avec succès."
     
     async def handle_booster_purchase(self, user: discord.Member, product: dict):
@@ -934,12 +2942,11 @@ class ManagerCog(commands.Cog):
         }
 
         user_data["active_boosts"].append(new_booster)
-        await self._save_json_data_async(self.USER_DATA_FILE, self.user_data)
+        self.expiry.schedule(new_booster["expires_at"], user_id_str, "boost")
+        self.boost_resolver.invalidate(user_id_str)
+        self.mark_dirty(self.USER_DATA_FILE, user_id_str, urgent=True)
         
-        try:
-            await user.send(f"🚀 Booster activé ! Vous bénéficiez de **+{new_booster['rate']*100:.0f}%** de **{new_booster['type']}** jusqu'à <t:{int(expires_at.timestamp())}:F>.")
-        except discord.Forbidden:
-            pass
+        self.outbound.notify(user, OutboundDispatcher.PURCHASE, f"🚀 Booster activé ! Vous bénéficiez de **+{new_booster['rate']*100:.0f}%** de **{new_booster['type']}** jusqu'à <t:{int(expires_at.timestamp())}:F>.")
 
 
     async def handle_subscription_purchase(self, user: discord.Member, product: dict):
@@ -966,28 +2973,36 @@ class ManagerCog(commands.Cog):
         if not sub_key:
             return
 
-        role = discord.utils.get(user.guild.roles, name=role_name)
-        if role:
-            try: await user.add_roles(role, reason=f"Achat abonnement {product['name']}")
-            except discord.Forbidden: print(f"Impossible d'ajouter le role {role_name} à {user.name}")
-        
-        now = datetime.now(timezone.utc)
-        duration = timedelta(days=duration_days)
+        # Même verrou que la tâche d'expiration : la demande de rôle est mise en file sous le verrou, donc
+        # ordonnée par rapport à celle d'une expiration parallèle, mais l'appel Discord est attendu hors verrou.
+        role_update = None
+        async with self.locks.hold(users=[user_id_str]):
+            role = discord.utils.get(user.guild.roles, name=role_name)
+            if role:
+                role_update = self.role_sync.request(user, add=[role], reason=f"Achat abonnement {product['name']}")
         
-        current_sub_data = user_data.get(sub_key)
-        consecutive_periods = 1
+            now = datetime.now(timezone.utc)
+            duration = timedelta(days=duration_days)
         
-        if current_sub_data and current_sub_data.get("end_timestamp", 0) > now.timestamp():
-            end_date = datetime.fromtimestamp(current_sub_data["end_timestamp"], tz=timezone.utc) + duration
-            consecutive_periods = current_sub_data.get("consecutive_periods", 0) + 1
-        else:
-            end_date = now + duration
+            current_sub_data = user_data.get(sub_key)
             consecutive_periods = 1
         
-        user_data[sub_key] = {
-            "end_timestamp": end_date.timestamp(),
-            "consecutive_periods": consecutive_periods
-        }
+            if current_sub_data and current_sub_data.get("end_timestamp", 0) > now.timestamp():
+                end_date = datetime.fromtimestamp(current_sub_data["end_timestamp"], tz=timezone.utc) + duration
+                consecutive_periods = current_sub_data.get("consecutive_periods", 0) + 1
+            else:
+                end_date = now + duration
+                consecutive_periods = 1
+        
+            user_data[sub_key] = {
+                "end_timestamp": end_date.timestamp(),
+                "consecutive_periods": consecutive_periods
+            }
+            self.expiry.schedule(end_date.timestamp(), user_id_str, sub_key)
+            self.boost_resolver.invalidate(user_id_str)
+
+        if role_update:
+            await role_update
         
         # Grant XP to referrer if VIP purchase
         if sub_key == "vip_premium" and user_data.get("referrer"):
@@ -997,10 +3012,9 @@ class ManagerCog(commands.Cog):
             if referrer:
                 xp_bonus = self.config["GAMIFICATION_CONFIG"]["XP_SYSTEM"]["XP_BONUS_REFERRAL_BUYS_VIP"]
                 await self.grant_xp(referrer, xp_bonus, f"Filleul {user.display_name} a acheté le VIP")
-                try: await referrer.send(f"💎 Votre filleul {user.mention} a souscrit au VIP Premium ! Vous gagnez **{xp_bonus} XP** !")
-                except discord.Forbidden: pass
+                self.outbound.notify(referrer, OutboundDispatcher.DM, f"💎 Votre filleul {user.mention} a souscrit au VIP Premium ! Vous gagnez **{xp_bonus} XP** !")
         
-        await self._save_json_data_async(self.USER_DATA_FILE, self.user_data)
+        self.mark_dirty(self.USER_DATA_FILE, user_id_str, urgent=True)
         
     async def handle_cashout_submission(self, interaction: discord.Interaction, amount_str: str, paypal_email: str):
         try: amount = float(amount_str)
@@ -1025,41 +3039,49 @@ class ManagerCog(commands.Cog):
                 break
         if amount < min_threshold: return await interaction.response.send_message(f"Le montant minimum de retrait pour votre niveau est de {min_threshold} crédits.", ephemeral=True)
         
-        if amount > user_data["store_credit"]: return await interaction.response.send_message("Vous n'avez pas assez de crédits.", ephemeral=True)
+        # Verrou par utilisateur : deux demandes simultanées du même membre ne peuvent pas
+        # dépenser deux fois le même solde.
+        async with self.locks.hold(users=[user_id_str]):
+            if amount > user_data["store_credit"]: return await interaction.response.send_message("Vous n'avez pas assez de crédits.", ephemeral=True)
         
-        euros_to_send = amount * cashout_config["CREDIT_TO_EUR_RATE"]
+            euros_to_send = amount * cashout_config["CREDIT_TO_EUR_RATE"]
         
-        await self.add_transaction(user_id_str, "store_credit", -amount, "Demande de retrait")
-        await self._save_json_data_async(self.USER_DATA_FILE, self.user_data)
+            await self.add_transaction(user_id_str, "store_credit", -amount, "Demande de retrait")
+            self.mark_dirty(self.USER_DATA_FILE, user_id_str, urgent=True)
         
-        channel_name = self.config["CHANNELS"]["CASHOUT_REQUESTS"]
-        channel = discord.utils.get(interaction.guild.text_channels, name=channel_name)
-        if not channel: return await interaction.response.send_message("Erreur: Canal de requêtes de retrait non trouvé.", ephemeral=True)
+            channel_name = self.config["CHANNELS"]["CASHOUT_REQUESTS"]
+            channel = discord.utils.get(interaction.guild.text_channels, name=channel_name)
+            if not channel: return await interaction.response.send_message("Erreur: Canal de requêtes de retrait non trouvé.", ephemeral=True)
         
-        embed = discord.Embed(title="Nouvelle Demande de Retrait", color=discord.Color.blue(), timestamp=datetime.now())
-        embed.add_field(name="Membre", value=f"{interaction.user.mention} (`{interaction.user.id}`)", inline=False)
-        embed.add_field(name="Montant (Crédit)", value=f"`{amount:.2f}`", inline=True)
-        embed.add_field(name="Montant (EUR)", value=f"`{euros_to_send:.2f}`", inline=True)
-        embed.add_field(name="Email PayPal", value=f"`{paypal_email}`", inline=False)
+            embed = discord.Embed(title="Nouvelle Demande de Retrait", color=discord.Color.blue(), timestamp=datetime.now())
+            embed.add_field(name="Membre", value=f"{interaction.user.mention} (`{interaction.user.id}`)", inline=False)
+            embed.add_field(name="Montant (Crédit)", value=f"`{amount:.2f}`", inline=True)
+            embed.add_field(name="Montant (EUR)", value=f"`{euros_to_send:.2f}`", inline=True)
+            embed.add_field(name="Email PayPal", value=f"`{paypal_email}`", inline=False)
         
-        msg = await channel.send(embed=embed, view=CashoutRequestView(self))
+            msg = await channel.send(embed=embed, view=CashoutRequestView(self))
 
-        async with self.data_lock:
             self.pending_actions['cashouts'][str(msg.id)] = {
                 "user_id": interaction.user.id,
                 "credit_to_deduct": amount,
                 "euros_to_send": euros_to_send,
                 "paypal_email": paypal_email
             }
-            await self._save_json_data_async(self.PENDING_ACTIONS_FILE, self.pending_actions)
+            self.mark_dirty(self.PENDING_ACTIONS_FILE, ("cashouts", str(msg.id)), urgent=True)
 
         await interaction.response.send_message("Votre demande de retrait a été envoyée au staff pour validation. Le crédit a été déduit de votre compte et sera remboursé si la demande est refusée.", ephemeral=True)
 
     @tasks.loop(hours=24)
     async def mission_assignment_task(self):
-        """Assigns new daily and weekly missions to users."""
+        """
+        Assigne les nouvelles missions quotidiennes et hebdomadaires. Le tirage est fait entièrement en mémoire ;
+        les MP sont ensuite envoyés par `_mission_fanout_worker`, par lots, avec reprise après redémarrage.
+        """
         if not self.config.get("MISSION_SYSTEM", {}).get("ENABLED"):
             return
+        # En mode "lazy", chaque membre reçoit ses missions à sa première activité de la période (`ensure_missions`).
+        if self.config["MISSION_SYSTEM"].get("ASSIGNMENT_MODE", "batch") == "lazy":
+            return
 
         print("Début de la tâche d'assignation des missions...")
         guild = self.bot.get_guild(int(self.config["GUILD_ID"]))
@@ -1069,9 +3091,12 @@ class ManagerCog(commands.Cog):
         mission_config = self.config["MISSION_SYSTEM"]
         daily_templates = [m for m in mission_config.get("TEMPLATES", []) if m["type"] == "daily"]
         weekly_templates = [m for m in mission_config.get("TEMPLATES", []) if m["type"] == "weekly"]
-        is_weekly_reset_day = datetime.now(timezone.utc).weekday() == 0  # Lundi
+        now = datetime.now(timezone.utc)
+        is_weekly_reset_day = now.weekday() == 0  # Lundi
+        day, week = now.date().isoformat(), week_epoch(now.timestamp())
 
-        for user_id_str, user_data in list(self.user_data.items()):
+        recipients = []
+        for user_id_str, user_data in self.user_data.items():
             if not user_data.get("missions_opt_in", False):
                 continue
             
@@ -1081,221 +3106,449 @@ class ManagerCog(commands.Cog):
 
             # Assign Daily Mission
             if daily_templates:
-                template = random.choice(daily_templates)
-                target = random.randint(*template["target_range"])
-                reward = random.randint(*template["reward_xp_range"])
-                user_data["current_daily_mission"] = {
-                    "id": template["id"],
-                    "description": template["description"].format(target=target),
-                    "target": target, "progress": 0, "reward_xp": reward, "completed": False
-                }
+                user_data["current_daily_mission"] = self._roll_mission(daily_templates, random, day)
 
             # Assign Weekly Mission
             if is_weekly_reset_day and weekly_templates:
-                template = random.choice(weekly_templates)
-                target = random.randint(*template["target_range"])
-                reward = random.randint(*template["reward_xp_range"])
-                user_data["current_weekly_mission"] = {
-                    "id": template["id"],
-                    "description": template["description"].format(target=target),
-                    "target": target, "progress": 0, "reward_xp": reward, "completed": False
-                }
-            
-            try:
-                embed = discord.Embed(title="📜 Vos Nouvelles Missions", color=discord.Color.purple())
-                if user_data.get("current_daily_mission"):
-                    daily = user_data["current_daily_mission"]
-                    embed.add_field(name="☀️ Mission Quotidienne", value=f"{daily['description']}\n**Récompense :** `{daily['reward_xp']}` XP", inline=False)
-                if user_data.get("current_weekly_mission"):
-                    weekly = user_data["current_weekly_mission"]
-                    embed.add_field(name="📅 Mission Hebdomadaire", value=f"{weekly['description']}\n**Récompense :** `{weekly['reward_xp']}` XP", inline=False)
-                
-                embed.set_footer(text="Utilisez /missions pour voir votre progression ou désactiver ces messages.")
-                await member.send(embed=embed)
-            except (discord.Forbidden, discord.HTTPException):
-                print(f"Impossible d'envoyer les missions en DM à {member.display_name}")
-
-        await self._save_json_data_async(self.USER_DATA_FILE, self.user_data)
+                user_data["current_weekly_mission"] = self._roll_mission(weekly_templates, random, week)
+            self.mission_index.reindex(user_id_str, user_data)
+            if user_data.get("current_daily_mission") or user_data.get("current_weekly_mission"):
+                recipients.append(user_id_str)
+
+        if recipients:
+            self.mark_dirty(self.USER_DATA_FILE, *recipients)
+        print(f"Missions assignées à {len(recipients)} membre(s).")
+
+        # Un envoi précédent encore en cours est remplacé : ses missions sont désormais obsolètes.
+        if self._mission_fanout_task and not self._mission_fanout_task.done():
+            self._mission_fanout_task.cancel()
+        self.bot_state["mission_fanout"] = {
+            "started_at": datetime.now(timezone.utc).isoformat(), "finished_at": None,
+            "recipients": recipients, "cursor": 0,
+            "sent": 0, "failed": 0, "forbidden": 0, "skipped": 0, "rate_per_s": 0.0
+        }
+        self.mark_dirty(self.BOT_STATE_FILE, "mission_fanout", urgent=True)
+        self._start_mission_fanout()
         print("Tâche d'assignation des missions terminée.")
 
+    @staticmethod
+    def _roll_mission(templates: list, rng: Any, period: Any) -> dict:
+        """Tire une mission parmi `templates` ; `rng` est le module `random` ou un `random.Random` initialisé."""
+        template = rng.choice(templates)
+        target = rng.randint(*template["target_range"])
+        reward = rng.randint(*template["reward_xp_range"])
+        return {
+            "id": template["id"],
+            "description": template["description"].format(target=target),
+            "target": target, "progress": 0, "reward_xp": reward, "completed": False, "period": period
+        }
+
+    def ensure_missions(self, user_id_str: str, recipient: Optional[discord.abc.Messageable] = None) -> bool:
+        """
+        Mode "lazy" : assigne les missions de la période (jour, semaine) en cours à la première activité
+        du membre après le changement de période. Le tirage est initialisé par (membre, période) :
+        il est reproductible et ne dépend pas du moment où le membre se manifeste.
+        Les nouvelles missions sont envoyées en MP à `recipient` s'il est fourni.
+        """
+        mission_config = self.config.get("MISSION_SYSTEM", {})
+        if not mission_config.get("ENABLED") or mission_config.get("ASSIGNMENT_MODE", "batch") != "lazy":
+            return False
+        user_data = self.user_data.get(user_id_str)
+        if not user_data or not user_data.get("missions_opt_in", False):
+            return False
+
+        now = datetime.now(timezone.utc)
+        periods = {"current_daily_mission": ("daily", now.date().isoformat()), "current_weekly_mission": ("weekly", week_epoch(now.timestamp()))}
+        assigned = False
+        for slot, (mission_type, period) in periods.items():
+            mission = user_data.get(slot)
+            if mission and mission.get("period") == period:
+                continue
+            templates = [m for m in mission_config.get("TEMPLATES", []) if m["type"] == mission_type]
+            if not templates:
+                continue
+            user_data[slot] = self._roll_mission(templates, random.Random(f"{user_id_str}:{mission_type}:{period}"), period)
+            assigned = True
+        if not assigned:
+            return False
+
+        self.mission_index.reindex(user_id_str, user_data)
+        self.mark_dirty(self.USER_DATA_FILE, user_id_str)
+        if recipient is not None:
+            self.outbound.notify(recipient, OutboundDispatcher.DM, embed=self._build_missions_embed(user_data), merge_key=("missions", user_id_str))
+        return True
+
+    def _build_missions_embed(self, user_data: dict) -> discord.Embed:
+        embed = discord.Embed(title="📜 Vos Nouvelles Missions", color=discord.Color.purple())
+        if user_data.get("current_daily_mission"):
+            daily = user_data["current_daily_mission"]
+            embed.add_field(name="☀️ Mission Quotidienne", value=f"{daily['description']}\n**Récompense :** `{daily['reward_xp']}` XP", inline=False)
+        if user_data.get("current_weekly_mission"):
+            weekly = user_data["current_weekly_mission"]
+            embed.add_field(name="📅 Mission Hebdomadaire", value=f"{weekly['description']}\n**Récompense :** `{weekly['reward_xp']}` XP", inline=False)
+        embed.set_footer(text="Utilisez /missions pour voir votre progression ou désactiver ces messages.")
+        return embed
+
+    def _start_mission_fanout(self):
+        """Lance (ou relance) l'envoi des missions en MP s'il reste des destinataires."""
+        job = self.bot_state.get("mission_fanout")
+        if not job or job["cursor"] >= len(job["recipients"]):
+            return
+        if self._mission_fanout_task and not self._mission_fanout_task.done():
+            return
+        self._mission_fanout_task = asyncio.create_task(self._mission_fanout_worker(job))
+
+    async def _mission_fanout_worker(self, job: dict):
+        """
+        Envoie les missions en MP par lots de `CHUNK_SIZE`, avec au plus `MAX_CONCURRENCY` envois simultanés
+        et un débit limité par un seau à jetons. Le curseur est sauvegardé après chaque lot : après un
+        redémarrage, l'envoi reprend au lot interrompu (qui peut donc être renvoyé une fois).
+        """
+        guild = self.bot.get_guild(int(self.config.get("GUILD_ID", 0)))
+        if not guild:
+            return
+        fanout_config = self.config.get("MISSION_SYSTEM", {}).get("FANOUT", {})
+        chunk_size = fanout_config.get("CHUNK_SIZE", 50)
+        semaphore = asyncio.Semaphore(fanout_config.get("MAX_CONCURRENCY", 5))
+        bucket = TokenBucket(fanout_config.get("RATE_PER_SECOND", 4), fanout_config.get("BURST", 10))
+        loop = asyncio.get_running_loop()
+        start, sent_before = loop.time(), job["sent"]
+
+        async def deliver(user_id_str: str):
+            async with semaphore:
+                member = guild.get_member(int(user_id_str))
+                user_data = self.user_data.get(user_id_str)
+                # Désinscription ou départ du serveur depuis l'assignation
+                if not member or not user_data or not user_data.get("missions_opt_in", False):
+                    job["skipped"] += 1
+                    return
+                await bucket.acquire()
+                try:
+                    await member.send(embed=self._build_missions_embed(user_data))
+                    job["sent"] += 1
+                except discord.Forbidden:
+                    job["forbidden"] += 1
+                except discord.HTTPException as e:
+                    job["failed"] += 1
+                    print(f"Impossible d'envoyer les missions en DM à {member.display_name}: {e}")
+
+        print(f"Envoi des missions : reprise à {job['cursor']}/{len(job['recipients'])}.")
+        while job["cursor"] < len(job["recipients"]):
+            chunk = job["recipients"][job["cursor"]:job["cursor"] + chunk_size]
+            await asyncio.gather(*(deliver(user_id_str) for user_id_str in chunk))
+            job["cursor"] += len(chunk)
+            elapsed = loop.time() - start
+            job["rate_per_s"] = (job["sent"] - sent_before) / elapsed if elapsed > 0 else 0.0
+            self.mark_dirty(self.BOT_STATE_FILE, "mission_fanout")
+
+        job["finished_at"] = datetime.now(timezone.utc).isoformat()
+        self.mark_dirty(self.BOT_STATE_FILE, "mission_fanout")
+        print(
+            f"Envoi des missions terminé : {job['sent']} envoyé(s), {job['forbidden']} MP fermé(s), "
+            f"{job['failed']} échec(s), {job['skipped']} ignoré(s) ({job['rate_per_s']:.1f} MP/s)."
+        )
+
     async def update_mission_progress(self, user: discord.Member, action_id: str, value: float):
         """Met à jour la progression des missions pour un utilisateur."""
         user_id_str = str(user.id)
-        if user_id_str not in self.user_data: return
+        # La plupart des actions ne correspondent à aucune mission en cours : sortie immédiate.
+        if not self.mission_index.has(action_id, user_id_str): return
+        user_data = self.user_data[user_id_str]
 
-        missions_to_check = ["current_daily_mission", "current_weekly_mission"]
-        for mission_key in missions_to_check:
-            mission = self.user_data[user_id_str].get(mission_key)
+        changed = completed = False
+        for mission_key in MissionIndex.SLOTS:
+            mission = user_data.get(mission_key)
             if mission and not mission.get("completed") and mission.get("id") == action_id:
-                mission["progress"] = min(mission["progress"] + value, mission["target"])
+                progress = min(mission["progress"] + value, mission["target"])
+                if progress == mission["progress"]:
+                    continue
+                mission["progress"] = progress
+                changed = True
                 if mission["progress"] >= mission["target"]:
-                    mission["completed"] = True
+                    mission["completed"] = completed = True
                     await self.grant_xp(user, mission["reward_xp"], f"Mission complétée: {mission['description']}")
-                    try:
-                        await user.send(f"🎉 **Mission accomplie !**\n> {mission['description']}\nVous avez gagné **{mission['reward_xp']}** XP !")
-                    except discord.Forbidden: pass
-        await self._save_json_data_async(self.USER_DATA_FILE, self.user_data)
+                    self.outbound.notify(user, OutboundDispatcher.DM, f"🎉 **Mission accomplie !**\n> {mission['description']}\nVous avez gagné **{mission['reward_xp']}** XP !")
+        if completed:
+            self.mission_index.reindex(user_id_str, user_data)
+        if changed:
+            self.mark_dirty(self.USER_DATA_FILE, user_id_str)
 
-    @tasks.loop(hours=1)
-    async def check_expired_boosts_task(self):
-        """Cleans up expired boosters from user data."""
-        now_ts = datetime.now(timezone.utc).timestamp()
-        users_to_update = False
-
-        async with self.data_lock:
-            for user_id, user_data in self.user_data.items():
-                if "active_boosts" in user_data and user_data["active_boosts"]:
-                    active_boosts_before = len(user_data["active_boosts"])
-                    user_data["active_boosts"] = [
-                        b for b in user_data["active_boosts"]
-                        if b.get("expires_at", 0) > now_ts
-                    ]
-                    if len(user_data["active_boosts"]) != active_boosts_before:
-                        users_to_update = True
-        
-        if users_to_update:
-            print("Nettoyage des boosters expirés...")
-            await self._save_json_data_async(self.USER_DATA_FILE, self.user_data)
-            print("Nettoyage terminé.")
+    # --- Expirations (boosters, abonnements) ---
 
-    @tasks.loop(hours=1)
-    async def check_expired_subscriptions_task(self):
-        """Checks for expired subscriptions (VIP Premium, Affiliate Pro) and handles roles."""
-        now_ts = datetime.now(timezone.utc).timestamp()
+    def _build_expiry_schedule(self):
+        """Reconstruit l'échéancier à partir des données utilisateurs (seule source persistée des échéances)."""
+        entries = []
+        for user_id_str, user_data in self.user_data.items():
+            for boost in user_data.get("active_boosts") or []:
+                entries.append((boost.get("expires_at", 0), user_id_str, "boost"))
+            for sub_key in ("vip_premium", "affiliate_pro"):
+                if user_data.get(sub_key):
+                    entries.append((user_data[sub_key].get("end_timestamp", 0), user_id_str, sub_key))
+        self.expiry.rebuild(entries)
+
+    async def _expiry_loop(self):
+        """Dort jusqu'à la prochaine échéance et ne traite que les entrées arrivées à terme."""
+        while True:
+            await self.expiry.wait()
+            now_ts = datetime.now(timezone.utc).timestamp()
+            due: Dict[str, set] = {}
+            for _, user_id_str, kind in self.expiry.pop_due(now_ts):
+                due.setdefault(user_id_str, set()).add(kind)
+            for user_id_str, kinds in due.items():
+                try:
+                    if "boost" in kinds:
+                        self._expire_boosts(user_id_str, now_ts)
+                    if kinds & {"vip_premium", "affiliate_pro"}:
+                        await self._expire_subscriptions(user_id_str, kinds, now_ts)
+                except Exception as e:
+                    print(f"Erreur lors du traitement des expirations de {user_id_str}: {e}")
+                    traceback.print_exc()
+
+    def _expire_boosts(self, user_id_str: str, now_ts: float):
+        """Retire les boosters expirés d'un utilisateur."""
+        user_data = self.user_data.get(user_id_str)
+        if not user_data or not user_data.get("active_boosts"):
+            return
+        active_boosts_before = len(user_data["active_boosts"])
+        user_data["active_boosts"] = [b for b in user_data["active_boosts"] if b.get("expires_at", 0) > now_ts]
+        if len(user_data["active_boosts"]) != active_boosts_before:
+            self.boost_resolver.invalidate(user_id_str)
+            self.mark_dirty(self.USER_DATA_FILE, user_id_str)
+
+    async def _expire_subscriptions(self, user_id_str: str, kinds: set, now_ts: float):
+        """Gère la fin des abonnements (VIP Premium, Parrain Pro) d'un utilisateur et les rôles associés."""
         guild_id_str = self.config.get("GUILD_ID")
         if not guild_id_str or guild_id_str == "VOTRE_VRAI_ID_DE_SERVEUR_ICI": return
-            
         guild = self.bot.get_guild(int(guild_id_str))
-        if not guild: return
+        if not guild or user_id_str not in self.user_data: return
 
-        vip_config = self.config.get("GAMIFICATION_CONFIG", {}).get("VIP_SYSTEM", {}).get("PREMIUM", {})
-        aff_pro_config = self.config.get("GAMIFICATION_CONFIG", {}).get("AFFILIATE_SYSTEM", {}).get("AFFILIATE_PRO_SYSTEM", {})
         roles_config = self.config.get("ROLES", {})
-        
-        vip_premium_role = discord.utils.get(guild.roles, name=roles_config.get("VIP_PREMIUM"))
-        loyalty_bonus_role = discord.utils.get(guild.roles, name=roles_config.get("LOYALTY_BONUS"))
-        affiliate_pro_role = discord.utils.get(guild.roles, name=roles_config.get("AFFILIATE_PRO"))
-
-        users_to_update = {}
-        for user_id_str, user_data in self.user_data.items():
-            if user_data.get("vip_premium") and user_data["vip_premium"].get("end_timestamp", 0) < now_ts:
-                users_to_update[user_id_str] = users_to_update.get(user_id_str, []) + ["vip_premium"]
-            if user_data.get("affiliate_pro") and user_data["affiliate_pro"].get("end_timestamp", 0) < now_ts:
-                users_to_update[user_id_str] = users_to_update.get(user_id_str, []) + ["affiliate_pro"]
-
-        if not users_to_update: return
-        
-        print(f"Détection de {len(users_to_update)} abonnements expirés...")
-        
-        async with self.data_lock:
-            for user_id_str, expired_subs in users_to_update.items():
-                member = guild.get_member(int(user_id_str))
-                
-                if "vip_premium" in expired_subs:
-                    vip_data = self.user_data[user_id_str]["vip_premium"]
-                    consecutive_periods = vip_data.get("consecutive_periods", 1)
-                    final_commission_bonus = 0.0
-                    for tier in sorted(vip_config.get("COMMISSION_BONUS_TIERS", []), key=lambda x: x['consecutive_periods'], reverse=True):
-                        if consecutive_periods >= tier['consecutive_periods']:
-                            final_commission_bonus = tier['bonus']
-                            break
-                    final_xp_boost = 0.0
-                    for tier in sorted(vip_config.get("XP_BOOST_TIERS", []), key=lambda x: x['consecutive_periods'], reverse=True):
-                        if consecutive_periods >= tier['consecutive_periods']:
-                            final_xp_boost = tier['boost']
-                            break
-                    self.user_data[user_id_str]["loyalty_commission_bonus"] = final_commission_bonus / 2
-                    self.user_data[user_id_str]["loyalty_xp_bonus"] = final_xp_boost / 2
-                    self.user_data[user_id_str]["vip_premium"] = None
-                    if member and vip_premium_role and vip_premium_role in member.roles:
-                        await member.remove_roles(vip_premium_role, reason="Abonnement VIP Premium expiré")
-                    if member and loyalty_bonus_role and loyalty_bonus_role not in member.roles:
-                        await member.add_roles(loyalty_bonus_role, reason="Prime de fidélité après abonnement")
-                    print(f"Abonnement VIP Premium expiré et prime de fidélité accordée à {user_id_str}")
-
-                if "affiliate_pro" in expired_subs:
-                    self.user_data[user_id_str]["affiliate_pro"] = None
-                    if member and affiliate_pro_role and affiliate_pro_role in member.roles:
-                        await member.remove_roles(affiliate_pro_role, reason="Abonnement Parrain Pro expiré")
-                    print(f"Abonnement Parrain Pro expiré pour {user_id_str}")
-            
-            await self._save_json_data_async(self.USER_DATA_FILE, self.user_data)
-        
-        print("Mise à jour des abonnements expirés terminée.")
+        async with self.locks.hold(users=[user_id_str]):
+            member = guild.get_member(int(user_id_str))
+            # L'abonnement a pu être renouvelé depuis la planification de l'échéance.
+            current = self.user_data[user_id_str]
+            changed = False
+            roles_to_add, roles_to_remove, reasons = [], [], []
+
+            if "vip_premium" in kinds and current.get("vip_premium") and current["vip_premium"].get("end_timestamp", 0) <= now_ts:
+                vip_premium_role = discord.utils.get(guild.roles, name=roles_config.get("VIP_PREMIUM"))
+                loyalty_bonus_role = discord.utils.get(guild.roles, name=roles_config.get("LOYALTY_BONUS"))
+                consecutive_periods = current["vip_premium"].get("consecutive_periods", 1)
+                final_commission_bonus = self.boost_resolver.vip_commission_bonus(consecutive_periods)
+                final_xp_boost = self.boost_resolver.vip_xp_boost(consecutive_periods)
+                current["loyalty_commission_bonus"] = final_commission_bonus / 2
+                current["loyalty_xp_bonus"] = final_xp_boost / 2
+                current["vip_premium"] = None
+                self.boost_resolver.invalidate(user_id_str)
+                changed = True
+                roles_to_remove.append(vip_premium_role)
+                roles_to_add.append(loyalty_bonus_role)
+                reasons.append("Abonnement VIP Premium expiré")
+                print(f"Abonnement VIP Premium expiré et prime de fidélité accordée à {user_id_str}")
+
+            if "affiliate_pro" in kinds and current.get("affiliate_pro") and current["affiliate_pro"].get("end_timestamp", 0) <= now_ts:
+                affiliate_pro_role = discord.utils.get(guild.roles, name=roles_config.get("AFFILIATE_PRO"))
+                current["affiliate_pro"] = None
+                changed = True
+                roles_to_remove.append(affiliate_pro_role)
+                reasons.append("Abonnement Parrain Pro expiré")
+                print(f"Abonnement Parrain Pro expiré pour {user_id_str}")
+
+            # Les deux abonnements peuvent expirer ensemble : une seule modification des rôles du membre.
+            # Mise en file sous le verrou, attente de l'appel Discord après l'avoir relâché.
+            role_update = None
+            if member and reasons:
+                role_update = self.role_sync.request(member, add=roles_to_add, remove=roles_to_remove, reason=", ".join(reasons))
+
+        if role_update:
+            await role_update
+
+        if changed:
+            self.mark_dirty(self.USER_DATA_FILE, user_id_str)
 
-    @tasks.loop(hours=168)
+    @tasks.loop(hours=1)
     async def weekly_leaderboard_task(self):
+        # Les compteurs hebdomadaires se remettent à zéro d'eux-mêmes au premier accès d'une nouvelle semaine :
+        # la tâche détecte seulement le changement de semaine et récompense la semaine écoulée, une seule fois.
+        epoch = self.current_week()
+        weekly_state = self.bot_state.setdefault("weekly", {})
+        last_rollover = weekly_state.get("last_rollover_epoch")
+        if last_rollover is None:
+            weekly_state["last_rollover_epoch"] = epoch
+            self.mark_dirty(self.BOT_STATE_FILE, "weekly")
+            return
+        if last_rollover >= epoch:
+            return
+
         guild_id = int(self.config.get("GUILD_ID", 0))
         guild = self.bot.get_guild(guild_id)
         if not guild: return
         
-        print("Début de la tâche de classement hebdomadaire...")
-        
-        # --- XP Leaderboard ---
-        xp_leaderboard_data = {uid: data['weekly_xp'] for uid, data in self.user_data.items() if data.get('weekly_xp', 0) > 0}
-        sorted_xp_leaderboard = sorted(xp_leaderboard_data.items(), key=lambda item: item[1], reverse=True)
-        
+        print(f"Début de la tâche de classement hebdomadaire (semaine {epoch - 1})...")
+        loop = asyncio.get_running_loop()
+        timings = {}
+        phase_start = loop.time()
+
+        def end_phase(name: str):
+            nonlocal phase_start
+            now = loop.time()
+            timings[name] = (now - phase_start) * 1000
+            phase_start = now
+
+        # --- Podiums de la semaine écoulée (top-K) ---
+        xp_podium = [(uid, xp) for uid, xp in self.last_week_rankings["weekly_xp"].top(3) if xp > 0]
+
+        aff_config = self.config["GAMIFICATION_CONFIG"]["AFFILIATE_SYSTEM"]
+        boosters_enabled = aff_config.get("WEEKLY_BOOSTERS", {}).get("ENABLED")
+        aff_podium = []
+        if boosters_enabled:
+            aff_podium = [(uid, earnings) for uid, earnings in self.last_week_rankings["weekly_affiliate_earnings"].top(3) if earnings > 0]
+        end_phase("podiums")
+
+        # --- Rôles du top XP : diff minimal entre détenteurs actuels et nouveaux gagnants ---
         roles_config = self.config.get("ROLES", {})
         top_xp_roles_names = {1: "LEADERBOARD_TOP_1_XP", 2: "LEADERBOARD_TOP_2_XP", 3: "LEADERBOARD_TOP_3_XP"}
         top_xp_roles = {rank: discord.utils.get(guild.roles, name=roles_config.get(role_name)) for rank, role_name in top_xp_roles_names.items()}
-        all_top_xp_roles = [r for r in top_xp_roles.values() if r is not None]
 
-        for member in guild.members:
-            if any(role in member.roles for role in all_top_xp_roles):
-                await member.remove_roles(*all_top_xp_roles, reason="Réinitialisation du classement hebdo XP")
+        winners = {}
+        for i, (user_id, xp) in enumerate(xp_podium):
+            member = guild.get_member(int(user_id))
+            if member:
+                winners[i + 1] = member
+
+        to_add: Dict[discord.Member, list] = {}
+        to_remove: Dict[discord.Member, list] = {}
+        for rank, role in top_xp_roles.items():
+            if role is None: continue
+            winner = winners.get(rank)
+            for holder in role.members:
+                if holder != winner:
+                    to_remove.setdefault(holder, []).append(role)
+            if winner and role not in winner.roles:
+                to_add.setdefault(winner, []).append(role)
+
+        # Un ancien gagnant qui change de rang perd et gagne un rôle en un seul appel.
+        changes = {member: (to_add.get(member, []), to_remove.get(member, [])) for member in {*to_add, *to_remove}}
+        await self.role_sync.apply(changes, reason="Classement hebdo XP")
+        end_phase("roles")
+
+        # --- Boosters de la semaine : seuls les gagnants sont modifiés, les anciens boosters expirent avec leur semaine ---
+        boosters = {}
+        if boosters_enabled:
+            weekly_boosters = aff_config["WEEKLY_BOOSTERS"]
+            rank_boosts = {1: weekly_boosters["TOP_1_BOOST"], 2: weekly_boosters["TOP_2_BOOST"], 3: weekly_boosters["TOP_3_BOOST"]}
+            boosters = {user_id: rank_boosts[i + 1] for i, (user_id, _) in enumerate(aff_podium)}
+        for uid, boost in boosters.items():
+            self.user_data[uid]['affiliate_booster'] = boost
+            self.user_data[uid]['affiliate_booster_epoch'] = epoch
+            self.boost_resolver.invalidate(uid)
+        if boosters:
+            self.mark_dirty(self.USER_DATA_FILE, *boosters)
+
+        weekly_state["last_rollover_epoch"] = epoch
+        self.mark_dirty(self.BOT_STATE_FILE, "weekly", urgent=True)
+        end_phase("boosters")
 
-        xp_winners_text = []
-        for i, (user_id, xp) in enumerate(sorted_xp_leaderboard[:3]):
+        # --- Announcements ---
+        xp_winners_text = [
+            f"{'🥇🥈🥉'[rank-1]} **{member.display_name}** avec {int(xp_podium[rank-1][1])} XP"
+            for rank, member in sorted(winners.items())
+        ]
+        aff_winners_text = []
+        for i, (user_id, earnings) in enumerate(aff_podium):
             rank = i + 1
             member = guild.get_member(int(user_id))
             if member:
-                role_to_add = top_xp_roles.get(rank)
-                if role_to_add: await member.add_roles(role_to_add, reason=f"Top {rank} XP hebdo")
-                xp_winners_text.append(f"{'🥇🥈🥉'[rank-1]} **{member.display_name}** avec {int(xp)} XP")
-        
-        # --- Affiliate Leaderboard ---
-        aff_config = self.config["GAMIFICATION_CONFIG"]["AFFILIATE_SYSTEM"]
-        aff_winners_text = []
-        if aff_config.get("WEEKLY_BOOSTERS", {}).get("ENABLED"):
-            aff_leaderboard_data = {uid: data['weekly_affiliate_earnings'] for uid, data in self.user_data.items() if data.get('weekly_affiliate_earnings', 0) > 0}
-            sorted_aff_leaderboard = sorted(aff_leaderboard_data.items(), key=lambda item: item[1], reverse=True)
-            
-            # Reset existing boosters
-            for uid in self.user_data: self.user_data[uid]['affiliate_booster'] = 0.0
+                 aff_winners_text.append(f"{'🥇🥈🥉'[rank-1]} **{member.display_name}** avec {earnings:.2f} crédits (boost de **+{boosters[user_id]*100:.0f}%** pour la semaine)!")
 
-            boosters = {1: aff_config["WEEKLY_BOOSTERS"]["TOP_1_BOOST"], 2: aff_config["WEEKLY_BOOSTERS"]["TOP_2_BOOST"], 3: aff_config["WEEKLY_BOOSTERS"]["TOP_3_BOOST"]}
-            for i, (user_id, earnings) in enumerate(sorted_aff_leaderboard[:3]):
-                rank = i + 1
-                self.user_data[user_id]['affiliate_booster'] = boosters[rank]
-                member = guild.get_member(int(user_id))
-                if member:
-                     aff_winners_text.append(f"{'🥇🥈🥉'[rank-1]} **{member.display_name}** avec {earnings:.2f} crédits (boost de **+{boosters[rank]*100:.0f}%** pour la semaine)!")
-
-        # --- Announcements ---
         channel_name = self.config["CHANNELS"]["WEEKLY_LEADERBOARD_ANNOUNCEMENTS"]
         channel = discord.utils.get(guild.text_channels, name=channel_name)
         if channel:
             embed = discord.Embed(title="🏆 Récompenses Hebdomadaires ! 🏆", description="Félicitations aux champions de la semaine !", color=discord.Color.gold())
             if xp_winners_text: embed.add_field(name="Podium XP", value="\n".join(xp_winners_text), inline=False)
             if aff_winners_text: embed.add_field(name="Podium Affiliation", value="\n".join(aff_winners_text), inline=False)
-            if xp_winners_text or aff_winners_text: await channel.send(embed=embed)
+            if xp_winners_text or aff_winners_text: self.outbound.notify(channel, OutboundDispatcher.ANNOUNCEMENT, embed=embed)
+        end_phase("announcements")
 
-        # --- Reset weekly stats ---
-        for uid in self.user_data:
-            self.user_data[uid]['weekly_xp'] = 0
-            self.user_data[uid]['weekly_affiliate_earnings'] = 0
-        
-        for guild_id in self.guild_data:
-            self.guild_data[guild_id]['weekly_xp'] = 0
-            
-        await self._save_json_data_async(self.USER_DATA_FILE, self.user_data)
-        await self._save_json_data_async(self.GUILD_DATA_FILE, self.guild_data)
-        print("Tâche de classement hebdomadaire terminée.")
+        self.weekly_rollover_report = {
+            "at": datetime.now(timezone.utc).isoformat(), "week": epoch - 1, "timings_ms": timings,
+            "roles_added": sum(len(r) for r in to_add.values()), "roles_removed": sum(len(r) for r in to_remove.values())
+        }
+        print("Tâche de classement hebdomadaire terminée. Durées : " + ", ".join(f"{name} {ms:.1f} ms" for name, ms in timings.items()))
+
+    def _desired_reward_roles(self, guild: discord.Guild) -> Dict[discord.Member, tuple]:
+        """
+        État voulu des rôles de récompense, déduit des données : paliers de niveau et prime de fidélité (ajout seulement,
+        ils peuvent aussi être donnés à la main), abonnements (retrait seulement si l'abonnement enregistré est échu)
+        et top XP hebdo (ajout et retrait).
+        Ne retourne que les membres dont les rôles en cache diffèrent de cet état.
+        """
+        roles_config = self.config.get("ROLES", {})
+        now_ts = datetime.now(timezone.utc).timestamp()
+        level_roles = []
+        for level_str, reward_data in self.config.get("GAMIFICATION_CONFIG", {}).get("LEVEL_REWARDS", {}).items():
+            role = discord.utils.get(guild.roles, name=reward_data.get("value")) if reward_data.get("type") == "role" else None
+            if role:
+                level_roles.append((int(level_str), role))
+        subscription_roles = {
+            key: discord.utils.get(guild.roles, name=roles_config.get(role_key))
+            for key, role_key in (("vip_premium", "VIP_PREMIUM"), ("affiliate_pro", "AFFILIATE_PRO"))
+        }
+        loyalty_bonus_role = discord.utils.get(guild.roles, name=roles_config.get("LOYALTY_BONUS"))
+
+        # Le podium n'est appliqué que si la semaine écoulée a déjà été clôturée par `weekly_leaderboard_task`.
+        top_xp_roles = {}
+        if self.bot_state.get("weekly", {}).get("last_rollover_epoch") == self.current_week():
+            podium = [uid for uid, xp in self.last_week_rankings["weekly_xp"].top(3) if xp > 0]
+            for rank in (1, 2, 3):
+                role = discord.utils.get(guild.roles, name=roles_config.get(f"LEADERBOARD_TOP_{rank}_XP"))
+                if role:
+                    top_xp_roles[role] = podium[rank - 1] if rank <= len(podium) else None
+
+        changes = {}
+        for member in guild.members:
+            if member.bot: continue
+            data = self.user_data.get(str(member.id))
+            held = set(member.roles)
+            add, remove = set(), set()
+            if data:
+                add.update(role for level, role in level_roles if data.get("level", 1) >= level)
+                if loyalty_bonus_role and data.get("loyalty_commission_bonus", 0) > 0:
+                    add.add(loyalty_bonus_role)
+            for key, role in subscription_roles.items():
+                subscription = data.get(key) if data else None
+                # Sans abonnement enregistré, le rôle a pu être donné à la main : on n'y touche pas.
+                if role is None or not subscription: continue
+                (add if subscription.get("end_timestamp", 0) > now_ts else remove).add(role)
+            for role, winner_id in top_xp_roles.items():
+                (add if winner_id == str(member.id) else remove).add(role)
+            add -= held
+            remove &= held
+            if add or remove:
+                changes[member] = (add, remove)
+        return changes
+
+    @tasks.loop(hours=6)
+    async def reward_roles_reconcile_task(self):
+        """Réaligne périodiquement les rôles de récompense de tous les membres sur les données (rôles perdus, erreurs d'API...)."""
+        guild_id_str = self.config.get("GUILD_ID")
+        if not guild_id_str or guild_id_str == "VOTRE_VRAI_ID_DE_SERVEUR_ICI": return
+        guild = self.bot.get_guild(int(guild_id_str))
+        if not guild: return
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        changes = self._desired_reward_roles(guild)
+        edited = await self.role_sync.apply(changes, reason="Resynchronisation des rôles de récompense")
+        self.role_reconcile_report = {
+            "at": datetime.now(timezone.utc).isoformat(), "members": len(guild.members), "out_of_sync": len(changes),
+            "edited": edited, "duration_s": loop.time() - started
+        }
+        print(f"Resynchronisation des rôles : {edited}/{len(changes)} membre(s) corrigé(s) en {self.role_reconcile_report['duration_s']:.1f} s.")
 
     @weekly_leaderboard_task.before_loop
     @mission_assignment_task.before_loop
-    @check_expired_subscriptions_task.before_loop
-    @check_expired_boosts_task.before_loop
+    @reward_roles_reconcile_task.before_loop
     async def before_tasks(self):
         await self.bot.wait_until_ready()
     
@@ -1408,6 +3661,159 @@ class ManagerCog(commands.Cog):
             await interaction.followup.send(f"✅ Synchronisé {len(synced)} commande(s) avec succès.", ephemeral=True)
         except Exception as e:
             await interaction.followup.send(f"❌ Erreur lors de la synchronisation : {e}", ephemeral=True)
+
+    @app_commands.command(name="diagnostic", description="[Admin] Affiche les statistiques internes du bot.")
+    @app_commands.default_permissions(administrator=True)
+    async def diagnostic(self, interaction: discord.Interaction):
+        embed = discord.Embed(title="🩺 Diagnostic du Bot", color=discord.Color.dark_teal())
+
+        stats = self.persistence_stats
+        pending = sum(len(records) for records in self._dirty_records.values()) + len(self._full_dirty)
+        embed.add_field(
+            name="💾 Persistance",
+            value=(
+                f"Moteur : `{self.storage.name}`\n"
+                f"Écritures : `{stats['flushes']}` (échecs : `{stats['failed_flushes']}`)\n"
+                f"Octets écrits : `{stats['bytes_written']:,}`\n"
+                f"Demandes de sauvegarde : `{stats['save_requests']}` (regroupées : `{stats['coalesced_writes']}`)\n"
+                f"Enregistrements en attente : `{pending}`\n"
+                f"Dernier passage : `{stats['last_flush_ms']:.1f} ms`"
+            ),
+            inline=False
+        )
+        if self.journal:
+            journal_stats = self.journal.stats
+            embed.add_field(
+                name="📒 Journal des transactions",
+                value=(
+                    f"Événements : `{journal_stats['appended']}` (`{journal_stats['bytes']:,}` octets)\n"
+                    f"fsync groupés : `{journal_stats['fsyncs']}`\n"
+                    f"Depuis le dernier snapshot : `{self.journal.events_since_compaction}`\n"
+                    f"Compactions : `{journal_stats['compactions']}` | Rejoués au démarrage : `{journal_stats['replayed']}`"
+                ),
+                inline=False
+            )
+        ingestion = self.ingestion_stats
+        queue_depth = self._message_queue.qsize() if self._message_queue else 0
+        average_batch = ingestion['processed'] / ingestion['batches'] if ingestion['batches'] else 0.0
+        embed.add_field(
+            name="💬 Ingestion des messages",
+            value=(
+                f"File : `{queue_depth}` en attente | reçus : `{ingestion['queued']}` | rejetés : `{ingestion['dropped']}`\n"
+                f"Lots : `{ingestion['batches']}` (taille moyenne : `{average_batch:.1f}`, dernier : `{ingestion['last_batch_size']}`)\n"
+                f"Traitement du dernier lot : `{ingestion['last_batch_ms']:.1f} ms` (max : `{ingestion['max_batch_ms']:.1f} ms`)\n"
+                f"Latence de bout en bout : `{ingestion['last_latency_ms']:.0f} ms`"
+            ),
+            inline=False
+        )
+        outbound = self.outbound.stats
+        pending_text = " | ".join(f"{name} : `{count}`" for name, count in zip(OutboundDispatcher.PRIORITY_NAMES, outbound['pending_by_priority']))
+        embed.add_field(
+            name="📤 Envois sortants",
+            value=(
+                f"En attente : `{self.outbound.pending}` ({pending_text})\n"
+                f"Envoyés : `{outbound['sent']}` | fusionnés : `{outbound['merged']}` | rejetés : `{outbound['dropped']}`\n"
+                f"Échecs : `{outbound['failed']}` | MP fermés : `{outbound['forbidden']}` | 429 : `{outbound['rate_limited']}`\n"
+                f"Attente max en file : `{outbound['max_wait_ms']:.0f} ms`"
+            ),
+            inline=False
+        )
+        fanout = self.bot_state.get("mission_fanout")
+        if fanout:
+            status = f"terminé le `{fanout['finished_at'][:16]}`" if fanout.get("finished_at") else "en cours"
+            embed.add_field(
+                name="📜 Envoi des missions",
+                value=(
+                    f"Lancé le `{fanout['started_at'][:16]}`, {status}\n"
+                    f"Progression : `{fanout['cursor']}/{len(fanout['recipients'])}` | débit : `{fanout['rate_per_s']:.1f} MP/s`\n"
+                    f"Envoyés : `{fanout['sent']}` | MP fermés : `{fanout['forbidden']}` | échecs : `{fanout['failed']}` | ignorés : `{fanout['skipped']}`"
+                ),
+                inline=False
+            )
+        report = self.weekly_rollover_report
+        if report:
+            embed.add_field(
+                name="🏆 Dernier classement hebdomadaire",
+                value=(
+                    f"Semaine `{report['week']}`, le `{report['at'][:16]}` : " + " | ".join(f"{name} `{ms:.1f} ms`" for name, ms in report['timings_ms'].items())
+                    + f"\nRôles ajoutés : `{report['roles_added']}` | retirés : `{report['roles_removed']}`"
+                ),
+                inline=False
+            )
+        resolver_stats = self.boost_resolver.stats
+        lookups = resolver_stats['hits'] + resolver_stats['misses']
+        embed.add_field(
+            name="⚡ Cache des bonus",
+            value=(
+                f"Utilisateurs en cache : `{len(self.boost_resolver._cache)}`\n"
+                f"Succès : `{resolver_stats['hits']}` / `{lookups}` ({(resolver_stats['hits'] / lookups * 100) if lookups else 0:.1f}%)\n"
+                f"Invalidations : `{resolver_stats['invalidations']}`"
+            ),
+            inline=False
+        )
+        renderer = self.card_renderer
+        card_stats = renderer.stats
+        card_lookups = card_stats['cache_hits'] + card_stats['cache_misses']
+        embed.add_field(
+            name="🖼️ Rendu des cartes de profil",
+            value=(
+                f"Mode : `{renderer.mode or 'non démarré'}` ({renderer.max_workers} worker(s)) | en cours : `{renderer.pending}/{renderer.max_pending}`\n"
+                f"Rendues : `{card_stats['rendered']}` | saturation (embed) : `{card_stats['overloaded']}` | échecs : `{card_stats['failed']}` | max : `{card_stats['max_ms']:.0f} ms`\n"
+                f"Cache des fonds : `{card_stats['cache_hits']}` / `{card_lookups}` ({(card_stats['cache_hits'] / card_lookups * 100) if card_lookups else 0:.1f}%)"
+            ),
+            inline=False
+        )
+        lock_stats = self.locks.stats
+        holders = self.locks.holders()
+        average_wait = lock_stats['wait_total_ms'] / lock_stats['acquisitions'] if lock_stats['acquisitions'] else 0.0
+        holders_text = "\n".join(
+            f"• `{key[0]}:{key[1]}` par `{task_name}` depuis `{held_ms:.0f} ms` ({waiting} en attente)"
+            for key, task_name, held_ms, waiting in sorted(holders, key=lambda h: h[2], reverse=True)[:5]
+        ) or "Aucun"
+        embed.add_field(
+            name="🔒 Verrous",
+            value=(
+                f"Acquisitions : `{lock_stats['acquisitions']}` (avec attente : `{lock_stats['contended']}`)\n"
+                f"Attente moyenne : `{average_wait:.1f} ms` | max : `{lock_stats['wait_max_ms']:.1f} ms`\n"
+                f"Ordre non respecté : `{lock_stats['order_violations']}`\n"
+                f"Détenteurs actuels ({len(holders)}) :\n{holders_text}"
+            ),
+            inline=False
+        )
+        expiry_stats = self.expiry.stats
+        next_deadline = self.expiry.next_deadline
+        embed.add_field(
+            name="⏳ Expirations",
+            value=(
+                f"Échéances planifiées : `{len(self.expiry)}` | prochaine : "
+                + (f"<t:{int(next_deadline)}:R>" if next_deadline else "`aucune`")
+                + f"\nTraitées : `{expiry_stats['fired']}` | retard max : `{expiry_stats['max_lateness_ms']:.0f} ms`"
+            ),
+            inline=False
+        )
+        invite_stats = self.invite_stats
+        embed.add_field(
+            name="🔗 Suivi des invitations",
+            value=(
+                f"Arrivées : `{invite_stats['joins']}` | attribuées : `{invite_stats['attributed']}` | par ordre d'arrivée : `{invite_stats['attributed_by_order']}` | non attribuées : `{invite_stats['unattributed']}`\n"
+                f"Relevés d'invitations : `{invite_stats['fetches']}` | plus grosse rafale : `{invite_stats['largest_burst']}`\n"
+                f"En attente : `{self._join_queue.qsize()}`"
+            ),
+            inline=False
+        )
+        role_sync_stats = self.role_sync.stats
+        reconcile = self.role_reconcile_report
+        embed.add_field(
+            name="🎭 Synchronisation des rôles",
+            value=(
+                f"Demandes : `{role_sync_stats['requested']}` (fusionnées : `{role_sync_stats['merged']}`) | appels : `{role_sync_stats['edits']}` | sans effet : `{role_sync_stats['unchanged']}`\n"
+                f"Rôles ajoutés : `{role_sync_stats['roles_added']}` | retirés : `{role_sync_stats['roles_removed']}` | 429 : `{role_sync_stats['rate_limited']}` | échecs : `{role_sync_stats['failed']}`\n"
+                f"En attente : `{self.role_sync.pending}`"
+                + (f"\nDernière resynchronisation (`{reconcile['at'][:16]}`) : `{reconcile['edited']}/{reconcile['out_of_sync']}` membre(s) corrigé(s) en `{reconcile['duration_s']:.1f} s`" if reconcile else "")
+            ),
+            inline=False
+        )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
             
     @app_commands.command(name="poster_verification", description="Poste le panneau de vérification dans ce canal.")
     @app_commands.default_permissions(administrator=True)
@@ -1509,6 +3915,9 @@ class ManagerCog(commands.Cog):
         
         try:
             image_file = await self.generate_profile_card(target_user)
+            if image_file is None:
+                # Service de rendu saturé : version texte immédiate plutôt qu'une longue attente.
+                return await self.profil_embed(interaction, membre, followup=True)
             await interaction.followup.send(file=image_file)
         except Exception as e:
             print(f"Erreur lors de la génération de la carte de profil : {e}")
@@ -1617,16 +4026,16 @@ class ManagerCog(commands.Cog):
     async def classement(self, interaction: discord.Interaction, membre: Optional[discord.Member] = None, top: Optional[int] = None):
         await interaction.response.defer()
         
-        sorted_users = sorted(self.user_data.items(), key=lambda item: item[1].get('xp', 0), reverse=True)
+        xp_ranking = self.rankings["xp"]
         
         embed = discord.Embed(title="🏆 Classement d'XP 🏆", color=discord.Color.gold())
 
         if membre:
-            try:
-                rank = next(i for i, (uid, _) in enumerate(sorted_users) if uid == str(membre.id)) + 1
+            rank = xp_ranking.rank(str(membre.id))
+            if rank:
                 user_data = self.user_data[str(membre.id)]
                 embed.description = f"**{membre.display_name}** est au rang **#{rank}** avec **{int(user_data.get('xp', 0))}** XP."
-            except StopIteration:
+            else:
                 embed.description = f"Le membre **{membre.display_name}** n'est pas encore classé."
         else:
             page_size = 10
@@ -1635,22 +4044,21 @@ class ManagerCog(commands.Cog):
                 page = (top - 1) // page_size
             
             start_index = page * page_size
-            end_index = start_index + page_size
             
-            paginated_users = sorted_users[start_index:end_index]
+            paginated_users = xp_ranking.page(start_index, page_size)
             
             if not paginated_users:
                 embed.description = "Aucun utilisateur à afficher pour cette page du classement."
             else:
                 leaderboard_text = ""
-                for i, (uid, data) in enumerate(paginated_users):
+                for i, (uid, xp) in enumerate(paginated_users):
                     rank = start_index + i + 1
                     user = interaction.guild.get_member(int(uid))
                     user_name = user.display_name if user else f"Utilisateur Inconnu ({uid})"
-                    leaderboard_text += f"`#{rank: <3}` **{user_name}** - {int(data.get('xp', 0))} XP\n"
+                    leaderboard_text += f"`#{rank: <3}` **{user_name}** - {int(xp)} XP\n"
                 
                 embed.description = leaderboard_text
-                total_pages = math.ceil(len(sorted_users) / page_size)
+                total_pages = math.ceil(len(xp_ranking) / page_size)
                 embed.set_footer(text=f"Page {page + 1}/{total_pages}")
         
         await interaction.followup.send(embed=embed)
@@ -1659,18 +4067,16 @@ class ManagerCog(commands.Cog):
     async def affiliation(self, interaction: discord.Interaction):
         await interaction.response.defer()
         
-        sorted_users = sorted(self.user_data.items(), key=lambda item: item[1].get('affiliate_earnings', 0), reverse=True)
-        
         embed = discord.Embed(title="🤝 Classement d'Affiliation 🤝", description="Top des membres ayant gagné le plus de crédits grâce à leurs filleuls.", color=discord.Color.green())
         
         leaderboard_text = ""
-        for i, (uid, data) in enumerate(sorted_users[:10]):
-            if data.get('affiliate_earnings', 0) == 0: continue
+        for i, (uid, earnings) in enumerate(self.rankings["affiliate_earnings"].top(10)):
+            if earnings == 0: continue
             rank = i + 1
             user = interaction.guild.get_member(int(uid))
             user_name = user.display_name if user else f"Utilisateur Inconnu ({uid})"
-            referral_count = data.get('referral_count', 0)
-            leaderboard_text += f"`#{rank: <3}` **{user_name}** - {data.get('affiliate_earnings', 0):.2f} crédits ({referral_count} filleuls)\n"
+            referral_count = self.user_data[uid].get('referral_count', 0)
+            leaderboard_text += f"`#{rank: <3}` **{user_name}** - {earnings:.2f} crédits ({referral_count} filleuls)\n"
         
         if not leaderboard_text:
             leaderboard_text = "Personne n'a encore gagné de crédit d'affiliation. Invitez vos amis !"
@@ -1678,6 +4084,42 @@ class ManagerCog(commands.Cog):
         embed.description = leaderboard_text
         await interaction.followup.send(embed=embed)
         
+    @app_commands.command(name="stats_affiliation", description="Statistiques détaillées de vos filleuls (ou de ceux d'un membre, pour le staff).")
+    @app_commands.describe(membre="Le parrain à analyser (réservé aux administrateurs).")
+    async def affiliate_stats(self, interaction: discord.Interaction, membre: Optional[discord.Member] = None):
+        target = membre or interaction.user
+        if target.id != interaction.user.id and not interaction.user.guild_permissions.administrator:
+            return await interaction.response.send_message("Seuls les administrateurs peuvent consulter les statistiques d'un autre membre.", ephemeral=True)
+
+        referrer_id_str = str(target.id)
+        self.initialize_user_data(referrer_id_str)
+        referrer_data = self.user_data[referrer_id_str]
+
+        # Parcours limité aux filleuls du parrain grâce à l'index inverse
+        active_days = self.config.get("GAMIFICATION_CONFIG", {}).get("AFFILIATE_SYSTEM", {}).get("ANALYTICS_ACTIVE_DAYS", 30)
+        active_since = datetime.now(timezone.utc).timestamp() - active_days * 86400
+        referees = self.referees.get(referrer_id_str, set())
+        active = buyers = 0
+        purchase_value = 0.0
+        for referee_id in referees:
+            referee = self.user_data.get(referee_id, {})
+            if referee.get("last_message_timestamp", 0) >= active_since:
+                active += 1
+            if referee.get("purchase_count", 0) > 0:
+                buyers += 1
+                purchase_value += referee.get("purchase_total_value", 0.0)
+
+        count = len(referees)
+        earnings = referrer_data.get("affiliate_earnings", 0.0)
+        embed = discord.Embed(title=f"📈 Statistiques d'affiliation de {target.display_name}", color=discord.Color.green())
+        embed.add_field(name="Filleuls", value=f"`{count}`", inline=True)
+        embed.add_field(name=f"Actifs ({active_days} j)", value=f"`{active}`" + (f" ({active / count * 100:.0f}%)" if count else ""), inline=True)
+        embed.add_field(name="Acheteurs", value=f"`{buyers}`" + (f" ({buyers / count * 100:.0f}%)" if count else ""), inline=True)
+        embed.add_field(name="Achats des filleuls", value=f"`{purchase_value:.2f}€`", inline=True)
+        embed.add_field(name="Commissions gagnées", value=f"`{earnings:.2f}` crédits", inline=True)
+        embed.add_field(name="Gain par filleul", value=f"`{earnings / count:.2f}` crédits" if count else "`-`", inline=True)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
     @app_commands.command(name="acheter_xp", description="Accélérateur: Achetez l'XP manquant pour le prochain niveau.")
     async def buy_xp(self, interaction: discord.Interaction):
         xp_purchase_config = self.config["GAMIFICATION_CONFIG"].get("XP_SYSTEM", {}).get("XP_PURCHASE", {})
@@ -1691,12 +4133,7 @@ class ManagerCog(commands.Cog):
         if user_data.get("xp_gated"):
             return await interaction.response.send_message("Vous ne pouvez pas acheter d'XP tant que vous n'avez pas terminé votre défi de prestige.", ephemeral=True)
         
-        xp_config = self.config["GAMIFICATION_CONFIG"]["XP_SYSTEM"]
-        base_xp = xp_config["LEVEL_UP_FORMULA_BASE_XP"]
-        multiplier = xp_config["LEVEL_UP_FORMULA_MULTIPLIER"]
-        
-        xp_for_next_level = int(base_xp * (multiplier ** (user_data["level"] -1)))
-        xp_needed = xp_for_next_level - user_data["xp"]
+        xp_needed = self.level_curve.xp_to_next(user_data["xp"], user_data["level"])
 
         if xp_needed <= 0:
             return await interaction.response.send_message("Vous avez déjà assez d'XP pour le prochain niveau ! Patientez pour la mise à jour.", ephemeral=True)
@@ -1829,7 +4266,7 @@ class ManagerCog(commands.Cog):
                 if "completed_challenges" not in user_data:
                     user_data["completed_challenges"] = []
                 user_data["completed_challenges"].append(challenge_id)
-                await self._save_json_data_async(self.USER_DATA_FILE, self.user_data)
+                self.mark_dirty(self.USER_DATA_FILE, user_id_str)
             else:
                 embed = discord.Embed(title="❌ Défi Refusé", color=discord.Color.red())
                 embed.description = f"**Raison de l'IA :** {reason}"
@@ -1873,6 +4310,8 @@ class ManagerCog(commands.Cog):
     async def missions(self, interaction: discord.Interaction):
         user_id_str = str(interaction.user.id)
         self.initialize_user_data(user_id_str)
+        # Les missions sont affichées juste en dessous : inutile de les envoyer aussi en MP.
+        self.ensure_missions(user_id_str)
         user_data = self.user_data[user_id_str]
 
         embed = discord.Embed(title="🎯 Vos Missions Actuelles", color=discord.Color.purple())
@@ -1906,11 +4345,20 @@ class ManagerCog(commands.Cog):
 
         await interaction.response.send_message(embed=embed, view=MissionView(self), ephemeral=True)
 
-    async def _update_invite_cache(self, guild: discord.Guild):
+    async def _update_invite_cache(self, guild: discord.Guild) -> Optional[Dict[str, tuple]]:
+        """Relève les invitations du serveur ; seuls les compteurs et l'ID de l'inviteur sont conservés."""
         try:
-            self.invites_cache[guild.id] = {invite.code: invite for invite in await guild.invites()}
-        except discord.Forbidden:
-            print(f"Permissions manquantes pour récupérer les invitations sur la guilde {guild.name}")
+            invites = await guild.invites()
+        except discord.HTTPException as e:
+            print(f"Impossible de récupérer les invitations sur la guilde {guild.name}: {e}")
+            return None
+        self.invite_stats["fetches"] += 1
+        snapshot = {
+            invite.code: (invite.uses or 0, invite.inviter.id if invite.inviter else None, invite.max_uses or 0)
+            for invite in invites
+        }
+        self.invites_cache[guild.id] = snapshot
+        return snapshot
     
     def get_product(self, product_id: str) -> Optional[Dict[str, Any]]:
         return next((p for p in self.products if p.get('id') == product_id), None)
@@ -2019,14 +4467,24 @@ class ManagerCog(commands.Cog):
         if not channel: return
         
         embed = discord.Embed(title=title, description=description, color=color, timestamp=datetime.now(timezone.utc))
-        await channel.send(embed=embed)
+        self.outbound.notify(channel, OutboundDispatcher.ANNOUNCEMENT, embed=embed)
 
     def create_progress_bar(self, current, total, length=10):
         if total == 0: return f"[{'='*length}]"
         progress = int((current / total) * length)
         return f"[{'='*progress}{'-'*(length-progress)}]"
 
-    async def generate_profile_card(self, user: discord.Member) -> discord.File:
+    async def generate_profile_card(self, user: discord.Member) -> Optional[discord.File]:
+        """Génère la carte de profil, ou retourne None si le service de rendu est saturé."""
+        # Place réservée avant tout `await` : une rafale de /profil ne peut pas dépasser la file de rendu.
+        if not self.card_renderer.try_reserve():
+            return None
+        try:
+            return await self._render_profile_card(user)
+        finally:
+            self.card_renderer.release()
+
+    async def _render_profile_card(self, user: discord.Member) -> discord.File:
         user_id_str = str(user.id)
         self.initialize_user_data(user_id_str)
         user_data = self.user_data[user_id_str]
@@ -2048,144 +4506,25 @@ class ManagerCog(commands.Cog):
                 badge_path = tier['path']
                 break
 
-        W, H = 900, 300
-        BG_COLOR = hex_to_rgb(palette['background'])
-        
-        # La surface peut être un dégradé (liste) ou une couleur unie (str)
-        surface_colors = palette['surface']
-        if isinstance(surface_colors, list) and len(surface_colors) > 1:
-            SURFACE_COLOR_1 = hex_to_rgb(surface_colors[0])
-            SURFACE_COLOR_2 = hex_to_rgb(surface_colors[1])
-        else:
-            solid_color = surface_colors[0] if isinstance(surface_colors, list) else surface_colors
-            SURFACE_COLOR_1 = SURFACE_COLOR_2 = hex_to_rgb(solid_color)
-            
-        TEXT_COLOR = hex_to_rgb(palette['text'])
-        ACCENT_COLOR = hex_to_rgb(palette['accent'])
-
-        # --- Création de l'image ---
-        # Image principale avec une couleur de fond pour la bordure
-        img = Image.new('RGB', (W, H), BG_COLOR)
-        
-        # Créer le fond en dégradé
-        surface_gradient = create_gradient(W - 30, H - 30, SURFACE_COLOR_1, SURFACE_COLOR_2)
-        
-        # Créer un masque arrondi pour le fond
-        mask = Image.new('L', (W - 30, H - 30), 0)
-        mask_draw = ImageDraw.Draw(mask)
-        mask_draw.rounded_rectangle((0, 0, W - 30, H - 30), radius=20, fill=255)
-        
-        # Coller le dégradé sur l'image principale en utilisant le masque
-        img.paste(surface_gradient, (15, 15), mask)
-        
-        # Initialiser le dessin sur l'image finale
-        draw = ImageDraw.Draw(img)
-
-        # --- Polices ---
-        try:
-            font_bold = ImageFont.truetype("assets/Inter-Bold.ttf", 40)
-            font_regular = ImageFont.truetype("assets/Inter-Regular.ttf", 22)
-            font_small = ImageFont.truetype("assets/Inter-Regular.ttf", 18)
-        except IOError:
-            print("Police Inter non trouvée, utilisation de la police par défaut.")
-            font_bold = ImageFont.load_default(size=40)
-            font_regular = ImageFont.load_default(size=22)
-            font_small = ImageFont.load_default(size=18)
-
-        # --- Avatar ---
-        avatar_size = 160
-        avatar_pos = (50, (H - avatar_size) // 2)
-        avatar_asset = user.display_avatar.with_size(256)
-        avatar_data = await avatar_asset.read()
-        avatar_img = Image.open(io.BytesIO(avatar_data)).convert("RGBA")
-        
-        # Masque circulaire pour l'avatar
-        avatar_mask = Image.new('L', (avatar_size, avatar_size), 0)
-        draw_mask = ImageDraw.Draw(avatar_mask)
-        draw_mask.ellipse((0, 0, avatar_size, avatar_size), fill=255)
-        
-        avatar_img = avatar_img.resize((avatar_size, avatar_size), Image.Resampling.LANCZOS)
-        
-        # Bordure autour de l'avatar
-        border_size = 8
-        draw.ellipse(
-            (avatar_pos[0] - border_size//2, avatar_pos[1] - border_size//2, 
-             avatar_pos[0] + avatar_size + border_size//2, avatar_pos[1] + avatar_size + border_size//2), 
-            fill=ACCENT_COLOR
-        )
-        img.paste(avatar_img, avatar_pos, avatar_mask)
-
-        # --- Textes ---
-        text_x = 250
-        # Nom de l'utilisateur
-        if level >= config.get("GLOW_EFFECT_LEVEL", 999):
-            glow_color = tuple(min(255, c + 50) for c in ACCENT_COLOR) # Couleur d'accent plus claire
-            for offset in [(-2, -2), (2, -2), (-2, 2), (2, 2)]:
-                draw.text((text_x + offset[0], 50 + offset[1]), user.display_name, font=font_bold, fill=glow_color)
-        draw.text((text_x, 50), user.display_name, font=font_bold, fill=TEXT_COLOR)
-
-        # Niveau
-        draw.text((text_x, 105), f"NIVEAU {level}", font=font_regular, fill=ACCENT_COLOR)
-        
-        # Informations à droite
-        info_x = W - 250
-        rank = "N/A"
-        try:
-            sorted_users = sorted(self.user_data.items(), key=lambda item: item[1].get('xp', 0), reverse=True)
-            user_rank = next(i for i, (uid, _) in enumerate(sorted_users) if uid == user_id_str) + 1
-            rank = f"#{user_rank}"
-        except StopIteration:
-            pass
-
-        draw.text((info_x, 55), "Classement", font=font_small, fill=TEXT_COLOR)
-        draw.text((info_x, 80), rank, font=font_regular, fill=TEXT_COLOR)
-        
-        draw.text((info_x + 120, 55), "Crédits", font=font_small, fill=TEXT_COLOR)
-        draw.text((info_x + 120, 80), f"{user_data.get('store_credit', 0):.2f}", font=font_regular, fill=TEXT_COLOR)
-
-        # --- Barre d'XP ---
-        xp_config = self.config["GAMIFICATION_CONFIG"]["XP_SYSTEM"]
-        base_xp = xp_config["LEVEL_UP_FORMULA_BASE_XP"]
-        multiplier = xp_config["LEVEL_UP_FORMULA_MULTIPLIER"]
-        
-        xp_for_current_level = int(base_xp * (multiplier ** (level - 2))) if level > 1 else 0
-        xp_for_next_level = int(base_xp * (multiplier ** (level-1)))
-        
-        current_xp_in_level = user_data.get('xp', 0) - xp_for_current_level
-        needed_xp_for_level = xp_for_next_level - xp_for_current_level
-        
-        xp_progress = current_xp_in_level / needed_xp_for_level if needed_xp_for_level > 0 else 1
-        xp_progress = max(0, min(1, xp_progress))
-
-        bar_x, bar_y, bar_w, bar_h = text_x, 190, W - text_x - 50, 30
-        
-        bar_bg_color = tuple(int(c * 0.5) for c in ACCENT_COLOR) # Couleur d'accent plus sombre
-        draw.rounded_rectangle((bar_x, bar_y, bar_x + bar_w, bar_y + bar_h), radius=15, fill=bar_bg_color)
-        if xp_progress > 0:
-            draw.rounded_rectangle((bar_x, bar_y, bar_x + (bar_w * xp_progress), bar_y + bar_h), radius=15, fill=ACCENT_COLOR)
-
-        xp_text = f"{int(current_xp_in_level)} / {int(needed_xp_for_level)} XP"
-        text_bbox = draw.textbbox((0,0), xp_text, font=font_small)
-        xp_text_width = text_bbox[2] - text_bbox[0]
-        xp_text_height = text_bbox[3] - text_bbox[1]
-        draw.text((bar_x + (bar_w - xp_text_width) / 2, bar_y + (bar_h - xp_text_height) / 2 - 2), xp_text, font=font_small, fill=TEXT_COLOR)
-
-        # --- Badge ---
-        if badge_path:
-            try:
-                badge_img = Image.open(badge_path).convert("RGBA")
-                badge_size = 80
-                badge_img = badge_img.resize((badge_size, badge_size), Image.Resampling.LANCZOS)
-                badge_pos = (W - badge_size - 40, H - badge_size - 40)
-                img.paste(badge_img, badge_pos, badge_img)
-            except FileNotFoundError:
-                print(f"Fichier de badge introuvable : {badge_path}")
-
-        # --- Sauvegarde en mémoire ---
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        return discord.File(buffer, filename=f"profil_{user.id}.png")
+        current_xp_in_level, needed_xp_for_level = self.level_curve.progress(user_data.get('xp', 0), level)
+        user_rank = self.rankings["xp"].rank(user_id_str)
+        avatar_data = await user.display_avatar.with_size(256).read()
+
+        # Description sérialisable : le rendu Pillow se fait dans le pool de rendu, hors de la boucle asyncio.
+        spec = {
+            "display_name": user.display_name,
+            "level": level,
+            "rank": f"#{user_rank}" if user_rank else "N/A",
+            "store_credit": user_data.get('store_credit', 0),
+            "xp_current": current_xp_in_level,
+            "xp_needed": needed_xp_for_level,
+            "glow": level >= config.get("GLOW_EFFECT_LEVEL", 999),
+            "palette": palette,
+            "badge_path": badge_path,
+            "avatar": avatar_data
+        }
+        png_data = await self.card_renderer.render(spec)
+        return discord.File(io.BytesIO(png_data), filename=f"profil_{user.id}.png")
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(ManagerCog(bot))
@@ -172,7 +172,7 @@ class ModeratorCog(commands.Cog):
         user_id_str = str(member.id)
         self.manager.initialize_user_data(user_id_str)
         self.manager.user_data[user_id_str]["warnings"] = self.manager.user_data[user_id_str].get("warnings", 0) + 1
-        await self.manager._save_json_data_async(self.manager.USER_DATA_FILE, self.manager.user_data)
+        self.manager.mark_dirty(self.manager.USER_DATA_FILE, user_id_str)
         
         warning_count = self.manager.user_data[user_id_str]["warnings"]
         threshold = self.manager.config.get("MODERATION_CONFIG", {}).get("WARNING_THRESHOLD", 3)
@@ -189,7 +189,7 @@ class ModeratorCog(commands.Cog):
                 await member.timeout(timedelta(days=1), reason=f"Seuil d'avertissement ({threshold}) atteint.")
                 await self.notify_staff(member.guild, f"Seuil d'avertissement atteint pour {member.mention}", "L'utilisateur a été mis en silencieux pour 24h.")
                 self.manager.user_data[user_id_str]["warnings"] = 0 # reset warnings after timeout
-                await self.manager._save_json_data_async(self.manager.USER_DATA_FILE, self.manager.user_data)
+                self.manager.mark_dirty(self.manager.USER_DATA_FILE, user_id_str)
             except discord.Forbidden:
                  await self.notify_staff(member.guild, f"ERREUR: Tentative de Mute sur {member.mention} a échoué (permissions).", "Seuil d'avertissement atteint.")
 
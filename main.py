@@ -72,6 +72,21 @@ class ResellBoostBot(commands.Bot):
         
         print("-" * 50)
 
+    async def close(self):
+        """
+        Force l'écriture des données en attente avant l'arrêt du bot.
+        """
+        manager = self.get_cog('ManagerCog')
+        if manager:
+            # Laisse quelques secondes aux notifications en file avant de couper la connexion.
+            await manager.outbound.drain(5)
+            try:
+                await manager.flush_pending_writes()
+                print("✅ Données en attente sauvegardées avant l'arrêt.")
+            except Exception as e:
+                print(f"❌ Erreur lors de la sauvegarde finale des données : {e}")
+        await super().close()
+
 # --- Bloc pour le serveur web (pour Cloud Run) ---
 app = Flask('')
 @app.route('/')